@@ -0,0 +1,153 @@
+"""
+Dashboard Aggregate Cache
+Memory-bounded LRU cache of page-level aggregates keyed by query, normalized
+filters and data version, shared by every session of the dashboard process
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Default memory budget for cached aggregates
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+
+def normalize_filters(date_range=None, event_types=None, cities=None, options=None):
+    """
+    Canonical, hashable form of the sidebar filters
+    Selections covering everything in options (the full date span, all
+    event types, all cities) become None, like an empty filter
+    """
+    options = options or {}
+    
+    dates = None
+    if date_range and len(date_range) == 2:
+        dates = (pd.Timestamp(date_range[0]).date(), pd.Timestamp(date_range[1]).date())
+        if (options.get('min_date') is not None and dates[0] <= options['min_date']
+                and dates[1] >= options['max_date']):
+            dates = None
+    
+    def selection(values, name):
+        if not values:
+            return None
+        values = tuple(sorted(set(values)))
+        if name in options and set(values) >= set(options[name]):
+            return None
+        return values
+    
+    return (dates, selection(event_types, 'event_types'), selection(cities, 'cities'))
+
+def _nbytes(value):
+    """Approximate memory footprint of a cached aggregate"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+def _copy(value):
+    """Callers may modify what they get back; the cached entry stays intact"""
+    return value.copy() if hasattr(value, 'copy') else value
+
+class AggregateCache:
+    """
+    Thread-safe LRU cache bounded by the approximate bytes of its entries
+    Values are computed outside the lock, so a slow query never blocks
+    lookups from other sessions
+    """
+    
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get_or_compute(self, key, compute):
+        """Cached value for key, computing and storing it on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(self._entries[key][0])
+            self.misses += 1
+        
+        value = compute()
+        self.put(key, value)
+        return _copy(value)
+    
+    def put(self, key, value):
+        """Store a value, evicting least recently used entries over budget"""
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+    
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+    
+    def stats(self):
+        """Hit/miss counts, hit rate and memory use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes
+            }
+
+class CachedAnalytics:
+    """
+    LocationAnalytics wrapper whose get_* queries go through an
+    AggregateCache; filter keyword arguments are normalized so equivalent
+    selections share entries
+    """
+    
+    def __init__(self, analytics, cache, options=None):
+        self.analytics = analytics
+        self.cache = cache
+        self.options = options
+        self.data_version = analytics.data_version
+    
+    def key(self, name, *args, date_range=None, event_types=None, cities=None, **kwargs):
+        """Cache key for a query name, its arguments and filters"""
+        filters = normalize_filters(date_range, event_types, cities, self.options)
+        return (self.data_version, name, args, tuple(sorted(kwargs.items())), filters)
+    
+    def cached(self, name, compute, *args, **kwargs):
+        """Cache any filter-dependent computation under name"""
+        return self.cache.get_or_compute(self.key(name, *args, **kwargs),
+                                         lambda: compute(*args, **kwargs))
+    
+    def __getattr__(self, name):
+        attr = getattr(self.analytics, name)
+        if not (name.startswith('get_') and callable(attr)):
+            return attr
+        
+        def query(*args, **kwargs):
+            return self.cached(name, attr, *args, **kwargs)
+        return query
@@ -1,33 +1,24 @@
 """
 Location-Based User Behavior Analysis Dashboard
 Interactive Streamlit app with geospatial analytics and visualizations
+
+Startup stays light: folium, plotly and the map/raster modules are imported
+by the pages that draw with them, and data is opened on first use
 """
-import streamlit as st
-import pandas as pd
-import geopandas as gpd
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
+import time
+SCRIPT_START = time.perf_counter()
+
 import json
 import os
-import sys
 from pathlib import Path
+import streamlit as st
+from aggregate_cache import AggregateCache, CachedAnalytics
+from map_lod import US_CENTER, US_ZOOM, map_layer, snap_bbox
 
-# Set working directory to script location
-script_dir = os.path.dirname(os.path.abspath(__file__))
-os.chdir(script_dir)
-
-# Page config
-st.set_page_config(
-    page_title="Urban Analytics Platform",
-    page_icon="🗺️",
-    layout="wide"
-)
+IMPORT_SECONDS = time.perf_counter() - SCRIPT_START
 
 # Custom CSS with modern effects
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     /* Import Google Fonts */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
@@ -211,37 +202,107 @@ st.markdown("""
         background: linear-gradient(180deg, #f8fafc 0%, #f1f5f9 100%);
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # Initialize DuckDB connection
 @st.cache_resource
 def init_db():
-    """Initialize DuckDB connection"""
+    """
+    Initialize DuckDB connection; all page aggregates are queried from it.
+    Without the prebuilt database the columnar event file is loaded once
+    into a shared, read-only event store, and only as a last resort the CSV
+    is loaded into memory
+    """
+    from queries import LocationAnalytics
+    from event_store import EVENT_PARQUET, EventStore
+    
     if Path('location_analytics.duckdb').exists():
-        con = duckdb.connect('location_analytics.duckdb')
-        return con
-    else:
-        st.error("Database not found. Please run queries.py first.")
-        return None
+        return LocationAnalytics.open('location_analytics.duckdb')
+    if Path(EVENT_PARQUET).exists():
+        return LocationAnalytics.from_store(EventStore.open(EVENT_PARQUET))
+    if Path('location_events.csv').exists():
+        return LocationAnalytics('location_events.csv', ':memory:')
+    return None
+
+@st.cache_resource
+def get_aggregate_cache():
+    """Page aggregate cache shared by all sessions of this server process"""
+    return AggregateCache()
+
+@st.cache_resource
+def start_cache_warmer():
+    """
+    Warm the aggregate cache for common filters in a background thread,
+    once per server process; sessions never wait on it
+    """
+    from cache_warmer import CacheWarmer
+    
+    analytics = init_db()
+    cache = get_aggregate_cache()
+    options = CachedAnalytics(analytics, cache).get_filter_options()
+    rasters = load_density_rasters()
+    return CacheWarmer(
+        analytics, cache, options,
+        # The heatmap as the overview first opens, at the default map zoom
+        computations=[('heatmap_points',
+                       lambda level, bbox, **filters: heatmap_points(analytics, filters, level,
+                                                                     bbox, rasters),
+                       (heatmap_level(US_ZOOM, rasters), None), {})]
+    ).start()
+
+@st.cache_resource
+def startup_timings():
+    """Import and first-render seconds of this server process's first run"""
+    return {}
 
 # Load data functions
-@st.cache_data
-def load_event_data():
-    """Load event data"""
-    if Path('location_events.csv').exists():
-        df = pd.read_csv('location_events.csv')
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        return df
+@st.cache_resource
+def load_hex_choropleth():
+    """
+    Hex layer attributes from the columnar export, shared by all sessions
+    (GeoJSON is only parsed when the Parquet export is missing)
+    """
+    from hex_choropleth import HexChoropleth
+    
+    for path in ('hex_analysis.parquet', 'hex_analysis.geojson'):
+        if Path(path).exists():
+            return HexChoropleth.from_file(path)
     return None
 
-@st.cache_data
-def load_hex_data():
-    """Load hexagon analysis data"""
-    if Path('hex_analysis.geojson').exists():
-        gdf = gpd.read_file('hex_analysis.geojson')
-        return gdf
+@st.cache_resource
+def load_density_rasters():
+    """Open the precomputed KDE density rasters"""
+    from density_raster import DensityRasters
+    
+    if Path('density_rasters/rasters.json').exists():
+        return DensityRasters('density_rasters')
     return None
 
+def heatmap_level(zoom, rasters=None):
+    """Density raster level for a map zoom: the nearest of the levels built"""
+    from density_raster import DEFAULT_ZOOMS
+    
+    zooms = rasters.zooms if rasters is not None else DEFAULT_ZOOMS
+    return min(zooms, key=lambda level: (abs(level - zoom), level))
+
+def heatmap_points(analytics, filters, level, bbox=None, rasters=None):
+    """
+    Heatmap points at a raster level (heatmap_level()) within bbox (the
+    whole level when None): from the precomputed rasters
+    (load_density_rasters()) when they were built from these events and no
+    filter narrows them, otherwise from the filtered events binned in
+    DuckDB and smoothed at the same level
+    """
+    from density_raster import density_from_cells, level_cells, raster_points
+    
+    if rasters is not None and rasters.data_version == analytics.data_fingerprint() \
+            and analytics.get_overview_metrics(**filters)['events'] == rasters.events:
+        return rasters.points(level, bbox=bbox)
+    cells = analytics.get_density_cells(level_cells(level), **filters)
+    density = density_from_cells(cells['ix'].to_numpy(), cells['iy'].to_numpy(), level,
+                                 weights=cells['events'].to_numpy())
+    return raster_points(*density, level, bbox=bbox)
+
 @st.cache_data
 def load_spatial_summary():
     """Load spatial analysis summary"""
@@ -250,35 +311,84 @@ def load_spatial_summary():
             return json.load(f)
     return None
 
+def view_bbox(view):
+    """(min_lon, min_lat, max_lon, max_lat) of the bounds st_folium returned"""
+    bounds = (view or {}).get('bounds') or {}
+    south_west, north_east = bounds.get('_southWest'), bounds.get('_northEast')
+    if not south_west or not north_east:
+        return None
+    return (south_west['lng'], south_west['lat'], north_east['lng'], north_east['lat'])
+
+def lod_feature_group(layer, group=None):
+    """Folium layer for a map_layer(): one GeoJSON layer, no per-feature markers"""
+    import folium
+    
+    if group is None:
+        group = folium.FeatureGroup(name=layer['level'])
+    
+    if layer['level'] == 'cities':
+        folium.GeoJson(
+            layer['features'],
+            marker=folium.CircleMarker(color='#1f77b4', fill=True, fill_color='#1f77b4',
+                                       fill_opacity=0.6, weight=2),
+            style_function=lambda feature: {'radius': feature['properties']['radius']},
+            popup=folium.GeoJsonPopup(fields=['city', 'events', 'users', 'avg_session'],
+                                      aliases=['City', 'Events', 'Users', 'Avg Session (s)']),
+            tooltip=folium.GeoJsonTooltip(fields=['city'], labels=False, permanent=True,
+                                          style="font-weight: bold; color: #1f77b4;")
+        ).add_to(group)
+    elif layer['level'] == 'hexagons':
+        folium.GeoJson(
+            layer['features'],
+            marker=folium.CircleMarker(color='#764ba2', fill=True, fill_color='#667eea',
+                                       fill_opacity=0.5, weight=1),
+            style_function=lambda feature: {'radius': feature['properties']['radius']},
+            tooltip=folium.GeoJsonTooltip(fields=['city', 'event_count', 'unique_users'],
+                                          aliases=['City', 'Events', 'Users'])
+        ).add_to(group)
+    else:
+        folium.GeoJson(
+            layer['features'],
+            marker=folium.CircleMarker(radius=3, color='#1f77b4', fill=True, fill_opacity=0.8,
+                                       weight=1),
+            tooltip=folium.GeoJsonTooltip(fields=['city', 'event_type', 'session_duration'],
+                                          aliases=['City', 'Event', 'Session (s)'])
+        ).add_to(group)
+    
+    return group
+
+# Page render mode: a page's aggregates start together on a shared thread
+# pool (False computes them one after another, as each chart needs them)
+CONCURRENT_QUERIES = True
+
+@st.cache_resource
+def get_query_executor():
+    """Thread pool for page aggregates, shared by all sessions"""
+    from page_queries import chart_executor
+    return chart_executor()
+
+def start_page_queries(analytics, page, filters):
+    """A page's aggregates (page_queries.PAGE_QUERIES), started concurrently"""
+    from page_queries import PageQueries
+    
+    executor = get_query_executor() if CONCURRENT_QUERIES else None
+    return PageQueries(analytics, page, filters, executor)
+
 # Query functions
 def query_db(query):
     """Execute DuckDB query"""
-    con = init_db()
-    if con:
-        return con.execute(query).df()
+    analytics = init_db()
+    if analytics:
+        with analytics.con.cursor() as cur:
+            return cur.execute(query).df()
     return None
 
-def get_filtered_data(df, date_range, event_types, cities):
-    """Filter data based on user selections"""
-    filtered = df.copy()
-    
-    if date_range:
-        filtered = filtered[
-            (filtered['timestamp'].dt.date >= date_range[0]) &
-            (filtered['timestamp'].dt.date <= date_range[1])
-        ]
-    
-    if event_types:
-        filtered = filtered[filtered['event_type'].isin(event_types)]
-    
-    if cities:
-        filtered = filtered[filtered['city'].isin(cities)]
-    
-    return filtered
-
 # Sidebar
-def render_sidebar(df):
-    """Render sidebar with filters"""
+def render_sidebar(options):
+    """
+    Render sidebar with filters; options come from
+    LocationAnalytics.get_filter_options()
+    """
     st.sidebar.markdown("""
         <div style='text-align: center; padding: 1rem 0;'>
             <h1 style='font-size: 2rem; margin: 0;'>🗺️</h1>
@@ -295,8 +405,8 @@ def render_sidebar(df):
     
     # Date range filter
     st.sidebar.subheader("📅 Time Period")
-    min_date = df['timestamp'].min().date()
-    max_date = df['timestamp'].max().date()
+    min_date = options['min_date']
+    max_date = options['max_date']
     
     date_range = st.sidebar.date_input(
         "Select date range",
@@ -309,16 +419,16 @@ def render_sidebar(df):
     st.sidebar.subheader("📱 Event Types")
     event_types = st.sidebar.multiselect(
         "Select event types",
-        options=df['event_type'].unique().tolist(),
-        default=df['event_type'].unique().tolist()
+        options=options['event_types'],
+        default=options['event_types']
     )
     
     # City filter
     st.sidebar.subheader("🏙️ Cities")
     cities = st.sidebar.multiselect(
         "Select cities",
-        options=sorted(df['city'].unique().tolist()),
-        default=df['city'].unique().tolist()
+        options=options['cities'],
+        default=options['cities']
     )
     
     st.sidebar.markdown("---")
@@ -336,7 +446,7 @@ def render_sidebar(df):
             </p>
             <p style='margin: 0; color: #64748b; font-size: 0.85rem;'>Total Events Analyzed</p>
         </div>
-    """.format(total_events=len(df)), unsafe_allow_html=True)
+    """.format(total_events=options['total_events']), unsafe_allow_html=True)
     
     st.sidebar.info(
         "**About This Platform**: Advanced geospatial analytics system analyzing "
@@ -363,12 +473,30 @@ def render_sidebar(df):
     return date_range, event_types, cities
 
 # PAGE 1: Overview Map
-def page_overview_map(df, hex_gdf):
+def page_overview_map(analytics, filters):
     """Interactive map with heatmap and city markers"""
+    import folium
+    from folium.plugins import HeatMap
+    from streamlit_folium import st_folium
+    
     st.markdown('<p class="main-header">📍 Geographic Overview</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">Interactive heatmap showing event density and user distribution</p>', 
                 unsafe_allow_html=True)
     
+    # Level of detail follows the view the map last reported back
+    view = st.session_state.get('overview_map') or {}
+    zoom = view.get('zoom') or US_ZOOM
+    bbox = view_bbox(view)
+    
+    # Heatmap points, at the raster level of the map zoom and within the
+    # view, are computed alongside the page's aggregates
+    rasters = load_density_rasters()
+    queries = start_page_queries(analytics, 'overview', filters)
+    queries.submit('heatmap', analytics.cached, 'heatmap_points',
+                   lambda level, bbox, **f: heatmap_points(analytics, f, level, bbox, rasters),
+                   heatmap_level(zoom, rasters), snap_bbox(bbox, zoom) if bbox else None, **filters)
+    metrics = queries['metrics']
+    
     # Metrics row with enhanced styling
     col1, col2, col3, col4 = st.columns(4)
     
@@ -380,7 +508,7 @@ def page_overview_map(df, hex_gdf):
                            background: linear-gradient(135deg, #667eea, #764ba2);
                            -webkit-background-clip: text;
                            -webkit-text-fill-color: transparent;">
-                    {len(df):,}
+                    {metrics['events']:,}
                 </h2>
             </div>
         """, unsafe_allow_html=True)
@@ -393,7 +521,7 @@ def page_overview_map(df, hex_gdf):
                            background: linear-gradient(135deg, #667eea, #764ba2);
                            -webkit-background-clip: text;
                            -webkit-text-fill-color: transparent;">
-                    {df['user_id'].nunique():,}
+                    {metrics['users']:,}
                 </h2>
             </div>
         """, unsafe_allow_html=True)
@@ -406,13 +534,13 @@ def page_overview_map(df, hex_gdf):
                            background: linear-gradient(135deg, #667eea, #764ba2);
                            -webkit-background-clip: text;
                            -webkit-text-fill-color: transparent;">
-                    {df['city'].nunique()}
+                    {metrics['cities']}
                 </h2>
             </div>
         """, unsafe_allow_html=True)
     
     with col4:
-        avg_duration = df['session_duration'].mean()
+        avg_duration = metrics['avg_session']
         st.markdown(f"""
             <div class="metric-card">
                 <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Avg Session</p>
@@ -427,94 +555,69 @@ def page_overview_map(df, hex_gdf):
     
     st.markdown("---")
     
-    # City statistics
-    city_stats = df.groupby('city').agg({
-        'event_id': 'count',
-        'user_id': 'nunique',
-        'session_duration': 'mean'
-    }).reset_index()
-    city_stats.columns = ['city', 'events', 'users', 'avg_session']
-    
-    # Calculate coordinates for cities
-    city_coords = {
-        'New York': (40.7128, -74.0060),
-        'Los Angeles': (34.0522, -118.2437),
-        'Chicago': (41.8781, -87.6298),
-        'Houston': (29.7604, -95.3698),
-        'Phoenix': (33.4484, -112.0740),
-        'Philadelphia': (39.9526, -75.1652),
-        'San Antonio': (29.4241, -98.4936),
-        'San Diego': (32.7157, -117.1611),
-        'Dallas': (32.7767, -96.7970),
-        'San Jose': (37.3382, -121.8863),
-        'Austin': (30.2672, -97.7431),
-        'Seattle': (47.6062, -122.3321),
-        'Denver': (39.7392, -104.9903),
-        'Boston': (42.3601, -71.0589),
-        'Miami': (25.7617, -80.1918)
-    }
+    # City statistics (positions are each city's mean event location)
+    city_stats = queries['city_stats']
+    hex_layer = load_hex_choropleth()
     
-    city_stats['latitude'] = city_stats['city'].map(lambda x: city_coords[x][0])
-    city_stats['longitude'] = city_stats['city'].map(lambda x: city_coords[x][1])
+    show_hexes = hex_layer is not None and st.checkbox(
+        "Show H3 hexagon choropleth (all events)", value=True
+    )
     
-    # Create map centered on US
+    render_start = time.perf_counter()
+    center = view.get('center') or {'lat': US_CENTER[0], 'lng': US_CENTER[1]}
+    layer = map_layer(analytics, filters, zoom, bbox)
+    
+    # Hex polygons culled to the view at a zoom-appropriate resolution
+    group = folium.FeatureGroup(name='detail')
+    hex_features = {'features': []}
+    if show_hexes:
+        hex_features = hex_layer.features(zoom, snap_bbox(bbox, zoom) if bbox else None)
+        folium.GeoJson(
+            hex_features,
+            style_function=lambda feature: {
+                'fillColor': feature['properties']['fill'],
+                'color': '#bd0026',
+                'weight': 0.5,
+                'fillOpacity': 0.55
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['city', 'event_count', 'avg_session_duration'],
+                                          aliases=['City', 'Events', 'Avg Session (s)'])
+        ).add_to(group)
+    lod_feature_group(layer, group)
+    
+    # Base map with the heatmap layer from KDE density rasters (bounded points)
     m = folium.Map(
-        location=[39.8283, -98.5795],
-        zoom_start=4,
+        location=list(US_CENTER),
+        zoom_start=US_ZOOM,
         tiles='OpenStreetMap'
     )
+    heat_data = queries['heatmap'][['latitude', 'longitude', 'weight']].to_numpy().tolist()
     
-    # Add heatmap layer (sample for performance)
-    heat_data = []
-    sample_size = min(5000, len(df))
-    df_sample = df.sample(n=sample_size, random_state=42)
-    
-    for idx, row in df_sample.iterrows():
-        heat_data.append([row['latitude'], row['longitude']])
-    
-    from folium.plugins import HeatMap
     HeatMap(heat_data, radius=15, blur=20, max_zoom=13).add_to(m)
     
-    # Add city markers
-    for idx, row in city_stats.iterrows():
-        # Create popup with stats
-        popup_html = f"""
-        <div style="font-family: Arial; width: 200px;">
-            <h4 style="margin: 0; color: #1f77b4;">{row['city']}</h4>
-            <hr style="margin: 5px 0;">
-            <p style="margin: 5px 0;"><b>Events:</b> {row['events']:,}</p>
-            <p style="margin: 5px 0;"><b>Users:</b> {row['users']:,}</p>
-            <p style="margin: 5px 0;"><b>Avg Session:</b> {row['avg_session']:.0f}s</p>
-        </div>
-        """
-        
-        # Marker size based on user count
-        radius = 10 + (row['users'] / city_stats['users'].max() * 20)
-        
-        folium.CircleMarker(
-            location=[row['latitude'], row['longitude']],
-            radius=radius,
-            popup=folium.Popup(popup_html, max_width=250),
-            color='#1f77b4',
-            fill=True,
-            fillColor='#1f77b4',
-            fillOpacity=0.6,
-            weight=2
-        ).add_to(m)
-        
-        # Add city label
-        folium.Marker(
-            location=[row['latitude'], row['longitude']],
-            icon=folium.DivIcon(html=f"""
-                <div style="font-size: 12px; font-weight: bold; color: #1f77b4; 
-                            text-shadow: 1px 1px 2px white;">
-                    {row['city']}
-                </div>
-            """)
-        ).add_to(m)
-    
-    # Display map
-    st_folium(m, width=1400, height=600)
+    # Display map; the level-of-detail layer is swapped in without
+    # reloading the base map
+    st_folium(
+        m,
+        center=[center['lat'], center['lng']],
+        zoom=zoom,
+        feature_group_to_add=group,
+        returned_objects=['zoom', 'center', 'bounds'],
+        key='overview_map',
+        width=1400,
+        height=600
+    )
+    
+    render_seconds = time.perf_counter() - render_start
+    payload_kb = sum(len(json.dumps(data)) for data in
+                     (layer['features'], hex_features, heat_data)) / 1024
+    detail = f"{layer['level']} (H3 res {layer['resolution']})" if layer['resolution'] else layer['level']
+    st.caption(
+        f"🗺️ Zoom {zoom}: {detail}, {len(layer['features']['features']):,} features, "
+        f"{len(hex_features['features']):,} choropleth cells · "
+        f"{payload_kb:,.0f} KB map data · layer {layer['build_seconds'] * 1000:.0f} ms, "
+        f"render {render_seconds * 1000:.0f} ms"
+    )
     
     # City comparison table
     st.markdown("### 📊 City Comparison")
@@ -538,17 +641,21 @@ def page_overview_map(df, hex_gdf):
     )
 
 # PAGE 2: Regional Analytics
-def page_regional_analytics(df):
+def page_regional_analytics(analytics, filters):
     """Bar charts, line charts, and regional metrics"""
+    import plotly.express as px
+    
     st.markdown('<p class="main-header">📈 Regional Analytics</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">Deep dive into regional patterns and trends</p>', 
                 unsafe_allow_html=True)
     
+    queries = start_page_queries(analytics, 'regional', filters)
+    city_stats = queries['city_stats']
+    
     # Users by city
     st.markdown("### 👥 Unique Users by City")
     
-    users_by_city = df.groupby('city')['user_id'].nunique().reset_index()
-    users_by_city.columns = ['city', 'unique_users']
+    users_by_city = city_stats[['city', 'users']].rename(columns={'users': 'unique_users'})
     users_by_city = users_by_city.sort_values('unique_users', ascending=False)
     
     fig = px.bar(
@@ -569,8 +676,7 @@ def page_regional_analytics(df):
         # Events by city
         st.markdown("### 📊 Events by City")
         
-        events_by_city = df.groupby('city').size().reset_index()
-        events_by_city.columns = ['city', 'event_count']
+        events_by_city = city_stats[['city', 'events']].rename(columns={'events': 'event_count'})
         events_by_city = events_by_city.sort_values('event_count', ascending=True)
         
         fig = px.bar(
@@ -590,8 +696,9 @@ def page_regional_analytics(df):
         # Avg session duration by city
         st.markdown("### ⏱️ Avg Session Duration by City")
         
-        duration_by_city = df.groupby('city')['session_duration'].mean().reset_index()
-        duration_by_city.columns = ['city', 'avg_duration']
+        duration_by_city = city_stats[['city', 'avg_session']].rename(
+            columns={'avg_session': 'avg_duration'}
+        )
         duration_by_city = duration_by_city.sort_values('avg_duration', ascending=True)
         
         fig = px.bar(
@@ -610,11 +717,7 @@ def page_regional_analytics(df):
     # Engagement trends over time
     st.markdown("### 📅 Engagement Trends Over Time")
     
-    daily_data = df.groupby([df['timestamp'].dt.date, 'city']).agg({
-        'event_id': 'count',
-        'user_id': 'nunique'
-    }).reset_index()
-    daily_data.columns = ['date', 'city', 'events', 'users']
+    daily_data = queries['daily_trends']
     
     fig = px.line(
         daily_data,
@@ -630,12 +733,12 @@ def page_regional_analytics(df):
     # Top locations
     st.markdown("### 📍 Top 10 Most Active Locations")
     
-    top_locations = df.groupby(['city', 'latitude', 'longitude']).size().reset_index()
-    top_locations.columns = ['city', 'latitude', 'longitude', 'event_count']
-    top_locations = top_locations.sort_values('event_count', ascending=False).head(10)
+    # H3 resolution 8 hexes aggregated in DuckDB with the sidebar filters
+    top_locations = queries['top_locations']
+    top_locations = top_locations.rename(columns={'lat': 'latitude', 'lon': 'longitude'})
     
     st.dataframe(
-        top_locations,
+        top_locations[['city', 'latitude', 'longitude', 'event_count']],
         column_config={
             "city": "City",
             "latitude": st.column_config.NumberColumn("Latitude", format="%.4f"),
@@ -647,53 +750,19 @@ def page_regional_analytics(df):
     )
 
 # PAGE 3: Retention Analysis
-def page_retention_analysis(df):
+def page_retention_analysis(analytics, filters):
     """Retention metrics and cohort analysis"""
+    import plotly.express as px
+    
     st.markdown('<p class="main-header">🎯 Retention Analysis</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">User retention patterns across geographic regions</p>', 
                 unsafe_allow_html=True)
     
-    # Calculate retention
-    user_first = df.sort_values('timestamp').groupby('user_id').agg({
-        'timestamp': 'first',
-        'city': 'first'
-    }).reset_index()
-    user_first.columns = ['user_id', 'first_event', 'city']
-    
-    df_with_first = df.merge(user_first, on='user_id')
-    df_with_first['days_since_first'] = (
-        df_with_first['timestamp'] - df_with_first['first_event']
-    ).dt.days
-    
-    retention_data = []
-    
-    for city in df['city'].unique():
-        city_users = df_with_first[df_with_first['city_y'] == city]
-        total_users = city_users['user_id'].nunique()
-        
-        d1_users = city_users[
-            (city_users['days_since_first'] >= 1) & 
-            (city_users['days_since_first'] <= 1)
-        ]['user_id'].nunique()
-        
-        d7_users = city_users[
-            (city_users['days_since_first'] >= 7) & 
-            (city_users['days_since_first'] <= 10)
-        ]['user_id'].nunique()
-        
-        d30_users = city_users[
-            (city_users['days_since_first'] >= 30) & 
-            (city_users['days_since_first'] <= 35)
-        ]['user_id'].nunique()
-        
-        retention_data.append({
-            'city': city,
-            'D1': (d1_users / total_users * 100) if total_users > 0 else 0,
-            'D7': (d7_users / total_users * 100) if total_users > 0 else 0,
-            'D30': (d30_users / total_users * 100) if total_users > 0 else 0
-        })
-    
-    retention_df = pd.DataFrame(retention_data)
+    # Retention by the city of each user's first event, computed in DuckDB
+    queries = start_page_queries(analytics, 'retention', filters)
+    retention_df = queries['retention'].rename(columns={
+        'd1_retention_pct': 'D1', 'd7_retention_pct': 'D7', 'd30_retention_pct': 'D30'
+    })
     
     # Retention metrics
     st.markdown("### 📊 Retention Rates by City")
@@ -736,10 +805,7 @@ def page_retention_analysis(df):
     # Engagement vs Retention scatter
     st.markdown("### 🔍 Engagement vs Retention Analysis")
     
-    engagement_retention = df.groupby('city').agg({
-        'event_id': 'count',
-        'user_id': 'nunique'
-    }).reset_index()
+    engagement_retention = queries['city_stats'][['city', 'events', 'users']]
     engagement_retention.columns = ['city', 'total_events', 'unique_users']
     engagement_retention['events_per_user'] = (
         engagement_retention['total_events'] / engagement_retention['unique_users']
@@ -784,20 +850,23 @@ def page_retention_analysis(df):
     st.markdown(insights_html, unsafe_allow_html=True)
 
 # PAGE 4: Event Distribution
-def page_event_distribution(df):
+def page_event_distribution(analytics, filters):
     """Event types and session patterns"""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.markdown('<p class="main-header">📱 Event Distribution Analysis</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">Understanding user behavior patterns and event types</p>', 
                 unsafe_allow_html=True)
     
+    queries = start_page_queries(analytics, 'events', filters)
     col1, col2 = st.columns(2)
     
     with col1:
         # Event type pie chart
         st.markdown("### 📊 Event Type Distribution")
         
-        event_dist = df['event_type'].value_counts().reset_index()
-        event_dist.columns = ['event_type', 'count']
+        event_dist = queries['event_types']
         
         fig = px.pie(
             event_dist,
@@ -814,8 +883,7 @@ def page_event_distribution(df):
         # Event types by city
         st.markdown("### 🏙️ Event Types by City")
         
-        event_city = df.groupby(['city', 'event_type']).size().reset_index()
-        event_city.columns = ['city', 'event_type', 'count']
+        event_city = queries['event_types_by_city']
         
         fig = px.bar(
             event_city,
@@ -832,23 +900,25 @@ def page_event_distribution(df):
     # Session duration histogram
     st.markdown("### ⏱️ Session Duration Distribution")
     
-    fig = px.histogram(
-        df,
+    # Bins counted in DuckDB; only 50 bars reach the chart
+    duration_hist = queries['session_histogram']
+    duration_hist['session_duration'] = (duration_hist['bin_start'] + duration_hist['bin_end']) / 2
+    
+    fig = px.bar(
+        duration_hist,
         x='session_duration',
-        nbins=50,
+        y='count',
         title='Distribution of Session Durations',
         labels={'session_duration': 'Session Duration (seconds)', 'count': 'Frequency'},
         color_discrete_sequence=['#1f77b4']
     )
-    fig.update_layout(height=400)
+    fig.update_layout(height=400, bargap=0)
     st.plotly_chart(fig, use_container_width=True)
     
     # Hourly patterns
     st.markdown("### 🕐 Events by Hour of Day")
     
-    df['hour'] = df['timestamp'].dt.hour
-    hourly_data = df.groupby('hour').size().reset_index()
-    hourly_data.columns = ['hour', 'event_count']
+    hourly_data = queries['hourly']
     
     fig = px.line(
         hourly_data,
@@ -866,20 +936,7 @@ def page_event_distribution(df):
     # Day of week patterns
     st.markdown("### 📅 Weekly Patterns")
     
-    df['day_of_week'] = df['timestamp'].dt.day_name()
-    day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    weekly_data = df.groupby('day_of_week').agg({
-        'event_id': 'count',
-        'user_id': 'nunique'
-    }).reset_index()
-    weekly_data.columns = ['day_of_week', 'events', 'users']
-    weekly_data['day_of_week'] = pd.Categorical(
-        weekly_data['day_of_week'], 
-        categories=day_order, 
-        ordered=True
-    )
-    weekly_data = weekly_data.sort_values('day_of_week')
+    weekly_data = queries['weekday']
     
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -909,37 +966,52 @@ def page_event_distribution(df):
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Events", f"{len(df):,}")
+        st.metric("Total Events", f"{int(event_dist['count'].sum()):,}")
     
     with col2:
         peak_hour = hourly_data.loc[hourly_data['event_count'].idxmax(), 'hour']
         st.metric("Peak Hour", f"{int(peak_hour)}:00")
     
     with col3:
-        avg_duration = df['session_duration'].mean()
+        avg_duration = queries['metrics']['avg_session']
         st.metric("Avg Session", f"{avg_duration:.0f}s")
     
     with col4:
-        most_common_event = df['event_type'].mode()[0]
+        # Counts are sorted most common first, ties by name (as mode())
+        most_common_event = event_dist['event_type'].iloc[0]
         st.metric("Top Event Type", most_common_event)
 
 # Main app
 def main():
     """Main application"""
     
-    # Load data
-    df = load_event_data()
-    hex_gdf = load_hex_data()
+    # Set working directory to script location
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    
+    st.set_page_config(
+        page_title="Urban Analytics Platform",
+        page_icon="🗺️",
+        layout="wide"
+    )
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    
+    # Pages query aggregates from DuckDB instead of filtering event frames
+    with st.spinner("Opening event data..."):
+        analytics = init_db()
     
-    if df is None:
+    if analytics is None:
         st.error("❌ Data not found. Please run generate_location_data.py first.")
         st.stop()
     
-    # Sidebar
-    date_range, event_types, cities = render_sidebar(df)
+    # Aggregates are cached per query and normalized filters across sessions,
+    # so switching pages or returning to a filter combination does no work
+    cache = get_aggregate_cache()
+    options = CachedAnalytics(analytics, cache).get_filter_options()
+    analytics = CachedAnalytics(analytics, cache, options)
     
-    # Filter data
-    df_filtered = get_filtered_data(df, date_range, event_types, cities)
+    # Sidebar
+    date_range, event_types, cities = render_sidebar(options)
+    filters = {'date_range': date_range, 'event_types': event_types, 'cities': cities}
     
     # Navigation
     st.sidebar.markdown("---")
@@ -957,13 +1029,40 @@ def main():
     
     # Render selected page
     if page == "📍 Overview Map":
-        page_overview_map(df_filtered, hex_gdf)
+        page_overview_map(analytics, filters)
     elif page == "📈 Regional Analytics":
-        page_regional_analytics(df_filtered)
+        page_regional_analytics(analytics, filters)
     elif page == "🎯 Retention Analysis":
-        page_retention_analysis(df_filtered)
+        page_retention_analysis(analytics, filters)
     elif page == "📱 Event Distribution":
-        page_event_distribution(df_filtered)
+        page_event_distribution(analytics, filters)
+    
+    stats = cache.stats()
+    st.sidebar.caption(
+        f"⚡ Aggregate cache: {stats['hit_rate']:.0%} hit rate "
+        f"({stats['hits']:,} hits / {stats['misses']:,} misses), {stats['entries']} entries, "
+        f"{stats['nbytes'] / 1024 ** 2:.1f} of {stats['max_bytes'] / 1024 ** 2:.0f} MB"
+    )
+    
+    # Cold start is the process's first run: module imports plus the first
+    # page, including the heavy imports and data loads it triggers
+    render_seconds = time.perf_counter() - SCRIPT_START
+    timings = startup_timings()
+    if not timings:
+        timings.update(imports=IMPORT_SECONDS, first_render=render_seconds)
+        print(f"🚀 Cold start: imports {IMPORT_SECONDS * 1000:.0f} ms, "
+              f"first render {render_seconds * 1000:.0f} ms")
+    st.session_state['startup_timings'] = dict(timings, render=render_seconds)
+    
+    # Started after the first page has rendered, so it never delays it
+    warmer = start_cache_warmer()
+    progress = warmer.status()
+    if progress['running']:
+        st.sidebar.caption(f"🔥 Warming cache: {progress['done']} of {progress['total']} aggregates")
+    st.sidebar.caption(
+        f"🚀 Cold start: imports {timings['imports'] * 1000:.0f} ms, first render "
+        f"{timings['first_render'] * 1000:.0f} ms · this run {render_seconds * 1000:.0f} ms"
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,370 @@
+"""
+Dashboard Benchmarks
+Times page aggregate computation on synthetic event sets of growing size and
+checks the results against the original pandas page code
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from event_store import EventStore, load_events, write_events_parquet
+from generate_location_data import CITIES, EVENT_TYPES, NUM_EVENTS, NUM_USERS, START_DATE, END_DATE
+from map_lod import map_layer
+from page_queries import PAGE_QUERIES, PageQueries, chart_executor
+from queries import RETENTION_WINDOWS, LocationAnalytics
+
+def synthetic_events(n_events, n_users=None, seed=0, string_ids=False):
+    """
+    Events in the generate_location_data.py schema, generated vectorized
+    Ids are integers and labels categorical so 10M events fit in memory;
+    string_ids gives the object columns of a CSV-loaded frame instead
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(1, n_events * NUM_USERS // NUM_EVENTS)
+    names = list(CITIES)
+    
+    user_city = rng.integers(0, len(names), n_users)
+    user_id = rng.integers(0, n_users, n_events)
+    city = user_city[user_id]
+    
+    lat = np.array([CITIES[c]['lat'] for c in names])[city]
+    lon = np.array([CITIES[c]['lon'] for c in names])[city]
+    offset_km = rng.exponential(1.5, n_events).clip(max=5.0)
+    angle = rng.uniform(0, 2 * np.pi, n_events)
+    
+    span = int((END_DATE - START_DATE).total_seconds())
+    timestamp = pd.Timestamp(START_DATE) + pd.to_timedelta(rng.integers(0, span, n_events), unit='s')
+    
+    events = pd.DataFrame({
+        'event_id': np.arange(n_events),
+        'user_id': user_id,
+        'timestamp': timestamp,
+        'latitude': lat + offset_km / 111.0 * np.cos(angle),
+        'longitude': lon + offset_km / (111.0 * np.cos(np.radians(lat))) * np.sin(angle),
+        'event_type': pd.Categorical.from_codes(
+            rng.choice(len(EVENT_TYPES), n_events, p=list(EVENT_TYPES.values())),
+            list(EVENT_TYPES)
+        ),
+        'session_duration': rng.integers(10, 900, n_events),
+        'city': pd.Categorical.from_codes(city, names)
+    })
+    if string_ids:
+        events['event_id'] = 'evt_' + events['event_id'].astype(str).str.zfill(6)
+        events['user_id'] = 'user_' + events['user_id'].astype(str).str.zfill(5)
+        events = events.astype({'event_type': object, 'city': object})
+    return events
+
+def legacy_retention_page(df):
+    """The retention page's original pandas computation (per-city loop)"""
+    user_first = df.sort_values('timestamp').groupby('user_id').agg({
+        'timestamp': 'first',
+        'city': 'first'
+    }).reset_index()
+    user_first.columns = ['user_id', 'first_event', 'city']
+    
+    df_with_first = df.merge(user_first, on='user_id')
+    df_with_first['days_since_first'] = (
+        df_with_first['timestamp'] - df_with_first['first_event']
+    ).dt.days
+    
+    retention_data = []
+    for city in df['city'].unique():
+        city_users = df_with_first[df_with_first['city_y'] == city]
+        total_users = city_users['user_id'].nunique()
+        row = {'city': city}
+        for name, (lo, hi) in RETENTION_WINDOWS.items():
+            returned = city_users[
+                (city_users['days_since_first'] >= lo) &
+                (city_users['days_since_first'] <= hi)
+            ]['user_id'].nunique()
+            row[f'{name}_retention_pct'] = returned / total_users * 100 if total_users > 0 else 0
+        retention_data.append(row)
+    
+    engagement = df.groupby('city', observed=True).agg({
+        'event_id': 'count',
+        'user_id': 'nunique'
+    }).reset_index()
+    return pd.DataFrame(retention_data), engagement
+
+def duckdb_retention_page(analytics):
+    """The retention page's queries (first-city retention and city stats)"""
+    return analytics.get_city_retention(), analytics.get_city_stats()
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def benchmark_retention(sizes, legacy_max=10_000_000, string_ids=False):
+    """Retention page compute time: original pandas loop vs DuckDB queries"""
+    print(f"\n⏱️  Retention page compute time ({'string' if string_ids else 'integer'} ids)")
+    print(f"  {'events':>12s} {'pandas loop':>12s} {'duckdb':>10s} {'speedup':>8s}  max diff")
+    
+    pct_cols = [f'{name}_retention_pct' for name in RETENTION_WINDOWS]
+    for n_events in sizes:
+        events = synthetic_events(n_events, string_ids=string_ids)
+        analytics = LocationAnalytics.from_dataframe(events, h3_resolutions=())
+        
+        # First run warms DuckDB's catalog; time the second
+        duckdb_retention_page(analytics)
+        (retention, _), duck_time = _timed(duckdb_retention_page, analytics)
+        
+        if n_events <= legacy_max:
+            (legacy, _), legacy_time = _timed(legacy_retention_page, events)
+            legacy['city'] = legacy['city'].astype(str)
+            merged = retention.merge(legacy, on='city', suffixes=('', '_ref'))
+            assert len(merged) == len(retention) == len(legacy)
+            diff = max(np.abs(merged[c] - merged[f'{c}_ref']).max() for c in pct_cols)
+            print(f"  {n_events:>12,} {legacy_time:>11.2f}s {duck_time:>9.2f}s "
+                  f"{legacy_time / duck_time:>7.1f}x  {diff:.1e}")
+        else:
+            print(f"  {n_events:>12,} {'-':>12s} {duck_time:>9.2f}s {'-':>8s}")
+        
+        analytics.con.close()
+        del events, analytics
+
+# (zoom, view bbox) from the national view down to a few Manhattan blocks
+MAP_VIEWS = [
+    (4, None),
+    (7, (-80.0, 36.0, -68.0, 44.0)),
+    (10, (-74.5, 40.5, -73.5, 41.0)),
+    (12, (-74.1, 40.65, -73.85, 40.8)),
+    (14, (-74.02, 40.70, -73.96, 40.73)),
+    (17, (-74.0, 40.712, -73.997, 40.714))
+]
+
+def benchmark_map(sizes):
+    """Overview map layer build time and payload size per level of detail"""
+    for n_events in sizes:
+        analytics = LocationAnalytics.from_dataframe(synthetic_events(n_events))
+        print(f"\n⏱️  Overview map layers ({n_events:,} events)")
+        print(f"  {'zoom':>4s} {'level':>10s} {'res':>4s} {'features':>9s} {'payload':>9s} {'build':>8s}")
+        
+        for zoom, bbox in MAP_VIEWS:
+            layer = map_layer(analytics, {}, zoom, bbox)
+            payload_kb = len(json.dumps(layer['features'])) / 1024
+            print(f"  {zoom:>4d} {layer['level']:>10s} {layer['resolution'] or '-':>4} "
+                  f"{len(layer['features']['features']):>9,} {payload_kb:>7.0f}KB "
+                  f"{layer['build_seconds'] * 1000:>6.0f}ms")
+        
+        analytics.con.close()
+
+# Columns the dashboard pages' aggregates read
+PAGE_COLUMNS = ['user_id', 'timestamp', 'event_type', 'session_duration', 'city']
+
+def legacy_load(csv_path):
+    """The dashboard's original event loading"""
+    df = pd.read_csv(csv_path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def benchmark_load(sizes):
+    """Cold load time and frame memory: CSV vs the columnar event file"""
+    print("\n⏱️  Event loading (CSV vs columnar event file)")
+    print(f"  {'events':>12s} {'loader':>22s} {'load':>8s} {'memory':>9s}")
+    
+    for n_events in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'events.csv')
+            parquet_path = os.path.join(tmp, 'events.parquet')
+            events = synthetic_events(n_events, string_ids=True)
+            events['user_engagement'] = np.where(events['session_duration'] > 300, 'high', 'medium')
+            events.to_csv(csv_path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+            del events
+            write_events_parquet(csv_path, parquet_path, h3_resolutions=())
+            
+            loaders = [
+                ('read_csv', lambda: legacy_load(csv_path)),
+                ('parquet, all columns', lambda: load_events(path=parquet_path)),
+                ('parquet, page columns', lambda: load_events(PAGE_COLUMNS, parquet_path))
+            ]
+            for name, loader in loaders:
+                df, seconds = _timed(loader)
+                memory_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+                print(f"  {n_events:>12,} {name:>22s} {seconds:>7.2f}s {memory_mb:>7.0f}MB")
+                del df
+
+def _page_render(analytics, page, executor=None):
+    """Wait for every aggregate of a page, in page order"""
+    queries = PageQueries(analytics, page, {}, executor)
+    for name in PAGE_QUERIES[page]:
+        queries[name]
+
+def benchmark_pages(sizes, workers=4):
+    """Page aggregate time: sequential vs concurrent on a shared thread pool"""
+    executor = chart_executor(workers)
+    for n_events in sizes:
+        analytics = LocationAnalytics.from_dataframe(synthetic_events(n_events))
+        print(f"\n⏱️  Page aggregates ({n_events:,} events, uncached, {workers} workers, "
+              f"{os.cpu_count()} cores)")
+        print(f"  {'page':>10s} {'slowest':>9s} {'sequential':>11s} {'concurrent':>11s} {'speedup':>8s}")
+        
+        for page, queries in PAGE_QUERIES.items():
+            # Warm DuckDB once, then time each query alone for the slowest
+            _page_render(analytics, page)
+            slowest = max(_timed(getattr(analytics, method), *args, **kwargs)[1]
+                          for method, args, kwargs in queries.values())
+            _, sequential = _timed(_page_render, analytics, page)
+            _, concurrent = _timed(_page_render, analytics, page, executor)
+            print(f"  {page:>10s} {slowest:>8.2f}s {sequential:>10.2f}s {concurrent:>10.2f}s "
+                  f"{sequential / concurrent:>7.1f}x")
+        
+        analytics.con.close()
+    executor.shutdown()
+
+def _rss_bytes():
+    """Resident memory of this process (peak on platforms without /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def legacy_session(events, city):
+    """
+    One session of the original event distribution page: a copy of the
+    cached frame, the filtered frame and its added hour/day columns
+    """
+    df = events.copy()
+    filtered = df[df['city'] == city].copy() if city else df.copy()
+    filtered['hour'] = filtered['timestamp'].dt.hour
+    filtered['day_of_week'] = filtered['timestamp'].dt.day_name()
+    return df, filtered, filtered.groupby('hour').size(), filtered['day_of_week'].value_counts()
+
+def store_session(store, city):
+    """The same page state on the shared store: a view and its counts"""
+    view = store.select(cities=[city] if city else None)
+    return view, view.counts('event_hour'), view.counts('event_weekday')
+
+def _concurrent_sessions(session, data, n_sessions, cities):
+    """Resident memory growth while n_sessions concurrent sessions hold their state"""
+    gc.collect()
+    baseline = _rss_bytes()
+    states = [None] * n_sessions
+    start = threading.Barrier(n_sessions)
+    
+    def run(i):
+        start.wait()
+        states[i] = session(data, cities[i % len(cities)])
+    
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n_sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    growth = _rss_bytes() - baseline
+    states.clear()
+    gc.collect()
+    return growth
+
+def benchmark_sessions(sizes, session_counts=(1, 2, 4, 8)):
+    """Memory growth with concurrent sessions: per-session frames vs shared store"""
+    for n_events in sizes:
+        events = synthetic_events(n_events, string_ids=True)
+        table = pa.Table.from_pandas(events.astype({'user_id': 'category', 'event_type': 'category',
+                                                    'city': 'category'}), preserve_index=False)
+        store = EventStore(table)
+        del table
+        # Half of the sessions look at everything, the rest at one city
+        cities = [None, 'New York', None, 'Chicago']
+        # The store's NumPy column views are built once, on first use
+        store_session(store, 'New York')
+        
+        print(f"\n⏱️  Concurrent session memory ({n_events:,} events; "
+              f"frame {events.memory_usage(deep=True).sum() / 1024 ** 2:.0f}MB, "
+              f"store {store.nbytes / 1024 ** 2:.0f}MB)")
+        # The shared store runs first: memory freed by the frame runs would
+        # otherwise be reused and hide its growth
+        shared = [_concurrent_sessions(store_session, store, n, cities) for n in session_counts]
+        legacy = [_concurrent_sessions(legacy_session, events, n, cities) for n in session_counts]
+        print(f"  {'sessions':>8s} {'session frames':>15s} {'shared store':>13s}")
+        for n_sessions, frames, views in zip(session_counts, legacy, shared):
+            print(f"  {n_sessions:>8d} {frames / 1024 ** 2:>13.0f}MB {views / 1024 ** 2:>11.1f}MB")
+        del events, store
+
+# Runs the dashboard headless in a fresh interpreter and prints its startup
+# timings (app.py records them in session state) plus each page's first visit
+STARTUP_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+start = time.perf_counter()
+app.run()
+timings = dict(app.session_state['startup_timings'], wall=time.perf_counter() - start)
+pages = {}
+for page in app.sidebar.radio[0].options[1:]:
+    start = time.perf_counter()
+    app.sidebar.radio[0].set_value(page).run()
+    pages[page] = time.perf_counter() - start
+print(json.dumps({'timings': timings, 'pages': pages}))
+"""
+
+# Modules the dashboard used to import before its first paint
+DEFERRED_MODULES = ['folium', 'streamlit_folium', 'plotly.express', 'plotly.graph_objects',
+                    'geopandas', 'scipy.signal', 'h3', 'duckdb']
+
+def _import_seconds(module):
+    """Import time of a module in a fresh interpreter"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    return float(result.stdout) if result.returncode == 0 else None
+
+def benchmark_startup(runs=3, app_path='app.py'):
+    """Dashboard cold start in fresh processes: imports, first render, first page visits"""
+    print("\n⏱️  Deferred module import cost (fresh interpreter)")
+    for module in DEFERRED_MODULES:
+        seconds = _import_seconds(module)
+        print(f"  {module:>22s} {'not installed' if seconds is None else f'{seconds * 1000:>6.0f}ms'}")
+    
+    print(f"\n⏱️  Dashboard cold start ({runs} runs)")
+    print(f"  {'run':>4s} {'imports':>9s} {'first render':>13s} {'wall':>8s}  first visit per page")
+    for run in range(runs):
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE, app_path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"  ❌ Headless run failed:\n{result.stderr}")
+            return
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        timings = probe['timings']
+        pages = ', '.join(f"{page} {seconds * 1000:.0f}ms" for page, seconds in probe['pages'].items())
+        print(f"  {run + 1:>4d} {timings['imports'] * 1000:>7.0f}ms "
+              f"{timings['first_render'] * 1000:>11.0f}ms {timings['wall'] * 1000:>6.0f}ms  {pages}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dashboard page compute benchmarks")
+    parser.add_argument('benchmark', choices=['retention', 'map', 'load', 'startup', 'sessions', 'pages'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--legacy-max', type=int, default=10_000_000,
+                        help="largest event count to also time the original pandas code on")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="concurrent session counts (sessions)")
+    parser.add_argument('--runs', type=int, default=3, help="cold starts to time (startup)")
+    parser.add_argument('--string-ids', action='store_true',
+                        help="object string columns, as in a CSV-loaded frame")
+    args = parser.parse_args()
+    
+    if args.benchmark == 'retention':
+        benchmark_retention(args.sizes, args.legacy_max, args.string_ids)
+    elif args.benchmark == 'map':
+        benchmark_map(args.sizes)
+    elif args.benchmark == 'load':
+        benchmark_load(args.sizes)
+    elif args.benchmark == 'startup':
+        benchmark_startup(args.runs)
+    elif args.benchmark == 'sessions':
+        benchmark_sessions(args.sizes, args.sessions)
+    elif args.benchmark == 'pages':
+        benchmark_pages(args.sizes)
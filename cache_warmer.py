@@ -0,0 +1,126 @@
+"""
+Dashboard Cache Warmer
+Precomputes page aggregates for common filter combinations in a background
+thread, so the first sessions after a deploy or restart find them in the
+shared AggregateCache instead of waiting on DuckDB
+"""
+
+import atexit
+import threading
+import time
+from datetime import timedelta
+
+from aggregate_cache import CachedAnalytics
+from page_queries import all_page_queries
+
+# Trailing date windows (days up to the last event date) worth warming
+DATE_WINDOWS = (7, 30)
+
+def warm_filters(options, date_windows=DATE_WINDOWS):
+    """
+    Filter combinations to warm, most requested first: the defaults (all
+    dates, event types and cities), trailing date windows and each city
+    """
+    plans = [{}]
+    for days in date_windows:
+        start = max(options['min_date'], options['max_date'] - timedelta(days=days - 1))
+        plans.append({'date_range': (start, options['max_date'])})
+    plans.extend({'cities': [city]} for city in options['cities'])
+    return plans
+
+class CacheWarmer:
+    """
+    Background thread filling an AggregateCache with page aggregates
+    Entries already cached are skipped, warming stops once the cache is
+    max_fill full so it never evicts what sessions computed, and it pauses
+    between queries to leave the database to interactive sessions
+    """
+    
+    def __init__(self, analytics, cache, options, queries=None, computations=None,
+                 date_windows=DATE_WINDOWS, max_fill=0.5, pause=0.05):
+        """
+        analytics: LocationAnalytics; queries: (method, args, kwargs) as the
+        pages call them, so warmed entries share their cache keys (default:
+        every page's); computations: (name, compute, args, kwargs) cached
+        alongside them as compute(*args, **kwargs, **filters) (e.g. the
+        heatmap points)
+        """
+        queries = all_page_queries() if queries is None else queries
+        # Warming queries run on the warmer's own cursor, never on the
+        # connection sessions share
+        analytics = analytics.on_cursor()
+        self.connection = analytics.con
+        self.analytics = CachedAnalytics(analytics, cache, options)
+        self.cache = cache
+        tasks = [(name, getattr(analytics, name), args, kwargs) for name, args, kwargs in queries]
+        tasks += list(computations or [])
+        self.tasks = [(filters, task) for filters in warm_filters(options, date_windows)
+                      for task in tasks]
+        self.max_fill = max_fill
+        self.pause = pause
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        # Let a running query finish before the interpreter exits
+        atexit.register(self.stop)
+        return self
+    
+    def stop(self, timeout=30):
+        """Stop after the current aggregate"""
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+    
+    @property
+    def running(self):
+        return self._thread.is_alive()
+    
+    def status(self):
+        """Progress: tasks done (computed or already cached), total, failures"""
+        return {
+            'running': self.running,
+            'done': self.done,
+            'total': len(self.tasks),
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'seconds': self.seconds
+        }
+    
+    def _warm(self, filters, task):
+        """Compute one aggregate into the cache; False when it was already there"""
+        name, compute, args, kwargs = task
+        key = self.analytics.key(name, *args, **kwargs, **filters)
+        if key in self.cache:
+            return False
+        # Stored directly, so warming does not count as session misses
+        self.cache.put(key, compute(*args, **kwargs, **filters))
+        return True
+    
+    def _run(self):
+        print(f"\n🔥 Warming dashboard cache ({len(self.tasks)} aggregates)...")
+        start = time.perf_counter()
+        
+        for filters, task in self.tasks:
+            if self._stop.is_set() or self.cache.nbytes > self.max_fill * self.cache.max_bytes:
+                break
+            try:
+                if self._warm(filters, task):
+                    time.sleep(self.pause)
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"  ⚠️ Warming {task[0]} {filters} failed: {e}")
+            self.done += 1
+            self.seconds = time.perf_counter() - start
+        
+        self.seconds = time.perf_counter() - start
+        self.connection.close()
+        print(f"  ✓ Warmed {self.done - self.skipped - self.failed} of {len(self.tasks)} aggregates "
+              f"({self.skipped} already cached, {self.failed} failed) in {self.seconds:.1f}s")
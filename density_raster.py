@@ -0,0 +1,215 @@
+"""
+Event Density Rasters
+Grids all events on a Web Mercator raster per zoom level and smooths them
+with an FFT Gaussian kernel (KDE), stored as compact sparse blocks so the
+heatmap renders from precomputed densities instead of event samples
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+# Raster cells are PIXELS_PER_CELL screen pixels wide at their zoom level
+PIXELS_PER_CELL = 4
+DEFAULT_ZOOMS = tuple(range(4, 13))
+
+# Gaussian bandwidth in cells; the kernel is truncated at 3 sigma
+KERNEL_SIGMA = 2.0
+
+# Only non-empty BLOCK x BLOCK tiles of each raster are stored
+BLOCK = 256
+
+def _world_fraction(lats, lons):
+    """Web Mercator x, y in [0, 1) with y growing southward"""
+    lat = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -85.05112878, 85.05112878))
+    fx = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+    fy = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0
+    return fx, fy
+
+def _cell_centers(ix, iy, n_cells):
+    """Lat/lon of raster cell centers"""
+    lon = (ix + 0.5) / n_cells * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (iy + 0.5) / n_cells))))
+    return lat, lon
+
+def gaussian_kernel(sigma=KERNEL_SIGMA):
+    """Normalized 2D Gaussian kernel truncated at 3 sigma"""
+    radius = int(np.ceil(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel_1d = np.exp(-offsets ** 2 / (2 * sigma ** 2))
+    kernel = np.outer(kernel_1d, kernel_1d)
+    return kernel / kernel.sum()
+
+def level_cells(zoom):
+    """Raster width (and height) in cells at a zoom level"""
+    return 2 ** (zoom + 8) // PIXELS_PER_CELL
+
+def density_level(lats, lons, zoom, weights=None, sigma=KERNEL_SIGMA):
+    """
+    Smoothed event counts on one zoom level's raster
+    Returns (block_x, block_y, values) where values[i] is the BLOCK x BLOCK
+    tile at block (block_x[i], block_y[i])
+    """
+    n_cells = level_cells(zoom)
+    fx, fy = _world_fraction(lats, lons)
+    ix = np.minimum((fx * n_cells).astype(np.int64), n_cells - 1)
+    iy = np.minimum((fy * n_cells).astype(np.int64), n_cells - 1)
+    return density_from_cells(ix, iy, zoom, weights, sigma)
+
+def density_from_cells(ix, iy, zoom, weights=None, sigma=KERNEL_SIGMA):
+    """
+    density_level() for events already binned to raster cells (ix, iy),
+    e.g. cell counts aggregated in DuckDB passed as weights
+    """
+    n_cells = level_cells(zoom)
+    if len(ix) == 0:
+        return (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                np.zeros((0, BLOCK, BLOCK), dtype=np.float32))
+    ix, iy = np.asarray(ix, dtype=np.int64), np.asarray(iy, dtype=np.int64)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+    
+    # Histogram every occupied block in one bincount
+    n_blocks = -(-n_cells // BLOCK)
+    block_id = (iy // BLOCK) * n_blocks + ix // BLOCK
+    blocks, block_pos = np.unique(block_id, return_inverse=True)
+    flat = (block_pos * BLOCK + iy % BLOCK) * BLOCK + ix % BLOCK
+    hist = np.bincount(flat, weights=weights, minlength=len(blocks) * BLOCK * BLOCK)
+    hist = hist.reshape(len(blocks), BLOCK, BLOCK)
+    
+    # Convolution is linear: smooth each block on its own (batched FFT)
+    # and spill the kernel overhang into the neighboring blocks
+    kernel = gaussian_kernel(sigma)
+    radius = kernel.shape[0] // 2
+    smoothed = signal.fftconvolve(hist, kernel[None], mode='full', axes=(1, 2))
+    
+    # Drop FFT round-off: any real contribution is at least the smallest
+    # kernel weight times the smallest event weight
+    min_weight = 1.0 if weights is None else np.min(weights[weights > 0], initial=1.0)
+    smoothed[smoothed < 0.5 * kernel.min() * min_weight] = 0
+    
+    bx, by = blocks % n_blocks, blocks // n_blocks
+    output = {}
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            # Part of each padded result that lands in neighbor (dx, dy)
+            ys, xs = _overlap(dy, radius), _overlap(dx, radius)
+            if ys is None or xs is None:
+                continue
+            (src_y, dst_y), (src_x, dst_x) = ys, xs
+            part = smoothed[:, src_y, src_x]
+            for i, key in enumerate(zip((bx + dx).tolist(), (by + dy).tolist())):
+                if not (0 <= key[0] < n_blocks and 0 <= key[1] < n_blocks):
+                    continue
+                if key not in output:
+                    output[key] = np.zeros((BLOCK, BLOCK), dtype=np.float64)
+                output[key][dst_y, dst_x] += part[i]
+    
+    keys = sorted(output)
+    values = np.stack([output[k] for k in keys]).astype(np.float32) if keys else \
+        np.zeros((0, BLOCK, BLOCK), dtype=np.float32)
+    block_x = np.array([k[0] for k in keys], dtype=np.int32)
+    block_y = np.array([k[1] for k in keys], dtype=np.int32)
+    return block_x, block_y, values
+
+def _overlap(offset, radius):
+    """
+    (source slice in the padded result, destination slice in the block)
+    for the neighbor at offset -1, 0 or 1 along one axis
+    """
+    if offset == 0:
+        return slice(radius, radius + BLOCK), slice(0, BLOCK)
+    if radius == 0:
+        return None
+    if offset < 0:
+        return slice(0, radius), slice(BLOCK - radius, BLOCK)
+    return slice(BLOCK + radius, BLOCK + 2 * radius), slice(0, radius)
+
+class DensityRasters:
+    """
+    Per-zoom smoothed density rasters saved as <path>/z<zoom>.npz
+    (block coordinates plus float32 BLOCK x BLOCK tiles)
+    """
+    
+    def __init__(self, path='density_rasters'):
+        """Open saved rasters; levels are loaded on first use"""
+        self.path = Path(path)
+        with open(self.path / 'rasters.json', 'r') as f:
+            meta = json.load(f)
+        self.zooms = meta['zooms']
+        self.sigma = meta['sigma']
+        self.events = meta['events']
+        # queries.events_fingerprint() of the events the rasters were built from
+        self.data_version = meta.get('data_version')
+        self._levels = {}
+    
+    @staticmethod
+    def build(events, path='density_rasters', zooms=DEFAULT_ZOOMS, sigma=KERNEL_SIGMA,
+              data_version=None):
+        """
+        Build and save rasters for all events (latitude, longitude);
+        data_version identifies the events (queries.events_fingerprint())
+        """
+        print(f"\n🌡️  Building KDE density rasters (zoom {min(zooms)}-{max(zooms)})...")
+        
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        lats = events['latitude'].to_numpy(dtype=np.float64)
+        lons = events['longitude'].to_numpy(dtype=np.float64)
+        
+        for zoom in zooms:
+            block_x, block_y, values = density_level(lats, lons, zoom, sigma=sigma)
+            np.savez_compressed(path / f"z{zoom}.npz",
+                                block_x=block_x, block_y=block_y, values=values)
+            print(f"  ✓ z{zoom:<2d}: {len(values):,} blocks")
+        
+        with open(path / 'rasters.json', 'w') as f:
+            json.dump({'zooms': list(zooms), 'sigma': sigma, 'events': len(lats),
+                       'data_version': data_version}, f, indent=2)
+        print(f"  ✓ Saved: {path}/")
+        
+        return DensityRasters(path)
+    
+    def level(self, zoom):
+        """(block_x, block_y, values) for a zoom level"""
+        if zoom not in self._levels:
+            with np.load(self.path / f"z{zoom}.npz") as data:
+                self._levels[zoom] = (data['block_x'], data['block_y'], data['values'])
+        return self._levels[zoom]
+    
+    def points(self, zoom, threshold=0.01, max_points=20000, bbox=None):
+        """
+        Heatmap points (latitude, longitude, weight) for a zoom level
+        Keeps cells above threshold x the level maximum, at most max_points
+        of the densest; weights are scaled to 0-1. bbox is
+        (min_lon, min_lat, max_lon, max_lat)
+        """
+        return raster_points(*self.level(zoom), zoom, threshold, max_points, bbox)
+
+def raster_points(block_x, block_y, values, zoom, threshold=0.01, max_points=20000, bbox=None):
+    """Thresholded cell centers of one density level"""
+    if len(values) == 0 or values.max() <= 0:
+        return pd.DataFrame({'latitude': [], 'longitude': [], 'weight': []})
+    
+    block, row, col = np.nonzero(values >= threshold * values.max())
+    weight = values[block, row, col]
+    n_cells = level_cells(zoom)
+    lat, lon = _cell_centers(block_x[block].astype(np.int64) * BLOCK + col,
+                             block_y[block].astype(np.int64) * BLOCK + row, n_cells)
+    
+    if bbox is not None:
+        inside = (lon >= bbox[0]) & (lon <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+        lat, lon, weight = lat[inside], lon[inside], weight[inside]
+    
+    if len(weight) > max_points:
+        top = np.argpartition(-weight, max_points - 1)[:max_points]
+        lat, lon, weight = lat[top], lon[top], weight[top]
+    
+    return pd.DataFrame({
+        'latitude': lat,
+        'longitude': lon,
+        'weight': weight / weight.max() if len(weight) else weight
+    })
@@ -0,0 +1,195 @@
+"""
+Columnar Event Store
+Converts the events CSV once into a Parquet file with typed, dictionary-
+encoded columns and precomputed H3 cells. Readers memory-map it and project
+only the columns they use; DuckDB queries it in place. EventStore keeps one
+read-only copy of the columns per process, filtered per session through
+index views
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from queries import DAY_ORDER, H3_RESOLUTIONS, h3_cell_columns, _file_version
+
+EVENT_PARQUET = 'location_events.parquet'
+
+# Column types of the CSV; strings with few distinct values are dictionary
+# encoded and load as pandas categoricals
+EVENT_TYPES = {
+    'event_id': pa.string(),
+    'user_id': pa.string(),
+    'timestamp': pa.timestamp('us'),
+    'latitude': pa.float64(),
+    'longitude': pa.float64(),
+    'event_type': pa.string(),
+    'session_duration': pa.int32(),
+    'city': pa.string(),
+    'user_engagement': pa.string()
+}
+CATEGORICAL_COLUMNS = ['user_id', 'event_type', 'city', 'user_engagement']
+
+# Row groups are sorted by time, so date filters skip whole groups
+ROW_GROUP_SIZE = 128 * 1024
+
+def write_events_parquet(csv_path='location_events.csv', path=EVENT_PARQUET,
+                         h3_resolutions=H3_RESOLUTIONS):
+    """Convert the events CSV to the columnar event file"""
+    print("\n🧱 Writing columnar event file...")
+    start = time.perf_counter()
+    
+    table = pacsv.read_csv(csv_path, convert_options=pacsv.ConvertOptions(column_types=EVENT_TYPES))
+    table = table.sort_by('timestamp')
+    for name in CATEGORICAL_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(name), name,
+                                 pc.dictionary_encode(table[name]))
+    
+    cells = h3_cell_columns(table['latitude'].to_numpy(), table['longitude'].to_numpy(),
+                            h3_resolutions)
+    for name, values in cells.items():
+        table = table.append_column(name, pa.array(values, type=pa.uint64()))
+    
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression='zstd')
+    print(f"  ✓ {table.num_rows:,} events in {path} ({time.perf_counter() - start:.1f}s)")
+
+def load_events(columns=None, path=EVENT_PARQUET):
+    """
+    Events DataFrame from the columnar event file, memory-mapped and limited
+    to columns (all when None); dictionary columns become categoricals
+    """
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+class EventStore:
+    """
+    Process-wide, read-only event columns shared by every session
+    Columns stay Arrow buffers (NumPy views of them are read-only), with
+    event_hour, event_weekday and event_date derived once; sessions select events as
+    EventView index views instead of copying frames
+    """
+    
+    def __init__(self, table, data_version=None):
+        table = table.unify_dictionaries().combine_chunks()
+        timestamps = table['timestamp'].to_numpy()
+        days = timestamps.astype('datetime64[D]')
+        # 1970-01-01 was a Thursday; weekday 0 is Monday as in DAY_ORDER
+        derived = {
+            'event_hour': (timestamps - days).astype('timedelta64[h]').astype(np.uint8),
+            'event_weekday': ((days.astype(np.int64) + 3) % 7).astype(np.uint8),
+            'event_date': days
+        }
+        for name, values in derived.items():
+            table = table.append_column(name, pa.array(values))
+        
+        self.table = table
+        self.data_version = data_version
+        self.categories = {
+            name: table[name].chunk(0).dictionary.to_pylist() if table.num_rows else []
+            for name in table.column_names if pa.types.is_dictionary(table.schema.field(name).type)
+        }
+        self.categories['event_weekday'] = list(DAY_ORDER)
+        self.categories['event_hour'] = list(range(24))
+        self._columns = {}
+    
+    @classmethod
+    def open(cls, path=EVENT_PARQUET, columns=None):
+        """Store of the columnar event file's columns (all when None)"""
+        return cls(pq.read_table(path, columns=columns, memory_map=True), _file_version(path))
+    
+    @property
+    def num_rows(self):
+        return self.table.num_rows
+    
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+    
+    def column(self, name):
+        """Read-only NumPy column; dictionary columns give their codes"""
+        if name not in self._columns:
+            column = self.table[name]
+            array = column.chunk(0) if column.num_chunks else pa.array([], column.type)
+            if pa.types.is_dictionary(array.type):
+                array = array.indices
+            values = array.to_numpy(zero_copy_only=False)
+            values.flags.writeable = False
+            self._columns[name] = values
+        return self._columns[name]
+    
+    def codes(self, name, values):
+        """Codes of the given values in a dictionary column (unknown values dropped)"""
+        lookup = {value: code for code, value in enumerate(self.categories[name])}
+        return np.array([lookup[v] for v in values if v in lookup], dtype=self.column(name).dtype)
+    
+    def mask(self, date_range=None, event_types=None, cities=None, bbox=None):
+        """Boolean mask of the events matching the dashboard filters"""
+        keep = np.ones(self.num_rows, dtype=bool)
+        if date_range and len(date_range) == 2:
+            date = self.column('event_date')
+            keep &= (date >= np.datetime64(pd.Timestamp(date_range[0]).date(), 'D')) & \
+                    (date <= np.datetime64(pd.Timestamp(date_range[1]).date(), 'D'))
+        if event_types:
+            keep &= np.isin(self.column('event_type'), self.codes('event_type', event_types))
+        if cities:
+            keep &= np.isin(self.column('city'), self.codes('city', cities))
+        if bbox is not None:
+            lon, lat = self.column('longitude'), self.column('latitude')
+            keep &= (lon >= bbox[0]) & (lon <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+        return keep
+    
+    def select(self, date_range=None, event_types=None, cities=None, bbox=None):
+        """EventView of the events matching the dashboard filters"""
+        if not (date_range or event_types or cities or bbox is not None):
+            return EventView(self)
+        keep = self.mask(date_range, event_types, cities, bbox)
+        if keep.all():
+            return EventView(self)
+        index_dtype = np.int32 if self.num_rows < 2 ** 31 else np.int64
+        return EventView(self, np.flatnonzero(keep).astype(index_dtype))
+
+class EventView:
+    """
+    A session's selection of a shared EventStore: row positions (None for
+    every event) and no column copies until a column is asked for
+    """
+    
+    def __init__(self, store, index=None):
+        self.store = store
+        self.index = index
+    
+    def __len__(self):
+        return self.store.num_rows if self.index is None else len(self.index)
+    
+    @property
+    def nbytes(self):
+        return 0 if self.index is None else self.index.nbytes
+    
+    def column(self, name):
+        """Column values of the selected events (codes for dictionary columns)"""
+        values = self.store.column(name)
+        return values if self.index is None else values[self.index]
+    
+    def counts(self, name):
+        """Events per value of a dictionary, event_hour or event_weekday column, as a Series"""
+        labels = self.store.categories[name]
+        counts = np.bincount(self.column(name), minlength=len(labels))
+        return pd.Series(counts, index=pd.Index(labels, name=name), name='events')
+    
+    def frame(self, columns):
+        """DataFrame of the selected events; dictionary columns as categoricals"""
+        data = {}
+        for name in columns:
+            values = self.column(name)
+            if name in self.store.categories and name not in ('event_hour', 'event_weekday'):
+                values = pd.Categorical.from_codes(values, self.store.categories[name])
+            data[name] = values
+        return pd.DataFrame(data)
+
+if __name__ == "__main__":
+    write_events_parquet()
@@ -0,0 +1,141 @@
+"""
+Hex Choropleth Layers
+Serves the exported hex layer as map-ready polygons: attributes are read
+from the columnar (GeoParquet) export without decoding its geometry, cells
+are culled to the viewport, merged into coarser parents at low zoom and
+their boundaries quantized to the zoom's pixel size
+"""
+
+import math
+from pathlib import Path
+
+import h3
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Attributes drawn (all additive or re-derivable when cells are merged)
+HEX_COLUMNS = ['h3_index', 'event_count', 'avg_session_duration', 'city']
+
+# Cells narrower than this on screen are merged into their parents
+MIN_CELL_PIXELS = 8
+
+# Densest cells drawn per view
+MAX_CELLS = 3000
+
+# Sequential fill colors (YlOrRd) for event count quantiles
+PALETTE = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+
+def meters_per_pixel(zoom, lat=40.0):
+    """Web Mercator ground resolution at a latitude"""
+    return 156543.03 * math.cos(math.radians(lat)) / 2 ** zoom
+
+def quantize_decimals(zoom):
+    """Coordinate decimals that keep rounding below one pixel at a zoom"""
+    return max(0, math.ceil(-math.log10(360.0 / (256 * 2 ** zoom))))
+
+class HexChoropleth:
+    """
+    Hex aggregates at one H3 resolution; coarser display levels and cell
+    boundaries are built on first use and kept
+    """
+    
+    def __init__(self, cells):
+        """cells: DataFrame with the HEX_COLUMNS"""
+        self.cells = cells[HEX_COLUMNS].reset_index(drop=True)
+        self.resolution = h3.get_resolution(self.cells['h3_index'].iloc[0]) if len(cells) else 0
+        self._levels = {}
+    
+    @classmethod
+    def from_file(cls, path='hex_analysis.parquet'):
+        """
+        Load hex attributes, memory-mapping the Parquet columns; a GeoJSON
+        export is only parsed when no Parquet file exists
+        """
+        if Path(path).suffix == '.parquet':
+            return cls(pq.read_table(path, columns=HEX_COLUMNS, memory_map=True).to_pandas())
+        
+        import geopandas as gpd
+        return cls(pd.DataFrame(gpd.read_file(path)[HEX_COLUMNS]))
+    
+    def display_resolution(self, zoom):
+        """Finest resolution (up to the data's) whose cells are MIN_CELL_PIXELS wide"""
+        for res in range(self.resolution, -1, -1):
+            width_m = 2 * h3.average_hexagon_edge_length(res, unit='m')
+            if width_m / meters_per_pixel(zoom) >= MIN_CELL_PIXELS:
+                return res
+        return 0
+    
+    def level(self, resolution):
+        """
+        (cells, rings) merged to a coarser resolution; rings are closed
+        (lon, lat) boundaries. Parents do not tile their children exactly,
+        so merged counts are for display only
+        """
+        resolution = min(resolution, self.resolution)
+        if resolution in self._levels:
+            return self._levels[resolution]
+        
+        cells = self.cells
+        if resolution < self.resolution:
+            # City of the busiest child; duration re-weighted by events
+            merged = cells.assign(
+                h3_index=[h3.cell_to_parent(c, resolution) for c in cells['h3_index']],
+                duration_sum=cells['avg_session_duration'] * cells['event_count']
+            ).sort_values('event_count', ascending=False, kind='stable')
+            cells = merged.groupby('h3_index').agg(
+                event_count=('event_count', 'sum'),
+                duration_sum=('duration_sum', 'sum'),
+                city=('city', 'first')
+            ).reset_index()
+            cells['avg_session_duration'] = cells.pop('duration_sum') / cells['event_count']
+        
+        # Six vertices plus the closing one; pentagons repeat their last vertex
+        rings = np.empty((len(cells), 7, 2))
+        for i, cell in enumerate(cells['h3_index'].tolist()):
+            ring = [(lon, lat) for lat, lon in h3.cell_to_boundary(cell)]
+            ring += [ring[-1]] * (6 - len(ring))
+            rings[i] = ring + [ring[0]]
+        
+        # Fill colors from event count quantiles of the whole level, so
+        # colors stay put while panning
+        breaks = np.quantile(cells['event_count'], np.linspace(0, 1, len(PALETTE) + 1)[1:-1]) \
+            if len(cells) else np.zeros(len(PALETTE) - 1)
+        cells = cells.assign(
+            avg_session_duration=cells['avg_session_duration'].round(1),
+            fill=np.array(PALETTE)[np.searchsorted(breaks, cells['event_count'], side='right')]
+        )
+        
+        self._levels[resolution] = (cells, rings)
+        return self._levels[resolution]
+    
+    def features(self, zoom, bbox=None, max_cells=MAX_CELLS):
+        """
+        GeoJSON polygons for a view: cells intersecting bbox (min_lon,
+        min_lat, max_lon, max_lat) at the zoom's display resolution, the
+        densest max_cells of them, with coordinates quantized to the zoom
+        """
+        cells, rings = self.level(self.display_resolution(zoom))
+        
+        index = np.arange(len(cells))
+        if bbox is not None:
+            lon, lat = rings[:, :, 0], rings[:, :, 1]
+            index = np.flatnonzero((lon.max(axis=1) >= bbox[0]) & (lon.min(axis=1) <= bbox[2]) &
+                                   (lat.max(axis=1) >= bbox[1]) & (lat.min(axis=1) <= bbox[3]))
+        if len(index) > max_cells:
+            counts = cells['event_count'].to_numpy()[index]
+            index = index[np.argpartition(-counts, max_cells - 1)[:max_cells]]
+        
+        coords = np.round(rings[index], quantize_decimals(zoom)).tolist()
+        props = cells.iloc[index][['city', 'event_count', 'avg_session_duration', 'fill']]
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                    'properties': p
+                }
+                for ring, p in zip(coords, props.to_dict('records'))
+            ]
+        }
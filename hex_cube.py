@@ -0,0 +1,140 @@
+"""
+Spatio-Temporal Hex Cube
+Precomputed sparse (H3 cell x weekday x hour) activity cube with event
+counts and distinct-user sketches, stored as memory-mapped CSR arrays so any
+time window's hex layer can be sliced in milliseconds
+"""
+
+import json
+from pathlib import Path
+
+import h3
+import h3.api.basic_int as h3_int
+import numpy as np
+import pandas as pd
+
+from hex_store import hll_estimate, hll_observations
+
+# Small sketches: the cube holds one per (cell, slot) entry (~13% error)
+CUBE_HLL_PRECISION = 6
+
+# Time slots: weekday (Monday = 0) * 24 + hour
+N_SLOTS = 7 * 24
+
+CUBE_ARRAYS = ('cells', 'indptr', 'cell_pos', 'counts', 'registers')
+
+class HexTimeCube:
+    """
+    CSR layout: entries sorted by (slot, cell); indptr[s]:indptr[s + 1] are
+    the entries of time slot s
+    """
+    
+    def __init__(self, path='hex_cube'):
+        """Open a saved cube with memory-mapped arrays"""
+        self.path = Path(path)
+        with open(self.path / 'cube.json', 'r') as f:
+            meta = json.load(f)
+        self.resolution = meta['resolution']
+        self.precision = meta['precision']
+        
+        for name in CUBE_ARRAYS:
+            setattr(self, name, np.load(self.path / f"{name}.npy", mmap_mode='r'))
+    
+    @staticmethod
+    def build(events, path='hex_cube', resolution=8, precision=CUBE_HLL_PRECISION):
+        """
+        Build and save a cube from events (latitude, longitude, timestamp,
+        user_id), reusing an existing h3_index column when present
+        """
+        print(f"\n🧊 Building hex x weekday x hour cube (resolution {resolution})...")
+        
+        if 'h3_index' in events.columns:
+            cell_ids = events['h3_index'].to_numpy()
+        else:
+            lat = events['latitude'].to_numpy(dtype=np.float64).tolist()
+            lon = events['longitude'].to_numpy(dtype=np.float64).tolist()
+            cell_ids = np.array([
+                h3.int_to_str(h3_int.latlng_to_cell(a, b, resolution))
+                for a, b in zip(lat, lon)
+            ], dtype=object)
+        cell_pos, cells = pd.factorize(cell_ids, sort=True)
+        
+        timestamp = pd.to_datetime(events['timestamp'])
+        slot = (timestamp.dt.weekday * 24 + timestamp.dt.hour).to_numpy()
+        
+        # One entry per distinct (slot, cell), already in CSR order
+        keys = slot.astype(np.int64) * len(cells) + cell_pos
+        entry_keys, entry_of_event, counts = np.unique(
+            keys, return_inverse=True, return_counts=True
+        )
+        entry_slot = entry_keys // len(cells)
+        indptr = np.searchsorted(entry_slot, np.arange(N_SLOTS + 1))
+        
+        register, rank = hll_observations(events['user_id'].to_numpy(), precision)
+        registers = np.zeros((len(entry_keys), 1 << precision), dtype=np.uint8)
+        np.maximum.at(registers, (entry_of_event, register), rank)
+        
+        arrays = {
+            'cells': np.asarray(cells, dtype='U15'),
+            'indptr': indptr.astype(np.int64),
+            'cell_pos': (entry_keys % len(cells)).astype(np.int32),
+            'counts': counts.astype(np.int32),
+            'registers': registers
+        }
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, arr in arrays.items():
+            np.save(path / f"{name}.npy", arr)
+        with open(path / 'cube.json', 'w') as f:
+            json.dump({'resolution': resolution, 'precision': precision}, f, indent=2)
+        
+        print(f"  ✓ {len(entry_keys):,} non-empty (cell, slot) entries over {len(cells):,} hexagons")
+        print(f"  ✓ Saved: {path}/")
+        
+        return HexTimeCube(path)
+    
+    def slice(self, hours=None, weekdays=None):
+        """
+        Hex layer (h3_index, event_count, unique_users) for a time window
+        hours / weekdays are iterables of hours 0-23 and weekdays 0-6
+        (Monday = 0); None means all
+        """
+        hours = np.arange(24) if hours is None else np.asarray(list(hours), dtype=np.int64)
+        weekdays = np.arange(7) if weekdays is None else np.asarray(list(weekdays), dtype=np.int64)
+        slots = np.unique((weekdays[:, None] * 24 + hours[None, :]).ravel())
+        
+        # Gather CSR ranges of the selected slots without a Python loop
+        starts, stops = self.indptr[slots], self.indptr[slots + 1]
+        lengths = stops - starts
+        entries = (np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                   + np.arange(lengths.sum()))
+        
+        if len(entries) == 0:
+            return pd.DataFrame({'h3_index': [], 'event_count': [], 'unique_users': []})
+        
+        cell_pos = self.cell_pos[entries]
+        event_count = np.bincount(cell_pos, weights=self.counts[entries],
+                                  minlength=len(self.cells))
+        active = np.flatnonzero(event_count)
+        
+        # Union the sketches of each cell's selected slots (grouped by cell)
+        order = np.argsort(cell_pos, kind='stable')
+        sorted_pos = cell_pos[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_pos[1:] != sorted_pos[:-1]])
+        registers = np.maximum.reduceat(self.registers[entries[order]], group_starts, axis=0)
+        
+        return pd.DataFrame({
+            'h3_index': self.cells[active],
+            'event_count': event_count[active].astype(np.int64),
+            'unique_users': np.rint(hll_estimate(registers)).astype(np.int64)
+        })
+    
+    def weekday_weekend(self, hours=None):
+        """Weekday (Mon-Fri) and weekend (Sat-Sun) layers side by side"""
+        weekday = self.slice(hours, range(5))
+        weekend = self.slice(hours, range(5, 7))
+        both = weekday.merge(weekend, on='h3_index', how='outer',
+                             suffixes=('_weekday', '_weekend'))
+        count_cols = both.columns.drop('h3_index')
+        both[count_cols] = both[count_cols].fillna(0).astype(np.int64)
+        return both
@@ -0,0 +1,251 @@
+"""
+Incremental H3 Hex Aggregate Store
+Keeps mergeable per-hex state (counts, duration moments, a HyperLogLog
+distinct-user sketch and per-city counts) so new event batches can be merged
+without recomputing history
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import h3
+import h3.api.basic_int as h3_int
+import numpy as np
+import pandas as pd
+
+# H3 resolution of new stores
+DEFAULT_RESOLUTION = 8
+
+# HyperLogLog precision: 2**8 registers per hex (~6.5% standard error;
+# small counts fall back to linear counting and are close to exact)
+HLL_PRECISION = 8
+
+# Per-cell arrays persisted as <name>.npy
+STORE_ARRAYS = ('cells', 'event_count', 'duration_sum', 'duration_sumsq',
+                'registers', 'city_counts')
+
+def _bit_length(values):
+    """Vectorized bit length of uint64 values"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        step = values >= np.uint64(1 << shift)
+        values[step] >>= np.uint64(shift)
+        length[step] += shift
+    return length + (values > 0)
+
+def hll_observations(keys, precision=HLL_PRECISION):
+    """
+    HyperLogLog register index and rank for each key
+    Keys are hashed with pandas' vectorized 64-bit hash
+    """
+    hashes = pd.util.hash_array(np.asarray(keys, dtype=object)).astype(np.uint64)
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (64 - precision) - _bit_length(remainder) + 1
+    return register, rank.astype(np.uint8)
+
+def hll_estimate(registers):
+    """Cardinality estimate for each row of a (cells x registers) array"""
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+    
+    # Linear counting for small cardinalities
+    zeros = np.sum(registers == 0, axis=1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+class HexAggregateStore:
+    """
+    Persistent, mergeable per-hex aggregates at one H3 resolution
+    """
+    
+    def __init__(self, path='hex_store', resolution=None, precision=None):
+        """
+        Open the store at path, or start an empty one (resolution and
+        precision default to the saved store's, else DEFAULT_RESOLUTION and
+        HLL_PRECISION); a saved store cannot change either
+        """
+        self.path = Path(path)
+        self.resolution = DEFAULT_RESOLUTION if resolution is None else resolution
+        self.precision = HLL_PRECISION if precision is None else precision
+        self.cities = []
+        self.size = 0
+        self._positions = {}
+        self._allocate(1024)
+        
+        if (self.path / 'store.json').exists():
+            self._load()
+            for name, requested in (('resolution', resolution), ('precision', precision)):
+                if requested is not None and requested != getattr(self, name):
+                    raise ValueError(f"{self.path} stores {name} {getattr(self, name)}, "
+                                     f"not {requested}")
+    
+    def _allocate(self, capacity):
+        """(Re)allocate per-cell arrays, keeping existing rows"""
+        def grow(old, shape, dtype):
+            new = np.zeros(shape, dtype=dtype)
+            if old is not None:
+                new[tuple(slice(0, n) for n in old.shape)] = old
+            return new
+        
+        n_cities = max(len(self.cities), 1)
+        self.cells = grow(getattr(self, 'cells', None), capacity, np.uint64)
+        self.event_count = grow(getattr(self, 'event_count', None), capacity, np.int64)
+        self.duration_sum = grow(getattr(self, 'duration_sum', None), capacity, np.float64)
+        self.duration_sumsq = grow(getattr(self, 'duration_sumsq', None), capacity, np.float64)
+        self.registers = grow(getattr(self, 'registers', None),
+                              (capacity, 1 << self.precision), np.uint8)
+        self.city_counts = grow(getattr(self, 'city_counts', None),
+                                (capacity, n_cities), np.int64)
+    
+    def _cell_positions(self, cells):
+        """Store positions for cell ids, appending unseen cells"""
+        unique, inverse = np.unique(cells, return_inverse=True)
+        positions = np.empty(len(unique), dtype=np.int64)
+        for i, cell in enumerate(unique.tolist()):
+            pos = self._positions.get(cell)
+            if pos is None:
+                pos = self._positions[cell] = self.size
+                self.size += 1
+            positions[i] = pos
+        
+        # Capacity doubling keeps appends amortized O(batch)
+        if self.size > len(self.cells):
+            self._allocate(max(self.size, 2 * len(self.cells)))
+        self.cells[positions] = unique
+        
+        return positions[inverse]
+    
+    def _city_codes(self, cities):
+        """Column codes for city names, adding unseen cities"""
+        codes, names = pd.factorize(cities)
+        new = [c for c in names if c not in self.cities]
+        if new:
+            self.cities.extend(new)
+            self._allocate(len(self.cells))
+        lookup = {city: i for i, city in enumerate(self.cities)}
+        return np.array([lookup[c] for c in names], dtype=np.int64)[codes]
+    
+    def add_events(self, events):
+        """
+        Merge a batch of events (latitude, longitude, user_id,
+        session_duration, city) into the store in O(batch) time
+        """
+        lat = events['latitude'].to_numpy(dtype=np.float64).tolist()
+        lon = events['longitude'].to_numpy(dtype=np.float64).tolist()
+        cells = np.fromiter(
+            (h3_int.latlng_to_cell(a, b, self.resolution) for a, b in zip(lat, lon)),
+            dtype=np.uint64, count=len(lat)
+        )
+        
+        pos = self._cell_positions(cells)
+        city = self._city_codes(events['city'])
+        duration = events['session_duration'].to_numpy(dtype=np.float64)
+        register, rank = hll_observations(events['user_id'].to_numpy(), self.precision)
+        
+        np.add.at(self.event_count, pos, 1)
+        np.add.at(self.duration_sum, pos, duration)
+        np.add.at(self.duration_sumsq, pos, duration ** 2)
+        np.add.at(self.city_counts, (pos, city), 1)
+        np.maximum.at(self.registers, (pos, register), rank)
+        
+        return len(events)
+    
+    def ingest_csv(self, csv_path, chunksize=1_000_000):
+        """Stream an event CSV into the store chunk by chunk"""
+        total = 0
+        columns = ['user_id', 'latitude', 'longitude', 'session_duration', 'city']
+        for chunk in pd.read_csv(csv_path, usecols=columns, chunksize=chunksize):
+            total += self.add_events(chunk)
+        print(f"  ✓ Merged {total:,} events into {self.size:,} hexagons")
+        return total
+    
+    def save(self):
+        """Persist store arrays (.npy, memory-mappable) and metadata"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        for name in STORE_ARRAYS:
+            np.save(self.path / f"{name}.npy", getattr(self, name)[:self.size])
+        
+        meta = {
+            'resolution': self.resolution,
+            'precision': self.precision,
+            'cities': self.cities,
+            'size': self.size
+        }
+        with open(self.path / 'store.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+    
+    def _load(self):
+        """Load a saved store"""
+        with open(self.path / 'store.json', 'r') as f:
+            meta = json.load(f)
+        self.resolution = meta['resolution']
+        self.precision = meta['precision']
+        self.cities = meta['cities']
+        self.size = meta['size']
+        
+        # Fresh arrays sized for the saved precision and city list
+        for name in STORE_ARRAYS:
+            setattr(self, name, None)
+        self._allocate(max(self.size, 1024))
+        for name in STORE_ARRAYS:
+            saved = np.load(self.path / f"{name}.npy", mmap_mode='r')
+            getattr(self, name)[:self.size] = saved
+        self._positions = {cell: i for i, cell in enumerate(self.cells[:self.size].tolist())}
+    
+    def to_hex_stats(self):
+        """Per-hex aggregates in the create_h3_hexagons() schema"""
+        n = self.size
+        count = self.event_count[:n]
+        mean = self.duration_sum[:n] / count
+        
+        hex_stats = pd.DataFrame({
+            'h3_index': [h3.int_to_str(c) for c in self.cells[:n].tolist()],
+            'event_count': count,
+            'unique_users': np.rint(hll_estimate(self.registers[:n])).astype(np.int64),
+            'avg_session_duration': mean,
+            'city': np.array(self.cities, dtype=object)[self.city_counts[:n].argmax(axis=1)],
+            'std_session_duration': np.sqrt(
+                np.maximum(self.duration_sumsq[:n] / count - mean ** 2, 0)
+            )
+        })
+        
+        return hex_stats.sort_values('h3_index').reset_index(drop=True)
+    
+    def export_for_visualization(self):
+        """
+        Regenerate hex_analysis/hotspots exports from the stored aggregates
+        """
+        from spatial_analysis import GeospatialAnalyzer, hex_geodataframe
+        
+        hex_gdf = hex_geodataframe(self.to_hex_stats())
+        analyzer = GeospatialAnalyzer.from_hex_layer(hex_gdf, self.resolution)
+        return analyzer.export_for_visualization()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge event batches into the hex store")
+    parser.add_argument('csv_paths', nargs='+', help="event CSV batches to merge")
+    parser.add_argument('--store', default='hex_store')
+    parser.add_argument('--resolution', type=int, default=None,
+                        help=f"H3 resolution of a new store (default {DEFAULT_RESOLUTION}); "
+                             "must match an existing one")
+    parser.add_argument('--no-export', action='store_true',
+                        help="only update the store, skip GeoJSON/hotspot exports")
+    args = parser.parse_args()
+    
+    print("🧮 Updating hex aggregate store...")
+    try:
+        store = HexAggregateStore(args.store, resolution=args.resolution)
+    except ValueError as e:
+        parser.error(str(e))
+    for csv_path in args.csv_paths:
+        store.ingest_csv(csv_path)
+    store.save()
+    print(f"  ✓ Saved store: {args.store}/")
+    
+    if not args.no_export:
+        store.export_for_visualization()
@@ -0,0 +1,110 @@
+"""
+Level-of-Detail Map Layers
+Picks what the overview map draws for the current zoom and viewport: city
+aggregates at national zoom, pre-binned H3 cells at metro zoom and raw
+events only when few are in view. Every level is a bounded GeoJSON payload
+built from DuckDB aggregates
+"""
+
+import math
+import time
+
+US_CENTER = (39.8283, -98.5795)
+US_ZOOM = 4
+
+# Zoom at and below which cities are drawn
+CITY_MAX_ZOOM = 7
+
+# Raw events are drawn from this zoom on, if at most MAX_RAW_POINTS are in view
+POINT_MIN_ZOOM = 14
+MAX_RAW_POINTS = 2000
+
+# Densest H3 cells drawn at metro zoom
+MAX_HEX_CELLS = 3000
+
+# H3 resolution for each zoom: cells stay roughly 10-30 px across
+HEX_RESOLUTION_BY_ZOOM = {8: 5, 9: 6, 10: 7, 11: 7, 12: 8, 13: 9}
+
+def hex_resolution(zoom):
+    """H3 resolution drawn at a zoom level"""
+    zooms = sorted(HEX_RESOLUTION_BY_ZOOM)
+    return HEX_RESOLUTION_BY_ZOOM[min(max(int(zoom), zooms[0]), zooms[-1])]
+
+def snap_bbox(bbox, zoom):
+    """
+    Expand (min_lon, min_lat, max_lon, max_lat) outward to a grid of half
+    a map tile, so small pans reuse cached layers
+    """
+    step = 360.0 / 2 ** (int(zoom) + 1)
+    return (
+        max(-180.0, math.floor(bbox[0] / step) * step),
+        max(-90.0, math.floor(bbox[1] / step) * step),
+        min(180.0, math.ceil(bbox[2] / step) * step),
+        min(90.0, math.ceil(bbox[3] / step) * step)
+    )
+
+def _points(rows, columns):
+    """GeoJSON FeatureCollection of points from row dicts with latitude/longitude"""
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point',
+                             'coordinates': [round(r['longitude'], 5), round(r['latitude'], 5)]},
+                'properties': {c: r[c] for c in columns}
+            }
+            for r in rows
+        ]
+    }
+
+def city_features(city_stats):
+    """City aggregate points with marker radius scaled by users"""
+    cities = city_stats.assign(
+        radius=(10 + city_stats['users'] / max(city_stats['users'].max(), 1) * 20).round(1),
+        avg_session=city_stats['avg_session'].round(0)
+    )
+    return _points(cities.to_dict('records'), ['city', 'events', 'users', 'avg_session', 'radius'])
+
+def hex_features(cells):
+    """H3 cell center points (get_top_locations() rows) sized by events"""
+    cells = cells.assign(radius=(3 + 12 * (cells['event_count'] /
+                                           max(cells['event_count'].max(), 1)) ** 0.5).round(1))
+    return _points(cells.rename(columns={'lat': 'latitude', 'lon': 'longitude'}).to_dict('records'),
+                   ['h3_index', 'city', 'event_count', 'unique_users', 'radius'])
+
+def point_features(points):
+    """Raw event points"""
+    return _points(points.to_dict('records'), ['city', 'event_type', 'session_duration'])
+
+def map_layer(analytics, filters, zoom=US_ZOOM, bbox=None):
+    """
+    Layer for a map view: dict with level ('cities', 'hexagons' or
+    'points'), resolution, features (GeoJSON) and build_seconds
+    bbox is the visible (min_lon, min_lat, max_lon, max_lat), if known
+    """
+    start = time.perf_counter()
+    level, resolution = 'cities', None
+    
+    if zoom <= CITY_MAX_ZOOM or bbox is None:
+        features = city_features(analytics.get_city_stats(**filters))
+    else:
+        bbox = snap_bbox(bbox, zoom)
+        in_view = analytics.get_overview_metrics(bbox=bbox, **filters)['events']
+        if zoom >= POINT_MIN_ZOOM and in_view <= MAX_RAW_POINTS:
+            level = 'points'
+            features = point_features(
+                analytics.get_event_points(MAX_RAW_POINTS, bbox=bbox, **filters)
+            )
+        else:
+            level, resolution = 'hexagons', hex_resolution(zoom)
+            features = hex_features(
+                analytics.get_top_locations(MAX_HEX_CELLS, resolution, bbox=bbox, **filters)
+            )
+    
+    return {
+        'level': level,
+        'resolution': resolution,
+        'features': features,
+        'build_seconds': time.perf_counter() - start
+    }
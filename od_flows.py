@@ -0,0 +1,197 @@
+"""
+Origin-Destination Flows Between H3 Hexagons
+Extracts consecutive per-user hex transitions and aggregates them into a
+sparse hex x hex trip matrix, in memory or out of core for large event files
+"""
+
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+import h3
+import h3.api.basic_int as h3_int
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+def _cells_int(events, resolution):
+    """
+    uint64 H3 cell per event, reusing an integer h3_cell or string
+    h3_index column when present
+    """
+    if 'h3_cell' in events.columns:
+        return events['h3_cell'].to_numpy(dtype=np.uint64)
+    if 'h3_index' in events.columns:
+        return np.array([h3.str_to_int(c) for c in events['h3_index'].tolist()], dtype=np.uint64)
+    lat = events['latitude'].to_numpy(dtype=np.float64).tolist()
+    lon = events['longitude'].to_numpy(dtype=np.float64).tolist()
+    return np.fromiter(
+        (h3_int.latlng_to_cell(a, b, resolution) for a, b in zip(lat, lon)),
+        dtype=np.uint64, count=len(lat)
+    )
+
+def hex_transitions(events, resolution=8, max_gap_minutes=60, event_types=None):
+    """
+    Trip counts between consecutive events of the same user that land in
+    different hexes no more than max_gap_minutes apart
+    events needs user_id, timestamp and h3_cell (uint64), h3_index or
+    latitude/longitude
+    Returns a frame of origin, destination (uint64 cells) and trips
+    """
+    if event_types is not None:
+        events = events[events['event_type'].isin(event_types)]
+    
+    frame = pd.DataFrame({
+        'user_id': events['user_id'].to_numpy(),
+        'timestamp': pd.to_datetime(events['timestamp']).to_numpy(),
+        'cell': _cells_int(events, resolution)
+    })
+    
+    # One sort, then compare every event with its predecessor
+    frame = frame.sort_values(['user_id', 'timestamp'], kind='stable')
+    user = frame['user_id'].to_numpy()
+    ts = frame['timestamp'].to_numpy()
+    cell = frame['cell'].to_numpy()
+    
+    same_user = user[1:] == user[:-1]
+    within_gap = (ts[1:] - ts[:-1]) <= np.timedelta64(max_gap_minutes, 'm')
+    moved = cell[1:] != cell[:-1]
+    keep = same_user & within_gap & moved
+    
+    moves = pd.DataFrame({'origin': cell[:-1][keep], 'destination': cell[1:][keep]})
+    return moves.groupby(['origin', 'destination']).size().rename('trips').reset_index()
+
+def _merge_transitions(parts):
+    """Sum trip counts of several transition frames"""
+    if not parts:
+        return pd.DataFrame({'origin': np.array([], dtype=np.uint64),
+                             'destination': np.array([], dtype=np.uint64),
+                             'trips': np.array([], dtype=np.int64)})
+    merged = pd.concat(parts, ignore_index=True)
+    return merged.groupby(['origin', 'destination'], as_index=False)['trips'].sum()
+
+def hex_transitions_out_of_core(csv_path, resolution=8, max_gap_minutes=60,
+                                event_types=None, chunksize=2_000_000, n_partitions=64):
+    """
+    Out-of-core transitions for event files larger than memory
+    Streams the CSV in chunks, hash-partitions compact (user, time, cell)
+    rows by user into temporary Parquet files, then processes one
+    partition at a time; a user's events always share a partition
+    """
+    columns = ['user_id', 'timestamp', 'latitude', 'longitude']
+    if event_types is not None:
+        columns.append('event_type')
+    
+    tmp_dir = Path(tempfile.mkdtemp(prefix='od_partitions_'))
+    try:
+        for i, chunk in enumerate(pd.read_csv(csv_path, usecols=columns, chunksize=chunksize)):
+            if event_types is not None:
+                chunk = chunk[chunk['event_type'].isin(event_types)]
+            compact = pd.DataFrame({
+                'user_id': chunk['user_id'].to_numpy(),
+                'timestamp': pd.to_datetime(chunk['timestamp']).to_numpy(),
+                'h3_cell': _cells_int(chunk, resolution)
+            })
+            partition = pd.util.hash_array(compact['user_id'].to_numpy()) % n_partitions
+            for p, part in compact.groupby(partition):
+                part_dir = tmp_dir / f"part_{p:03d}"
+                part_dir.mkdir(exist_ok=True)
+                part.to_parquet(part_dir / f"chunk_{i:05d}.parquet", index=False)
+        
+        parts = []
+        for part_dir in sorted(tmp_dir.iterdir()):
+            events = pd.read_parquet(part_dir)
+            parts.append(hex_transitions(events, resolution, max_gap_minutes))
+            # Keep the running total compact
+            if len(parts) >= 8:
+                parts = [_merge_transitions(parts)]
+        
+        return _merge_transitions(parts)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+class ODMatrix:
+    """
+    Sparse hex x hex trip matrix
+    """
+    
+    def __init__(self, transitions):
+        """Build from an origin/destination/trips frame"""
+        codes, cells = pd.factorize(
+            np.concatenate([transitions['origin'].to_numpy(),
+                            transitions['destination'].to_numpy()])
+        )
+        n = len(transitions)
+        self.cells = np.array([h3.int_to_str(int(c)) for c in cells], dtype=object)
+        self.matrix = sparse.csr_matrix(
+            (transitions['trips'].to_numpy(), (codes[:n], codes[n:])),
+            shape=(len(cells), len(cells))
+        )
+    
+    @classmethod
+    def from_events(cls, events, resolution=8, max_gap_minutes=60, event_types=None):
+        """OD matrix from an in-memory event frame"""
+        return cls(hex_transitions(events, resolution, max_gap_minutes, event_types))
+    
+    @classmethod
+    def from_csv(cls, csv_path, resolution=8, max_gap_minutes=60, event_types=None, **kwargs):
+        """OD matrix from an event CSV, processed out of core"""
+        return cls(hex_transitions_out_of_core(
+            csv_path, resolution, max_gap_minutes, event_types, **kwargs
+        ))
+    
+    def top_flows(self, k=10, origin=None):
+        """
+        The k largest flows, optionally only those leaving one origin hex
+        """
+        coo = self.matrix.tocoo()
+        rows, cols, trips = coo.row, coo.col, coo.data
+        if origin is not None:
+            mask = self.cells[rows] == origin
+            rows, cols, trips = rows[mask], cols[mask], trips[mask]
+        
+        k = min(k, len(trips))
+        top = np.argpartition(-trips, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        top = top[np.argsort(-trips[top], kind='stable')]
+        
+        return pd.DataFrame({
+            'origin': self.cells[rows[top]],
+            'destination': self.cells[cols[top]],
+            'trips': trips[top]
+        })
+    
+    def save(self, path='od_flows.npz'):
+        """Save the matrix and its cell labels"""
+        sparse.save_npz(path, self.matrix)
+        np.save(Path(path).with_suffix('.cells.npy'), self.cells.astype('U15'))
+    
+    @classmethod
+    def load(cls, path='od_flows.npz'):
+        """Load a saved OD matrix"""
+        od = cls.__new__(cls)
+        od.matrix = sparse.load_npz(path).tocsr()
+        od.cells = np.load(Path(path).with_suffix('.cells.npy')).astype(object)
+        return od
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build hex origin-destination flows out of core")
+    parser.add_argument('csv_path', nargs='?', default='location_events.csv')
+    parser.add_argument('--resolution', type=int, default=8)
+    parser.add_argument('--max-gap', type=int, default=60, help="max minutes between events")
+    parser.add_argument('--event-types', nargs='*', default=None,
+                        help="only use these event types (e.g. navigation)")
+    parser.add_argument('--chunksize', type=int, default=2_000_000)
+    parser.add_argument('--partitions', type=int, default=64)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', default='od_flows.npz')
+    args = parser.parse_args()
+    
+    print(f"🔀 Building OD flows from {args.csv_path}...")
+    od = ODMatrix.from_csv(args.csv_path, args.resolution, args.max_gap, args.event_types,
+                           chunksize=args.chunksize, n_partitions=args.partitions)
+    od.save(args.output)
+    print(f"  ✓ {int(od.matrix.sum()):,} trips over {od.matrix.nnz:,} hex pairs")
+    print(f"  ✓ Saved: {args.output}")
+    print(f"\n🔝 Top {args.top} flows:")
+    print(od.top_flows(args.top).to_string(index=False))
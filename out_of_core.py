@@ -0,0 +1,224 @@
+"""
+Out-of-Core Spatial Aggregation
+Streams an event file (CSV or Parquet) in chunks and keeps exact, mergeable
+per-hex and per-user state, so hex, hotspot and retention outputs can be
+produced for files larger than memory
+"""
+
+from pathlib import Path
+
+import h3
+import h3.api.basic_int as h3_int
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+NS_PER_DAY = 86_400_000_000_000
+
+def iter_event_chunks(source, columns, chunksize=1_000_000):
+    """Yield DataFrame chunks of the given columns from a CSV or Parquet file"""
+    if Path(source).suffix == '.parquet':
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, usecols=columns, chunksize=chunksize)
+
+class _Codes:
+    """Stable integer codes for values seen across chunks"""
+    
+    def __init__(self):
+        self.positions = {}
+        self.values = []
+    
+    def encode(self, values, add=True):
+        """Codes for an array of values (new values appended when add)"""
+        codes, uniques = pd.factorize(values)
+        lookup = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques.tolist()):
+            pos = self.positions.get(value)
+            if pos is None:
+                if not add:
+                    raise KeyError(value)
+                pos = self.positions[value] = len(self.values)
+                self.values.append(value)
+            lookup[i] = pos
+        return lookup[codes]
+
+def _grow(arr, size, fill=0):
+    """Extend a state array to at least size entries"""
+    if len(arr) >= size:
+        return arr
+    new = np.full(max(size, 2 * len(arr)), fill, dtype=arr.dtype)
+    new[:len(arr)] = arr
+    return new
+
+class OutOfCoreAggregator:
+    """
+    Exact chunked aggregates at one H3 resolution
+    Pass 1 (add_events): per-hex counts, duration sums, city counts and
+    distinct (hex, user) pairs, plus each user's first event
+    Pass 2 (add_returns): retention window flags from days since first event
+    Memory grows with hexes, users and distinct (hex, user) pairs, not events
+    """
+    
+    def __init__(self, resolution=8):
+        self.resolution = resolution
+        self.hexes, self.users, self.cities = _Codes(), _Codes(), _Codes()
+        self.rows = 0
+        
+        # Per-hex state
+        self.event_count = np.zeros(0, dtype=np.int64)
+        self.duration_sum = np.zeros(0, dtype=np.float64)
+        self.city_counts = np.zeros((0, 0), dtype=np.int64)
+        self._pair_parts = []
+        
+        # Per-user first event: timestamp (ns), global row, hex and city
+        self.first_ts = np.zeros(0, dtype=np.int64)
+        self.first_row = np.zeros(0, dtype=np.int64)
+        self.first_hex = np.zeros(0, dtype=np.int64)
+        self.first_city = np.zeros(0, dtype=np.int64)
+        self.returned = {}
+        self._hex_order = {}
+    
+    def _cells(self, chunk):
+        lat = chunk['latitude'].to_numpy(dtype=np.float64).tolist()
+        lon = chunk['longitude'].to_numpy(dtype=np.float64).tolist()
+        return np.fromiter(
+            (h3_int.latlng_to_cell(a, b, self.resolution) for a, b in zip(lat, lon)),
+            dtype=np.uint64, count=len(lat)
+        )
+    
+    def add_events(self, chunk):
+        """Pass 1: merge a chunk of events"""
+        hex_pos = self.hexes.encode(self._cells(chunk))
+        user = self.users.encode(chunk['user_id'].to_numpy())
+        city = self.cities.encode(chunk['city'].to_numpy())
+        ts = pd.to_datetime(chunk['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        rows = self.rows + np.arange(len(chunk))
+        self.rows += len(chunk)
+        
+        n_hex, n_city = len(self.hexes.values), len(self.cities.values)
+        self.event_count = _grow(self.event_count, n_hex)
+        self.duration_sum = _grow(self.duration_sum, n_hex)
+        if self.city_counts.shape[0] < n_hex or self.city_counts.shape[1] < n_city:
+            grown = np.zeros((max(n_hex, 2 * self.city_counts.shape[0]), n_city), dtype=np.int64)
+            grown[:self.city_counts.shape[0], :self.city_counts.shape[1]] = self.city_counts
+            self.city_counts = grown
+        
+        self.event_count += np.bincount(hex_pos, minlength=len(self.event_count))
+        self.duration_sum += np.bincount(hex_pos, weights=chunk['session_duration'].to_numpy(),
+                                         minlength=len(self.duration_sum))
+        np.add.at(self.city_counts, (hex_pos, city), 1)
+        
+        # Distinct (hex, user) pairs, consolidated now and then
+        self._pair_parts.append(np.unique((hex_pos << 32) | user))
+        if len(self._pair_parts) >= 8:
+            self._pair_parts = [np.unique(np.concatenate(self._pair_parts))]
+        
+        # Chunk-level first event per user: earliest timestamp, then row
+        order = np.lexsort((rows, ts, user))
+        is_first = np.r_[True, user[order][1:] != user[order][:-1]]
+        first = order[is_first]
+        u = user[first]
+        
+        n_users = len(self.users.values)
+        self.first_ts = _grow(self.first_ts, n_users, np.iinfo(np.int64).max)
+        self.first_row = _grow(self.first_row, n_users, np.iinfo(np.int64).max)
+        self.first_hex = _grow(self.first_hex, n_users)
+        self.first_city = _grow(self.first_city, n_users)
+        
+        # Earlier rows win ties, as in a stable sort of the whole file
+        better = (ts[first] < self.first_ts[u]) | (
+            (ts[first] == self.first_ts[u]) & (rows[first] < self.first_row[u])
+        )
+        u, first = u[better], first[better]
+        self.first_ts[u] = ts[first]
+        self.first_row[u] = rows[first]
+        self.first_hex[u] = hex_pos[first]
+        self.first_city[u] = city[first]
+        
+        return len(chunk)
+    
+    def add_returns(self, chunk, windows):
+        """Pass 2: flag users with events inside each retention window"""
+        n_users = len(self.users.values)
+        for name in windows:
+            self.returned.setdefault(name, np.zeros(n_users, dtype=bool))
+        
+        user = self.users.encode(chunk['user_id'].to_numpy(), add=False)
+        ts = pd.to_datetime(chunk['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        days = (ts - self.first_ts[user]) // NS_PER_DAY
+        
+        for name, (lo, hi) in windows.items():
+            self.returned[name][user[(days >= lo) & (days <= hi)]] = True
+        
+        # First hexes in order of first appearance in the event stream
+        for pos in pd.unique(self.first_hex[user]).tolist():
+            self._hex_order.setdefault(pos, len(self._hex_order))
+        
+        return len(chunk)
+    
+    def hex_stats(self):
+        """Per-hex aggregates in the create_h3_hexagons() schema"""
+        n = len(self.hexes.values)
+        pairs = np.unique(np.concatenate(self._pair_parts)) if self._pair_parts else \
+            np.zeros(0, dtype=np.int64)
+        unique_users = np.bincount(pairs >> 32, minlength=n)
+        
+        # Most common city, ties going to the alphabetically first (as mode())
+        names = np.array(self.cities.values, dtype=object)
+        alphabetical = np.argsort(names)
+        top_city = names[alphabetical][self.city_counts[:n][:, alphabetical].argmax(axis=1)]
+        
+        hex_stats = pd.DataFrame({
+            'h3_index': [h3.int_to_str(c) for c in self.hexes.values],
+            'event_count': self.event_count[:n],
+            'unique_users': unique_users,
+            'avg_session_duration': self.duration_sum[:n] / self.event_count[:n],
+            'city': top_city
+        })
+        return hex_stats.sort_values('h3_index').reset_index(drop=True)
+    
+    def retention(self, windows):
+        """Retention by first hex in the hex_retention() schema"""
+        n_users = len(self.users.values)
+        users = pd.DataFrame({
+            'first_hex': self.first_hex[:n_users],
+            'city': np.array(self.cities.values, dtype=object)[self.first_city[:n_users]],
+            **{name: self.returned[name] for name in windows}
+        })
+        
+        retention_df = users.groupby('first_hex', sort=False).agg(
+            city=('city', 'first'),
+            total_users=('city', 'size'),
+            **{name: (name, 'sum') for name in windows}
+        )
+        for name in windows:
+            retention_df[f'{name}_retention_pct'] = (
+                retention_df[name] / retention_df['total_users'] * 100
+            )
+        
+        retention_df = retention_df.loc[list(self._hex_order)]
+        retention_df.index = [h3.int_to_str(self.hexes.values[p]) for p in retention_df.index]
+        retention_df = retention_df.rename_axis('h3_index').reset_index()
+        return retention_df[['h3_index', 'city', 'total_users'] +
+                            [f'{name}_retention_pct' for name in windows]]
+
+def aggregate_out_of_core(source, windows, resolution=8, chunksize=1_000_000):
+    """
+    Two streaming passes over source; returns (hex_stats, retention_df)
+    windows maps name -> (min days, max days) since first event
+    """
+    agg = OutOfCoreAggregator(resolution)
+    
+    columns = ['user_id', 'timestamp', 'latitude', 'longitude', 'session_duration', 'city']
+    for chunk in iter_event_chunks(source, columns, chunksize):
+        agg.add_events(chunk)
+    print(f"  ✓ Pass 1: {agg.rows:,} events -> {len(agg.hexes.values):,} hexagons, "
+          f"{len(agg.users.values):,} users")
+    
+    for chunk in iter_event_chunks(source, ['user_id', 'timestamp'], chunksize):
+        agg.add_returns(chunk, windows)
+    print("  ✓ Pass 2: retention windows flagged")
+    
+    return agg.hex_stats(), agg.retention(windows)
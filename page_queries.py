@@ -0,0 +1,83 @@
+"""
+Concurrent Page Queries
+Starts a page's independent aggregates together on a shared thread pool.
+Each query runs on its own DuckDB cursor, and DuckDB, pandas and NumPy
+release the GIL in their kernels, so a page waits about as long as its
+slowest chart rather than the sum of them
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Worker threads shared by every session's page renders
+MAX_WORKERS = 4
+
+# Each page's aggregates: {name: (method, args, kwargs)}, called with the
+# sidebar filters
+PAGE_QUERIES = {
+    'overview': {
+        'metrics': ('get_overview_metrics', (), {}),
+        'city_stats': ('get_city_stats', (), {})
+    },
+    'regional': {
+        'city_stats': ('get_city_stats', (), {}),
+        'daily_trends': ('get_daily_trends', (), {}),
+        'top_locations': ('get_top_locations', (10,), {'resolution': 8})
+    },
+    'retention': {
+        'retention': ('get_city_retention', (), {}),
+        'city_stats': ('get_city_stats', (), {})
+    },
+    'events': {
+        'event_types': ('get_event_type_counts', (), {}),
+        'event_types_by_city': ('get_event_types_by_city', (), {}),
+        'session_histogram': ('get_session_histogram', (50,), {}),
+        'hourly': ('get_hourly_counts', (), {}),
+        'weekday': ('get_weekday_activity', (), {}),
+        'metrics': ('get_overview_metrics', (), {})
+    }
+}
+
+def all_page_queries():
+    """Every page's (method, args, kwargs), each once"""
+    unique = {}
+    for queries in PAGE_QUERIES.values():
+        for method, args, kwargs in queries.values():
+            unique.setdefault((method, args, tuple(sorted(kwargs.items()))), (method, args, kwargs))
+    return list(unique.values())
+
+def chart_executor(max_workers=MAX_WORKERS):
+    """Thread pool for page aggregates"""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='page-query')
+
+class PageQueries:
+    """
+    A page's aggregates by name; page[name] waits for one. With an
+    executor all of them start at once, without one each is computed when
+    first asked for (sequential rendering)
+    """
+    
+    def __init__(self, analytics, page, filters, executor=None):
+        self.executor = executor
+        self._calls = {}
+        self._futures = {}
+        for name, (method, args, kwargs) in PAGE_QUERIES[page].items():
+            self.submit(name, getattr(analytics, method), *args, **kwargs, **filters)
+    
+    def submit(self, name, func, *args, **kwargs):
+        """Add a computation to the page (started now if concurrent)"""
+        if self.executor is None:
+            self._calls[name] = (func, args, kwargs)
+        else:
+            self._futures[name] = self.executor.submit(func, *args, **kwargs)
+        return self
+    
+    def __getitem__(self, name):
+        if name not in self._futures:
+            func, args, kwargs = self._calls.pop(name)
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self._futures[name] = future
+        return self._futures[name].result()
@@ -0,0 +1,266 @@
+"""
+Setup Pipeline Runner
+Runs data generation, the DuckDB build and the geospatial exports as a DAG of
+stages with a content-addressed artifact cache: a stage is skipped when its
+outputs were produced from the same input contents, code and parameters
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+CACHE_PATH = '.pipeline_cache.json'
+
+# Stage functions run in worker processes; heavy imports stay inside them so
+# a no-op rebuild only stats files
+
+def _generate_data(params):
+    import generate_location_data as gen
+    
+    df, _ = gen.generate_location_events()
+    gen.save_data(df)
+
+def _build_database(params):
+    from queries import LocationAnalytics
+    
+    if os.path.exists(params['db_path']):
+        os.remove(params['db_path'])
+    LocationAnalytics(params['csv_path'], params['db_path']).close()
+
+def _event_parquet(params):
+    from event_store import write_events_parquet
+    
+    write_events_parquet(params['csv_path'], params['path'])
+
+def _hex_layers(params):
+    from spatial_analysis import GeospatialAnalyzer
+    
+    # Hex aggregates come from the DuckDB H3 columns
+    analyzer = GeospatialAnalyzer.from_duckdb(params['db_path'], params['resolution'])
+    analyzer.identify_hotspots(method='gi_star', k=params['k'])
+    analyzer.export_for_visualization()
+
+def _vector_tiles(params):
+    from spatial_analysis import GeospatialAnalyzer
+    
+    analyzer = GeospatialAnalyzer(params['csv_path'])
+    analyzer.create_h3_hexagons(resolution=params['resolution'])
+    analyzer.build_vector_tiles()
+
+def _time_cube(params):
+    import pandas as pd
+    from hex_cube import HexTimeCube
+    
+    events = pd.read_csv(params['csv_path'],
+                         usecols=['user_id', 'timestamp', 'latitude', 'longitude'])
+    HexTimeCube.build(events, 'hex_cube', resolution=params['resolution'])
+
+def _density_rasters(params):
+    import duckdb
+    import pandas as pd
+    from density_raster import DensityRasters
+    from queries import events_fingerprint
+    
+    events = pd.read_csv(params['csv_path'], usecols=['latitude', 'longitude'])
+    con = duckdb.connect()
+    data_version = events_fingerprint(con, f"read_csv('{params['csv_path']}')")
+    con.close()
+    DensityRasters.build(events, 'density_rasters', zooms=params['zooms'],
+                         data_version=data_version)
+
+def _od_flows(params):
+    from od_flows import ODMatrix
+    
+    od = ODMatrix.from_csv(params['csv_path'], params['resolution'], params['max_gap_minutes'])
+    od.save('od_flows.npz')
+
+class Stage:
+    """
+    One pipeline step: func(params) reads inputs and writes outputs
+    code lists the source files whose changes invalidate the stage
+    """
+    
+    def __init__(self, name, func, outputs, inputs=(), code=(), params=None, deps=()):
+        self.name = name
+        self.func = func
+        self.outputs = list(outputs)
+        self.inputs = list(inputs)
+        self.code = list(code)
+        self.params = params or {}
+        self.deps = list(deps)
+
+CSV = 'location_events.csv'
+SPATIAL_CODE = ['spatial_analysis.py', 'queries.py', 'vector_tiles.py', 'hex_cube.py',
+                'hex_store.py', 'od_flows.py', 'density_raster.py']
+
+STAGES = [
+    Stage('data', _generate_data,
+          outputs=[CSV, 'location_events.geojson', 'data_summary.json'],
+          code=['generate_location_data.py']),
+    Stage('database', _build_database,
+          outputs=['location_analytics.duckdb'],
+          inputs=[CSV], code=['queries.py'], deps=['data'],
+          params={'csv_path': CSV, 'db_path': 'location_analytics.duckdb'}),
+    Stage('event_parquet', _event_parquet,
+          outputs=['location_events.parquet'],
+          inputs=[CSV], code=['event_store.py', 'queries.py'], deps=['data'],
+          params={'csv_path': CSV, 'path': 'location_events.parquet'}),
+    Stage('hex_layers', _hex_layers,
+          outputs=[f"{stem}{ext}" for stem in ('hex_analysis', 'hotspots', 'hotspot_clusters')
+                   for ext in ('.geojson', '.parquet', '.fgb')] + ['spatial_summary.json'],
+          inputs=['location_analytics.duckdb'], code=SPATIAL_CODE, deps=['database'],
+          params={'db_path': 'location_analytics.duckdb', 'resolution': 8, 'k': 1}),
+    Stage('vector_tiles', _vector_tiles,
+          outputs=['hex_tiles.mbtiles'],
+          inputs=[CSV], code=SPATIAL_CODE, deps=['data'],
+          params={'csv_path': CSV, 'resolution': 8}),
+    Stage('time_cube', _time_cube,
+          outputs=['hex_cube/cube.json'] + [f"hex_cube/{name}.npy" for name in
+                                            ('cells', 'indptr', 'cell_pos', 'counts', 'registers')],
+          inputs=[CSV], code=['hex_cube.py', 'hex_store.py'], deps=['data'],
+          params={'csv_path': CSV, 'resolution': 8}),
+    Stage('density_rasters', _density_rasters,
+          outputs=['density_rasters/rasters.json'] + [f"density_rasters/z{z}.npz" for z in range(4, 13)],
+          inputs=[CSV], code=['density_raster.py', 'queries.py'], deps=['data'],
+          params={'csv_path': CSV, 'zooms': list(range(4, 13))}),
+    Stage('od_flows', _od_flows,
+          outputs=['od_flows.npz', 'od_flows.cells.npy'],
+          inputs=[CSV], code=['od_flows.py'], deps=['data'],
+          params={'csv_path': CSV, 'resolution': 8, 'max_gap_minutes': 60})
+]
+
+class ArtifactCache:
+    """
+    Content digests of files plus the key each stage last ran with
+    File digests are memoized by (size, mtime) so unchanged files are
+    never re-read
+    """
+    
+    def __init__(self, path=CACHE_PATH):
+        self.path = Path(path)
+        state = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.files = state.get('files', {})
+        self.stages = state.get('stages', {})
+    
+    def digest(self, path):
+        """sha256 of a file's contents, or None if it does not exist"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        
+        stamp = [st.st_size, st.st_mtime_ns]
+        cached = self.files.get(path)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        self.files[path] = stamp + [h.hexdigest()]
+        return h.hexdigest()
+    
+    def stage_key(self, stage):
+        """Hash of the stage's parameters, code and input contents"""
+        payload = {
+            'params': stage.params,
+            'code': {p: self.digest(p) for p in stage.code},
+            'inputs': {p: self.digest(p) for p in stage.inputs}
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    
+    def is_current(self, stage, key):
+        """True if the stage ran with this key and its outputs are untouched"""
+        record = self.stages.get(stage.name)
+        if not record or record['key'] != key:
+            return False
+        return all(self.digest(p) == record['outputs'].get(p) for p in stage.outputs)
+    
+    def record(self, stage, key):
+        """Remember the key and output digests of a finished stage"""
+        self.stages[stage.name] = {
+            'key': key,
+            'outputs': {p: self.digest(p) for p in stage.outputs}
+        }
+    
+    def save(self):
+        self.path.write_text(json.dumps({'files': self.files, 'stages': self.stages}, indent=1))
+
+def run_pipeline(stages=STAGES, force=(), workers=None):
+    """
+    Run stages in dependency order, skipping current ones and running
+    independent stages in parallel worker processes
+    force: stage names to rerun regardless of the cache
+    """
+    start = time.perf_counter()
+    cache = ArtifactCache()
+    by_name = {stage.name: stage for stage in stages}
+    done, ran = set(), []
+    running = {}
+    pool = None
+    
+    def ready_stages():
+        return [s for s in stages if s.name not in done and s.name not in running.values()
+                and all(d in done for d in s.deps)]
+    
+    try:
+        while len(done) < len(stages):
+            for stage in ready_stages():
+                # Keys are computed only once upstream outputs exist
+                key = cache.stage_key(stage)
+                if stage.name not in force and cache.is_current(stage, key):
+                    print(f"  ✓ {stage.name}: up to date")
+                    done.add(stage.name)
+                    continue
+                
+                print(f"  ▶ {stage.name}: running")
+                pool = pool or ProcessPoolExecutor(max_workers=workers)
+                running[pool.submit(stage.func, stage.params)] = stage.name
+            
+            if not running:
+                if not ready_stages() and len(done) < len(stages):
+                    missing = sorted(set(by_name) - done)
+                    raise ValueError(f"Unresolvable stage dependencies: {missing}")
+                continue
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                stage = by_name[name]
+                # Re-key after the run: upstream outputs may have changed
+                cache.record(stage, cache.stage_key(stage))
+                cache.save()
+                done.add(name)
+                ran.append(name)
+                print(f"  ✓ {name}: done")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        cache.save()
+    
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Pipeline finished in {elapsed:.2f}s "
+          f"({len(ran)} stage(s) run, {len(stages) - len(ran)} up to date)")
+    return ran
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build project artifacts, skipping current stages")
+    parser.add_argument('--force', nargs='*', default=[],
+                        help="stage names to rebuild regardless of the cache")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--list', action='store_true', help="list stages and exit")
+    args = parser.parse_args()
+    
+    if args.list:
+        for stage in STAGES:
+            deps = f" (after {', '.join(stage.deps)})" if stage.deps else ""
+            print(f"{stage.name}{deps}: {', '.join(stage.outputs)}")
+    else:
+        print("🏗️  Running setup pipeline...")
+        run_pipeline(force=set(args.force), workers=args.workers)
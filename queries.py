@@ -3,19 +3,103 @@ DuckDB Analytical Queries
 Performs fast analytical queries on location-based event data
 """
 
+import copy
+import os
 import duckdb
+import h3
+import h3.api.basic_int as h3_int
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+# H3 cell columns (h3_res<r>) added to the events table at load time
+H3_RESOLUTIONS = (4, 5, 6, 7, 8, 9)
+
+# Retention windows in days since first event (inclusive)
+RETENTION_WINDOWS = {'d1': (1, 1), 'd7': (7, 10), 'd30': (30, 35)}
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def _filter_clause(date_range=None, event_types=None, cities=None, bbox=None):
+    """
+    WHERE clause and parameters for the dashboard filters
+    bbox (min_lon, min_lat, max_lon, max_lat) limits events to a map view
+    """
+    conditions, params = [], []
+    if date_range and len(date_range) == 2:
+        conditions.append("CAST(timestamp AS DATE) BETWEEN ? AND ?")
+        params.extend([date_range[0], date_range[1]])
+    if event_types:
+        conditions.append("list_contains(?, event_type)")
+        params.append(list(event_types))
+    if cities:
+        conditions.append("list_contains(?, city)")
+        params.append(list(cities))
+    if bbox is not None:
+        conditions.append("longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?")
+        params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+def h3_cell_columns(lats, lons, resolutions=H3_RESOLUTIONS):
+    """
+    UBIGINT-compatible H3 cells {h3_res<r>: uint64 array} for coordinates
+    Each resolution is indexed from coordinates: H3 children do not
+    tile their parents exactly, so parents of fine cells would put
+    ~5-7% of events in a different hex than direct indexing
+    """
+    lat = np.asarray(lats, dtype=np.float64).tolist()
+    lon = np.asarray(lons, dtype=np.float64).tolist()
+    return {
+        f"h3_res{r}": np.fromiter(
+            (h3_int.latlng_to_cell(a, b, r) for a, b in zip(lat, lon)),
+            dtype=np.uint64, count=len(lat)
+        )
+        for r in sorted(resolutions)
+    }
+
+def _file_version(path):
+    """Identifies a data file's contents by name, size and modification time"""
+    st = os.stat(path)
+    return f"{Path(path).name}:{st.st_size}:{st.st_mtime_ns}"
+
+def _fingerprint_sql(source='events'):
+    """Event count and order-independent event id checksum of a relation"""
+    return f"""
+        SELECT COUNT(*) || ':' || CAST(COALESCE(SUM(hash(CAST(event_id AS VARCHAR))), 0) AS VARCHAR)
+        FROM {source}
+    """
+
+def events_fingerprint(con, source='events'):
+    """
+    Fingerprint of the events in a DuckDB relation (table, view, registered
+    frame or read_csv()); equal for the CSV and every copy made from it,
+    unlike the file-based data_version
+    """
+    return con.execute(_fingerprint_sql(source)).fetchone()[0]
+
 class LocationAnalytics:
     """
     DuckDB-based analytics for location events
     """
     
+    # Arrow tables queried in place (from_store); cursors do not see the
+    # connection's registrations, so _query re-registers them
+    arrow_tables = {}
+    
+    # SQL for hour of day and weekday (0 = Monday); event stores have them
+    # precomputed
+    hour_sql = "CAST(EXTRACT(HOUR FROM timestamp) AS INTEGER)"
+    weekday_sql = "CAST(ISODOW(timestamp) - 1 AS INTEGER)"
+    
+    # events_fingerprint() of the events, computed on first use
+    _fingerprint = None
+    
     def __init__(self, csv_path='location_events.csv', db_path='location_analytics.duckdb'):
         """Initialize DuckDB connection and load data"""
         self.db_path = db_path
         self.con = duckdb.connect(db_path)
+        self.data_version = None
         
         print("🦆 Initializing DuckDB...")
         
@@ -27,16 +111,89 @@ class LocationAnalytics:
                 SELECT * FROM read_csv_auto('{csv_path}')
             """)
             
+            # H3 columns replace the table, so they come before the indices
+            self._add_h3_columns()
+            
             # Create indices for performance
             self.con.execute("CREATE INDEX IF NOT EXISTS idx_city ON events(city)")
             self.con.execute("CREATE INDEX IF NOT EXISTS idx_user ON events(user_id)")
             self.con.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON events(timestamp)")
             self.con.execute("CREATE INDEX IF NOT EXISTS idx_event_type ON events(event_type)")
             
+            self.data_version = _file_version(csv_path)
+            
             print("  ✓ Data loaded and indexed")
         else:
             raise FileNotFoundError(f"CSV file not found: {csv_path}")
     
+    @classmethod
+    def open(cls, db_path='location_analytics.duckdb', read_only=True):
+        """Connect to an existing database without reloading the CSV"""
+        analytics = cls.__new__(cls)
+        analytics.db_path = db_path
+        analytics.con = duckdb.connect(db_path, read_only=read_only)
+        analytics.data_version = _file_version(db_path)
+        return analytics
+    
+    @classmethod
+    def from_dataframe(cls, events, h3_resolutions=H3_RESOLUTIONS):
+        """In-memory database of an events DataFrame, skipping the CSV"""
+        analytics = cls.__new__(cls)
+        analytics.db_path = ':memory:'
+        analytics.con = duckdb.connect(':memory:')
+        analytics.data_version = None
+        
+        analytics.con.register('events_df', events)
+        analytics.con.execute("CREATE TABLE events AS SELECT * FROM events_df")
+        analytics.con.unregister('events_df')
+        if h3_resolutions:
+            analytics._add_h3_columns(h3_resolutions)
+        return analytics
+    
+    @classmethod
+    def from_parquet(cls, path='location_events.parquet'):
+        """
+        Query an events Parquet file (event_store.py) in place: nothing is
+        loaded up front and each query reads only the columns and row
+        groups it needs
+        """
+        analytics = cls.__new__(cls)
+        analytics.db_path = ':memory:'
+        analytics.con = duckdb.connect(':memory:')
+        analytics.data_version = _file_version(path)
+        analytics.con.execute(f"CREATE VIEW events AS SELECT * FROM read_parquet('{path}')")
+        return analytics
+    
+    @classmethod
+    def from_store(cls, store):
+        """
+        Query a shared EventStore's Arrow columns in place: no copy of the
+        events is made, and hour and weekday come precomputed
+        """
+        analytics = cls.__new__(cls)
+        analytics.db_path = ':memory:'
+        analytics.con = duckdb.connect(':memory:')
+        analytics.data_version = store.data_version
+        analytics.arrow_tables = {'events': store.table}
+        analytics.hour_sql = "CAST(event_hour AS INTEGER)"
+        analytics.weekday_sql = "CAST(event_weekday AS INTEGER)"
+        analytics.con.register('events', store.table)
+        return analytics
+    
+    def _add_h3_columns(self, resolutions=H3_RESOLUTIONS):
+        """Add UBIGINT H3 cell columns h3_res<r> to the events table"""
+        coords = self.con.execute("SELECT latitude, longitude FROM events").fetchnumpy()
+        cells = pd.DataFrame(h3_cell_columns(coords['latitude'], coords['longitude'], resolutions))
+        
+        # Table scans keep insertion order, so cells line up row by row
+        self.con.register('h3_cells', cells)
+        self.con.execute("""
+            CREATE OR REPLACE TABLE events AS
+            SELECT * FROM events POSITIONAL JOIN h3_cells
+        """)
+        self.con.unregister('h3_cells')
+        print(f"  ✓ Added H3 cell columns (resolutions {', '.join(map(str, sorted(resolutions)))})")
+    
     def get_events_by_city(self):
         """Total events by city"""
         query = """
@@ -202,19 +359,91 @@ class LocationAnalytics:
         
         return overall, by_city
     
-    def get_top_locations(self, limit=10):
-        """Top most active locations (lat/lon clusters)"""
+    def get_hex_aggregates(self, resolution=8, date_range=None, event_types=None, cities=None):
+        """
+        Per-hex aggregates in the create_h3_hexagons() schema (h3_index,
+        event_count, unique_users, avg_session_duration, city)
+        """
+        where, params = _filter_clause(date_range, event_types, cities)
+        query = f"""
+            WITH hex_city AS (
+                SELECT 
+                    h3_res{resolution} as cell,
+                    city,
+                    COUNT(*) as n
+                FROM events
+                {where}
+                GROUP BY cell, city
+            ),
+            hex_stats AS (
+                SELECT 
+                    h3_res{resolution} as cell,
+                    COUNT(*) as event_count,
+                    COUNT(DISTINCT user_id) as unique_users,
+                    AVG(session_duration) as avg_session_duration
+                FROM events
+                {where}
+                GROUP BY cell
+            )
+            SELECT 
+                printf('%x', hs.cell) as h3_index,
+                hs.event_count,
+                hs.unique_users,
+                hs.avg_session_duration,
+                FIRST(hc.city ORDER BY hc.n DESC, hc.city) as city
+            FROM hex_stats hs
+            JOIN hex_city hc ON hs.cell = hc.cell
+            GROUP BY hs.cell, hs.event_count, hs.unique_users, hs.avg_session_duration
+            ORDER BY h3_index
+        """
+        return self.con.execute(query, params * 2).df()
+    
+    def get_top_locations(self, limit=10, resolution=8, date_range=None, event_types=None,
+                          cities=None, bbox=None):
+        """Top most active locations (H3 hexagons)"""
+        where, params = _filter_clause(date_range, event_types, cities, bbox)
         query = f"""
             SELECT 
-                ROUND(latitude, 3) as lat,
-                ROUND(longitude, 3) as lon,
-                city,
+                printf('%x', h3_res{resolution}) as h3_index,
+                MODE(city) as city,
                 COUNT(*) as event_count,
                 COUNT(DISTINCT user_id) as unique_users
             FROM events
-            GROUP BY lat, lon, city
-            ORDER BY event_count DESC
-            LIMIT {limit}
+            {where}
+            GROUP BY h3_res{resolution}
+            ORDER BY event_count DESC, h3_index
+            LIMIT {int(limit)}
+        """
+        df = self._query(query, params)
+        
+        # Hex centers for the few returned rows
+        centers = [h3.cell_to_latlng(c) for c in df['h3_index']]
+        df.insert(1, 'lat', [c[0] for c in centers])
+        df.insert(2, 'lon', [c[1] for c in centers])
+        return df
+    
+    def get_hex_hotspots(self, resolution=8, percentile=90):
+        """
+        Hexes at or above the event count percentile
+        (cells at one H3 resolution are near-equal area, so counts rank
+        the same as densities)
+        """
+        query = f"""
+            WITH hex AS (
+                SELECT 
+                    printf('%x', h3_res{resolution}) as h3_index,
+                    MODE(city) as city,
+                    COUNT(*) as event_count,
+                    COUNT(DISTINCT user_id) as unique_users
+                FROM events
+                GROUP BY h3_res{resolution}
+            )
+            SELECT *
+            FROM hex
+            WHERE event_count >= (
+                SELECT QUANTILE_CONT(event_count, {percentile / 100}) FROM hex
+            )
+            ORDER BY event_count DESC, h3_index
         """
         return self.con.execute(query).df()
     
@@ -288,6 +517,295 @@ class LocationAnalytics:
         """
         return self.con.execute(query).df()
     
+    # Dashboard queries: every page aggregate is computed in DuckDB with the
+    # sidebar filters, so results stay small however many events there are.
+    # Each runs on its own cursor so concurrent sessions can share one
+    # connection
+    
+    def _query(self, query, params=()):
+        """Run a query on a fresh cursor and return a DataFrame"""
+        with self.con.cursor() as cur:
+            for name, table in self.arrow_tables.items():
+                cur.register(name, table)
+            return cur.execute(query, list(params)).df()
+    
+    def data_fingerprint(self):
+        """events_fingerprint() of the events table (scanned once)"""
+        if self._fingerprint is None:
+            self._fingerprint = self._query(_fingerprint_sql()).iloc[0, 0]
+        return self._fingerprint
+    
+    def get_filter_options(self):
+        """Date bounds, event types, cities and event total for the sidebar"""
+        bounds = self._query("""
+            SELECT 
+                CAST(MIN(timestamp) AS DATE) as min_date,
+                CAST(MAX(timestamp) AS DATE) as max_date,
+                COUNT(*) as total_events
+            FROM events
+        """).iloc[0]
+        event_types = self._query("SELECT DISTINCT event_type FROM events ORDER BY event_type")
+        cities = self._query("SELECT DISTINCT city FROM events ORDER BY city")
+        return {
+            'min_date': pd.Timestamp(bounds['min_date']).date(),
+            'max_date': pd.Timestamp(bounds['max_date']).date(),
+            'total_events': int(bounds['total_events']),
+            'event_types': event_types['event_type'].tolist(),
+            'cities': cities['city'].tolist()
+        }
+    
+    def get_overview_metrics(self, date_range=None, event_types=None, cities=None, bbox=None):
+        """Event, user and city totals and mean session duration"""
+        where, params = _filter_clause(date_range, event_types, cities, bbox)
+        row = self._query(f"""
+            SELECT 
+                COUNT(*) as events,
+                COUNT(DISTINCT user_id) as users,
+                COUNT(DISTINCT city) as cities,
+                AVG(session_duration) as avg_session
+            FROM events
+            {where}
+        """, params).iloc[0]
+        return {
+            'events': int(row['events']),
+            'users': int(row['users']),
+            'cities': int(row['cities']),
+            'avg_session': float(row['avg_session']) if pd.notna(row['avg_session']) else 0.0
+        }
+    
+    def get_city_stats(self, date_range=None, event_types=None, cities=None):
+        """
+        Events, unique users and mean session duration per city, with the
+        mean event location as the city's map position
+        """
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            SELECT 
+                city,
+                COUNT(*) as events,
+                COUNT(DISTINCT user_id) as users,
+                AVG(session_duration) as avg_session,
+                AVG(latitude) as latitude,
+                AVG(longitude) as longitude
+            FROM events
+            {where}
+            GROUP BY city
+            ORDER BY city
+        """, params)
+    
+    def get_daily_trends(self, date_range=None, event_types=None, cities=None):
+        """Daily events and unique users per city"""
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            SELECT 
+                CAST(timestamp AS DATE) as date,
+                city,
+                COUNT(*) as events,
+                COUNT(DISTINCT user_id) as users
+            FROM events
+            {where}
+            GROUP BY date, city
+            ORDER BY date, city
+        """, params)
+    
+    def get_city_retention(self, date_range=None, event_types=None, cities=None,
+                           windows=RETENTION_WINDOWS):
+        """
+        Retention of users grouped by the city of their first event, as in
+        the hex_retention() schema (city, total_users, <window>_retention_pct)
+        Every city with filtered events is listed, in order of first
+        appearance (events are stored by time); cities no user started in
+        get zeros
+        """
+        where, params = _filter_clause(date_range, event_types, cities)
+        flags = ",\n".join(
+            f"BOOL_OR(days BETWEEN {int(lo)} AND {int(hi)}) as {name}"
+            for name, (lo, hi) in windows.items()
+        )
+        pcts = ",\n".join(
+            f"AVG(CAST({name} AS DOUBLE)) * 100 as {name}_retention_pct" for name in windows
+        )
+        city_pcts = ",\n".join(
+            f"COALESCE(r.{name}_retention_pct, 0) as {name}_retention_pct" for name in windows
+        )
+        return self._query(f"""
+            WITH filtered AS (
+                SELECT user_id, city, timestamp
+                FROM events
+                {where}
+            ),
+            user_first AS (
+                SELECT 
+                    user_id,
+                    ARG_MIN(city, timestamp) as city,
+                    MIN(timestamp) as first_event
+                FROM filtered
+                GROUP BY user_id
+            ),
+            city_order AS (
+                SELECT city, MIN(timestamp) as first_seen
+                FROM filtered
+                GROUP BY city
+            ),
+            user_flags AS (
+                SELECT 
+                    user_id,
+                    ANY_VALUE(city) as city,
+                    {flags}
+                FROM (
+                    SELECT 
+                        f.user_id,
+                        u.city,
+                        DATE_DIFF('microsecond', u.first_event, f.timestamp) // 86400000000 as days
+                    FROM filtered f
+                    JOIN user_first u ON f.user_id = u.user_id
+                )
+                GROUP BY user_id
+            ),
+            city_retention AS (
+                SELECT 
+                    city,
+                    COUNT(*) as total_users,
+                    {pcts}
+                FROM user_flags
+                GROUP BY city
+            )
+            SELECT 
+                c.city,
+                COALESCE(r.total_users, 0) as total_users,
+                {city_pcts}
+            FROM city_order c
+            LEFT JOIN city_retention r ON c.city = r.city
+            ORDER BY c.first_seen, c.city
+        """, params)
+    
+    def get_event_type_counts(self, date_range=None, event_types=None, cities=None):
+        """Events per event type, most common first"""
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            SELECT event_type, COUNT(*) as count
+            FROM events
+            {where}
+            GROUP BY event_type
+            ORDER BY count DESC, event_type
+        """, params)
+    
+    def get_event_types_by_city(self, date_range=None, event_types=None, cities=None):
+        """Events per (city, event type)"""
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            SELECT city, event_type, COUNT(*) as count
+            FROM events
+            {where}
+            GROUP BY city, event_type
+            ORDER BY city, event_type
+        """, params)
+    
+    def get_session_histogram(self, bins=50, date_range=None, event_types=None, cities=None):
+        """
+        Session duration histogram over equal-width bins spanning the
+        filtered minimum to maximum (bin_start, bin_end, count)
+        """
+        where, params = _filter_clause(date_range, event_types, cities)
+        bounds = self._query(f"""
+            SELECT MIN(session_duration) as lo, MAX(session_duration) as hi
+            FROM events
+            {where}
+        """, params).iloc[0]
+        if pd.isna(bounds['lo']):
+            return pd.DataFrame({'bin_start': [], 'bin_end': [], 'count': []})
+        
+        lo, hi = float(bounds['lo']), float(bounds['hi'])
+        width = (hi - lo) / bins if hi > lo else 1.0
+        counts = self._query(f"""
+            SELECT 
+                LEAST(CAST(FLOOR((session_duration - {lo}) / {width}) AS BIGINT), {bins - 1}) as bin,
+                COUNT(*) as count
+            FROM events
+            {where}
+            GROUP BY bin
+        """, params)
+        
+        hist = np.zeros(bins, dtype=np.int64)
+        hist[counts['bin'].to_numpy()] = counts['count'].to_numpy()
+        edges = lo + width * np.arange(bins + 1)
+        return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:], 'count': hist})
+    
+    def get_hourly_counts(self, date_range=None, event_types=None, cities=None):
+        """Events per hour of day"""
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            SELECT 
+                {self.hour_sql} as hour,
+                COUNT(*) as event_count
+            FROM events
+            {where}
+            GROUP BY 1
+            ORDER BY hour
+        """, params)
+    
+    def get_weekday_activity(self, date_range=None, event_types=None, cities=None):
+        """Events and unique users per day of week, Monday first"""
+        where, params = _filter_clause(date_range, event_types, cities)
+        df = self._query(f"""
+            SELECT 
+                {self.weekday_sql} as weekday,
+                COUNT(*) as events,
+                COUNT(DISTINCT user_id) as users
+            FROM events
+            {where}
+            GROUP BY 1
+        """, params)
+        df.insert(0, 'day_of_week', np.array(DAY_ORDER, dtype=object)[df.pop('weekday')])
+        df['day_of_week'] = pd.Categorical(df['day_of_week'], categories=DAY_ORDER, ordered=True)
+        return df.sort_values('day_of_week').reset_index(drop=True)
+    
+    def get_event_points(self, limit=2000, date_range=None, event_types=None, cities=None,
+                         bbox=None):
+        """Individual events (location, city, type, duration), at most limit"""
+        where, params = _filter_clause(date_range, event_types, cities, bbox)
+        return self._query(f"""
+            SELECT latitude, longitude, city, event_type, session_duration
+            FROM events
+            {where}
+            LIMIT {int(limit)}
+        """, params)
+    
+    def get_density_cells(self, n_cells, date_range=None, event_types=None, cities=None):
+        """
+        Events binned to an n_cells x n_cells Web Mercator raster (ix, iy,
+        events); input for density_raster.density_from_cells()
+        """
+        where, params = _filter_clause(date_range, event_types, cities)
+        return self._query(f"""
+            WITH projected AS (
+                SELECT 
+                    (longitude + 180.0) / 360.0 as fx,
+                    RADIANS(LEAST(GREATEST(latitude, -85.05112878), 85.05112878)) as lat
+                FROM events
+                {where}
+            )
+            SELECT 
+                LEAST(CAST(FLOOR(fx * {int(n_cells)}) AS BIGINT), {int(n_cells) - 1}) as ix,
+                LEAST(CAST(FLOOR((1.0 - LN(TAN(lat) + 1.0 / COS(lat)) / PI()) / 2.0
+                                 * {int(n_cells)}) AS BIGINT), {int(n_cells) - 1}) as iy,
+                COUNT(*) as events
+            FROM projected
+            GROUP BY ix, iy
+        """, params)
+    
+    def on_cursor(self):
+        """
+        Copy of this analytics bound to its own cursor, for a background
+        thread: even queries that use self.con never touch the connection
+        the sessions share
+        """
+        analytics = copy.copy(self)
+        analytics.con = self.con.cursor()
+        for name, table in self.arrow_tables.items():
+            analytics.con.register(name, table)
+        return analytics
+    
     def close(self):
         """Close database connection"""
         self.con.close()
@@ -345,12 +863,19 @@ def run_all_queries():
     print(overall.to_string(index=False))
     
     # 8. Top locations
-    print("\n📍 TOP 10 MOST ACTIVE LOCATIONS")
+    print("\n📍 TOP 10 MOST ACTIVE LOCATIONS (H3 resolution 8)")
     print("-" * 70)
     df = analytics.get_top_locations()
     print(df.to_string(index=False))
     
-    # 9. Session duration distribution
+    # 9. Hex hotspots
+    print("\n🔥 HEX HOTSPOTS (top 10% by events)")
+    print("-" * 70)
+    df = analytics.get_hex_hotspots()
+    print(f"{len(df)} hotspot hexagons")
+    print(df.head(10).to_string(index=False))
+    
+    # 10. Session duration distribution
     print("\n⏲️  SESSION DURATION DISTRIBUTION")
     print("-" * 70)
     df = analytics.get_session_duration_distribution()
@@ -33,22 +33,10 @@ pip install -r requirements.txt
 echo "✓ Dependencies installed"
 echo ""
 
-# Generate data
-echo "Generating synthetic location data..."
-python generate_location_data.py
-echo "✓ Data generated"
-echo ""
-
-# Run queries
-echo "Creating DuckDB database and running queries..."
-python queries.py
-echo "✓ Database created"
-echo ""
-
-# Run spatial analysis
-echo "Performing geospatial analysis..."
-python spatial_analysis.py
-echo "✓ Spatial analysis complete"
+# Build data, database and spatial artifacts (cached, independent stages in parallel)
+echo "Building data, DuckDB database and geospatial artifacts..."
+python pipeline.py
+echo "✓ Artifacts built"
 echo ""
 
 echo "=================================="
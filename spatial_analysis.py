@@ -3,13 +3,312 @@ Geospatial Analysis with H3 Hexagonal Binning
 Performs advanced spatial analytics on location events
 """
 
+import duckdb
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import Point, Polygon
+import shapely
+from shapely.geometry import Point, Polygon, shape
+from shapely.strtree import STRtree
 import h3
+import h3.api.basic_int as h3_int
 import json
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from scipy import sparse, stats
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 from collections import defaultdict
+from itertools import chain
+
+import vector_tiles
+from density_raster import DensityRasters
+from hex_cube import HexTimeCube
+from od_flows import ODMatrix
+from out_of_core import aggregate_out_of_core
+from queries import RETENTION_WINDOWS, LocationAnalytics, events_fingerprint
+
+EARTH_RADIUS_KM = 6371.0
+
+# Exported spatial layer formats and their file extensions
+SPATIAL_FORMATS = {'geojson': '.geojson', 'parquet': '.parquet', 'fgb': '.fgb'}
+
+def user_retention_flags(events):
+    """
+    Per-user first event (hex, city, date, row position) and whether the
+    user returned in each retention window, computed with a single sort
+    events needs user_id, timestamp and city columns; first_hex is only
+    included when it has h3_index
+    """
+    columns = ['user_id', 'timestamp', 'h3_index', 'city'] if 'h3_index' in events \
+        else ['user_id', 'timestamp', 'city']
+    events = events[columns].assign(first_row=np.arange(len(events)))
+    
+    # Get user first event (hex, city, timestamp) with a single sort
+    user_first = events.sort_values('timestamp').groupby('user_id').agg(
+        {name: 'first' for name in columns[1:] + ['first_row']}
+    )
+    user_first = user_first.rename(columns={'timestamp': 'first_event_date',
+                                            'h3_index': 'first_hex'})
+    user_first['first_event_date'] = pd.to_datetime(user_first['first_event_date'])
+    
+    # Calculate days since first event for every event
+    first_event_date = events['user_id'].map(user_first['first_event_date'])
+    days_since_first = (pd.to_datetime(events['timestamp']) - first_event_date).dt.days
+    
+    # Flag users returning in each retention window
+    for name, (lo, hi) in RETENTION_WINDOWS.items():
+        returned = events.loc[days_since_first.between(lo, hi), 'user_id'].unique()
+        user_first[name] = user_first.index.isin(returned)
+    
+    return user_first
+
+def hex_retention(events, user_hex_first=None):
+    """
+    D1/D7/D30 retention of users grouped by the hex of their first event
+    (user_hex_first: precomputed user_retention_flags() of events)
+    """
+    if user_hex_first is None:
+        user_hex_first = user_retention_flags(events)
+    
+    # Count returning users per first hex in one grouped pass
+    retention_df = user_hex_first.groupby('first_hex', sort=False).agg(
+        city=('city', 'first'),
+        total_users=('city', 'size'),
+        d1=('d1', 'sum'),
+        d7=('d7', 'sum'),
+        d30=('d30', 'sum')
+    )
+    for name in RETENTION_WINDOWS:
+        retention_df[f'{name}_retention_pct'] = (
+            retention_df[name] / retention_df['total_users'] * 100
+        )
+    
+    # Keep hexes in order of first appearance in the event data
+    hex_order = pd.unique(events['user_id'].map(user_hex_first['first_hex']))
+    retention_df = retention_df.loc[hex_order].rename_axis('h3_index').reset_index()
+    return retention_df[['h3_index', 'city', 'total_users', 'd1_retention_pct',
+                         'd7_retention_pct', 'd30_retention_pct']]
+
+def hex_geodataframe(hex_stats):
+    """
+    Add center, boundary polygon, area and event density to per-hex stats
+    hex_stats needs h3_index and event_count columns
+    """
+    # Add hex center coordinates
+    hex_stats['center_lat'] = hex_stats['h3_index'].apply(
+        lambda x: h3.cell_to_latlng(x)[0]
+    )
+    hex_stats['center_lon'] = hex_stats['h3_index'].apply(
+        lambda x: h3.cell_to_latlng(x)[1]
+    )
+    
+    # Add hex boundaries as polygons (H3 returns lat/lng, shapely wants lon/lat)
+    hex_stats['geometry'] = hex_stats['h3_index'].apply(
+        lambda x: Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(x)])
+    )
+    
+    # Create GeoDataFrame
+    hex_gdf = gpd.GeoDataFrame(hex_stats, geometry='geometry', crs='EPSG:4326')
+    
+    # Calculate exact hex area in km² (no projection distortion)
+    hex_gdf['area_km2'] = hex_gdf['h3_index'].apply(lambda x: h3.cell_area(x, unit='km^2'))
+    
+    # Calculate event density (events per km²)
+    hex_gdf['event_density'] = hex_gdf['event_count'] / hex_gdf['area_km2']
+    
+    return hex_gdf
+
+def _share_arrays(arrays):
+    """Copy numpy arrays into named shared memory blocks"""
+    handles, specs = {}, {}
+    for name, arr in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        handles[name] = shm
+        specs[name] = (shm.name, arr.dtype.str, len(arr))
+    return handles, specs
+
+def _city_partition_stages(city, arrays, resolution, k):
+    """
+    Spatial stages for one city's events: H3 indexing, hex aggregates and
+    k-ring adjacency
+    """
+    lat, lon = arrays['latitude'].tolist(), arrays['longitude'].tolist()
+    cells = np.fromiter(
+        (h3_int.latlng_to_cell(a, b, resolution) for a, b in zip(lat, lon)),
+        dtype=np.uint64, count=len(lat)
+    )
+    arrays['h3_cell'][:] = cells
+    
+    events = pd.DataFrame({
+        'user_id': arrays['user_code'],
+        'h3_index': cells,
+        'city': city,
+        'session_duration': arrays['session_duration']
+    })
+    
+    # Mergeable hex aggregates
+    hex_stats = events.groupby('h3_index').agg(
+        event_count=('user_id', 'size'),
+        unique_users=('user_id', 'nunique'),
+        duration_sum=('session_duration', 'sum')
+    ).reset_index()
+    hex_ids = hex_stats['h3_index'].tolist()
+    centers = [h3_int.cell_to_latlng(c) for c in hex_ids]
+    hex_stats['city'] = city
+    hex_stats['center_lat'] = [c[0] for c in centers]
+    hex_stats['center_lon'] = [c[1] for c in centers]
+    hex_stats['geometry'] = shapely.to_wkb([
+        Polygon([(lng, lat) for lat, lng in h3_int.cell_to_boundary(c)]) for c in hex_ids
+    ])
+    hex_stats['area_km2'] = [h3_int.cell_area(c, unit='km^2') for c in hex_ids]
+    
+    # k-ring adjacency as (cell, neighbor) id pairs
+    disks = [h3_int.grid_disk(c, k) for c in hex_ids]
+    ring_sizes = np.fromiter((len(d) for d in disks), dtype=np.int64, count=len(disks))
+    neighbors = pd.DataFrame({
+        'cell': np.repeat(hex_stats['h3_index'].to_numpy(), ring_sizes),
+        'neighbor': np.fromiter(chain.from_iterable(disks), dtype=np.uint64,
+                                count=ring_sizes.sum())
+    })
+    
+    return hex_stats, neighbors
+
+def _ring_positions(cells, rows, neighbor_cells):
+    """
+    (rows, cols) adjacency from ring member ids; members not in cells (no
+    events) are numbered from len(cells) on, once per distinct cell
+    """
+    cols = cells.get_indexer(neighbor_cells)
+    empty = cols < 0
+    cols[empty] = len(cells) + pd.factorize(neighbor_cells[empty])[0]
+    return rows, cols
+
+def _process_city_partition(task):
+    """Process pool entry point: attach to shared arrays and run one city"""
+    city, start, stop, specs, resolution, k = task
+    
+    handles, arrays = [], {}
+    for name, (shm_name, dtype, length) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        handles.append(shm)
+        arrays[name] = np.ndarray((length,), dtype=dtype, buffer=shm.buf)[start:stop]
+    
+    try:
+        return _city_partition_stages(city, arrays, resolution, k)
+    finally:
+        arrays.clear()
+        for shm in handles:
+            shm.close()
+
+def write_spatial_layer(gdf, stem, formats=tuple(SPATIAL_FORMATS)):
+    """Write a GeoDataFrame as <stem>.<ext> for each requested format"""
+    paths = []
+    for fmt in formats:
+        path = f"{stem}{SPATIAL_FORMATS[fmt]}"
+        if fmt == 'parquet':
+            gdf.to_parquet(path)
+        elif fmt == 'fgb':
+            gdf.to_file(path, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+        else:
+            gdf.to_file(path, driver='GeoJSON')
+        paths.append(path)
+    return paths
+
+def compare_spatial_formats(stem, formats=tuple(SPATIAL_FORMATS)):
+    """
+    Print the file size and full-load time of each exported format vs
+    GeoJSON; returns only the sizes, since load times differ run to run
+    """
+    results = {}
+    for fmt in formats:
+        path = f"{stem}{SPATIAL_FORMATS[fmt]}"
+        start = time.perf_counter()
+        if fmt == 'parquet':
+            gpd.read_parquet(path)
+        else:
+            gpd.read_file(path)
+        results[fmt] = {
+            'size_mb': round(os.path.getsize(path) / 1e6, 3),
+            'load_seconds': time.perf_counter() - start
+        }
+    
+    baseline = results.get('geojson')
+    print(f"\n  Export formats ({stem}):")
+    for fmt, result in results.items():
+        line = f"    {fmt:8s}: {result['size_mb']:8.3f} MB, load {result['load_seconds']:.3f}s"
+        if baseline and fmt != 'geojson':
+            line += (f"  ({result['size_mb'] / baseline['size_mb']:.0%} size, "
+                     f"{baseline['load_seconds'] / max(result['load_seconds'], 1e-9):.1f}x faster)")
+        print(line)
+    
+    return {fmt: {'size_mb': result['size_mb']} for fmt, result in results.items()}
+
+class SpatialIndex:
+    """
+    KD-tree over points on the unit sphere for radius and k-nearest queries
+    Chord distances in 3D are monotonic in great-circle distance
+    """
+    
+    def __init__(self, lats, lons, data=None):
+        """Build index from coordinate arrays, with optional per-point attributes"""
+        self.tree = cKDTree(self._to_unit_xyz(lats, lons))
+        self.data = data.reset_index(drop=True) if data is not None else None
+    
+    @staticmethod
+    def _to_unit_xyz(lats, lons):
+        """Convert lat/lon degrees to unit-sphere xyz"""
+        lat = np.radians(np.atleast_1d(np.asarray(lats, dtype=float)))
+        lon = np.radians(np.atleast_1d(np.asarray(lons, dtype=float)))
+        return np.column_stack([
+            np.cos(lat) * np.cos(lon),
+            np.cos(lat) * np.sin(lon),
+            np.sin(lat)
+        ])
+    
+    @staticmethod
+    def _km_to_chord(radius_km):
+        return 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM))
+    
+    @staticmethod
+    def _chord_to_km(chord):
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+    
+    def radius_count(self, lats, lons, radius_km):
+        """Number of indexed points within radius_km of each probe point"""
+        probes = self._to_unit_xyz(lats, lons)
+        return self.tree.query_ball_point(
+            probes, self._km_to_chord(radius_km), return_length=True
+        )
+    
+    def radius_members(self, lats, lons, radius_km):
+        """Flat (probe position, point position) pairs within radius_km"""
+        probes = self._to_unit_xyz(lats, lons)
+        hits = self.tree.query_ball_point(probes, self._km_to_chord(radius_km))
+        sizes = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+        probe_idx = np.repeat(np.arange(len(probes)), sizes)
+        point_idx = np.fromiter(chain.from_iterable(hits), dtype=np.int64, count=sizes.sum())
+        return probe_idx, point_idx
+    
+    def radius_aggregate(self, lats, lons, radius_km, column, agg='sum'):
+        """
+        Aggregate an attribute over points within radius_km of each probe
+        agg is any pandas groupby aggregation ('sum', 'mean', 'nunique', ...)
+        """
+        probe_idx, point_idx = self.radius_members(lats, lons, radius_km)
+        values = pd.Series(self.data[column].to_numpy()[point_idx])
+        n_probes = len(np.atleast_1d(lats))
+        return values.groupby(probe_idx).agg(agg).reindex(range(n_probes))
+    
+    def nearest(self, lats, lons, k=5):
+        """Positions of and distances (km) to the k nearest points per probe"""
+        probes = self._to_unit_xyz(lats, lons)
+        chord, idx = self.tree.query(probes, k=k)
+        return self._chord_to_km(chord), idx
 
 class GeospatialAnalyzer:
     """
@@ -30,9 +329,72 @@ class GeospatialAnalyzer:
             crs='EPSG:4326'
         )
         
+        # Retention results and k-ring adjacency keyed by H3 resolution
+        self._retention_cache = {}
+        self._neighbor_cache = {}
+        self.gi_k = None
+        
         print(f"  ✓ Loaded {len(self.df):,} events")
         print(f"  ✓ Covering {self.df['city'].nunique()} cities")
     
+    @classmethod
+    def from_hex_layer(cls, hex_gdf, resolution):
+        """
+        Analyzer over precomputed hex aggregates without event-level data
+        (supports hotspot, density and export stages)
+        """
+        analyzer = cls.__new__(cls)
+        analyzer._set_hex_layer(hex_gdf, resolution)
+        return analyzer
+    
+    def _set_hex_layer(self, hex_gdf, resolution):
+        """Make hex_gdf the current layer; caches of the previous one are dropped"""
+        self.resolution = resolution
+        self.hex_gdf = hex_gdf
+        self.gi_k = None
+        self._retention_cache = {}
+        self._neighbor_cache = {}
+    
+    @classmethod
+    def out_of_core(cls, source='location_events.csv', resolution=8, chunksize=1_000_000):
+        """
+        Analyzer for event files larger than memory: streams source (CSV or
+        Parquet) in chunks into exact per-hex and per-user aggregates, so
+        hex, hotspot and retention outputs match the in-memory analyzer
+        """
+        print(f"🗺️  Streaming {source} in chunks of {chunksize:,} events...")
+        print(f"\n🔷 Creating H3 hexagonal bins (resolution {resolution})...")
+        
+        hex_stats, retention_df = aggregate_out_of_core(
+            source, RETENTION_WINDOWS, resolution, chunksize
+        )
+        hex_gdf = hex_geodataframe(hex_stats)
+        
+        print(f"  ✓ Created {len(hex_gdf):,} hexagonal bins")
+        print(f"  ✓ Average hex area: {hex_gdf['area_km2'].mean():.2f} km²")
+        
+        analyzer = cls.from_hex_layer(hex_gdf, resolution)
+        analyzer._retention_cache[resolution] = retention_df
+        return analyzer
+    
+    @classmethod
+    def from_duckdb(cls, db_path='location_analytics.duckdb', resolution=8):
+        """
+        Analyzer over hex aggregates computed in SQL from the DuckDB events
+        table's H3 columns, without loading events into pandas
+        """
+        print(f"\n🦆 Aggregating H3 hexagons in DuckDB (resolution {resolution})...")
+        
+        analytics = LocationAnalytics.open(db_path)
+        try:
+            hex_stats = analytics.get_hex_aggregates(resolution)
+        finally:
+            analytics.con.close()
+        hex_gdf = hex_geodataframe(hex_stats)
+        
+        print(f"  ✓ Loaded {len(hex_gdf):,} hexagonal bins")
+        return cls.from_hex_layer(hex_gdf, resolution)
+    
     def create_h3_hexagons(self, resolution=8):
         """
         Create H3 hexagonal bins and aggregate events
@@ -57,61 +419,472 @@ class GeospatialAnalyzer:
         hex_stats.columns = ['h3_index', 'event_count', 'unique_users', 
                             'avg_session_duration', 'city']
         
-        # Add hex center coordinates
-        hex_stats['center_lat'] = hex_stats['h3_index'].apply(
-            lambda x: h3.cell_to_latlng(x)[0]
-        )
-        hex_stats['center_lon'] = hex_stats['h3_index'].apply(
-            lambda x: h3.cell_to_latlng(x)[1]
+        hex_gdf = hex_geodataframe(hex_stats)
+        
+        print(f"  ✓ Created {len(hex_gdf):,} hexagonal bins")
+        print(f"  ✓ Average hex area: {hex_gdf['area_km2'].mean():.2f} km²")
+        
+        self._set_hex_layer(hex_gdf, resolution)
+        return hex_gdf
+    
+    def create_h3_hexagons_parallel(self, resolution=8, k=1, workers=None):
+        """
+        Parallel per-city version of the hex stages: events are partitioned by
+        city and H3 indexing, hex aggregation and k-ring adjacency run in a
+        process pool. Numeric event columns are passed through shared memory
+        instead of being pickled.
+        Results match create_h3_hexagons() (distinct users of hexes split
+        across cities are recounted). Retention cohorts span cities, so users'
+        first events and return windows are found over all events while the
+        workers run, and only their first hexes come from the partitions.
+        """
+        workers = workers or os.cpu_count()
+        print(f"\n🔷 Creating H3 hexagonal bins (resolution {resolution}, "
+              f"{workers} workers)...")
+        
+        # Partition events by city with one stable sort
+        city_codes, city_names = pd.factorize(self.df['city'])
+        order = np.argsort(city_codes, kind='stable')
+        bounds = np.searchsorted(city_codes[order], np.arange(len(city_names) + 1))
+        user_codes = pd.factorize(self.df['user_id'])[0]
+        
+        columns = {
+            'latitude': self.df['latitude'].to_numpy(dtype=np.float64)[order],
+            'longitude': self.df['longitude'].to_numpy(dtype=np.float64)[order],
+            'user_code': user_codes[order],
+            'session_duration': self.df['session_duration'].to_numpy(dtype=np.float64)[order],
+            'h3_cell': np.zeros(len(self.df), dtype=np.uint64)
+        }
+        handles, specs = _share_arrays(columns)
+        del columns
+        
+        # Largest cities first for better load balance
+        tasks = [
+            (city, bounds[i], bounds[i + 1], specs, resolution, k)
+            for i, city in enumerate(city_names)
+        ]
+        tasks.sort(key=lambda t: t[2] - t[1], reverse=True)
+        
+        try:
+            hex_parts, neighbor_parts = [], []
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_process_city_partition, t) for t in tasks]
+                
+                # Retention cohorts over all cities, while the workers run
+                user_first = user_retention_flags(self.df[['user_id', 'timestamp', 'city']])
+                
+                # Collected in submission order, so merges are deterministic
+                for task, future in zip(tasks, futures):
+                    hex_stats, neighbors = future.result()
+                    hex_parts.append(hex_stats)
+                    neighbor_parts.append(neighbors)
+                    print(f"  ✓ {task[0]}: {len(hex_stats):,} hexagons")
+            
+            # H3 index of each event, back in original row order
+            cell_buffer = np.ndarray((len(self.df),), dtype=np.uint64,
+                                     buffer=handles['h3_cell'].buf)
+            event_cells = np.empty(len(self.df), dtype=np.uint64)
+            event_cells[order] = cell_buffer
+            del cell_buffer
+        finally:
+            for shm in handles.values():
+                shm.close()
+                shm.unlink()
+        
+        cell_names = pd.Series(np.unique(event_cells))
+        cell_names = pd.Series(
+            [h3.int_to_str(c) for c in cell_names.tolist()], index=cell_names.to_numpy()
         )
+        self.df['h3_index'] = cell_names.loc[event_cells].to_numpy()
         
-        # Add hex boundaries as polygons
-        hex_stats['geometry'] = hex_stats['h3_index'].apply(
-            lambda x: Polygon(h3.cell_to_boundary(x))
+        # Merge partitions; a hex split across cities keeps its busiest city
+        parts = pd.concat(hex_parts).sort_values('event_count', ascending=False, kind='stable')
+        hex_stats = parts.groupby('h3_index').agg(
+            event_count=('event_count', 'sum'),
+            unique_users=('unique_users', 'sum'),
+            duration_sum=('duration_sum', 'sum'),
+            city=('city', 'first'),  # city of the busiest hex
+            center_lat=('center_lat', 'first'),
+            center_lon=('center_lon', 'first'),
+            geometry=('geometry', 'first'),
+            area_km2=('area_km2', 'first')
         )
         
-        # Create GeoDataFrame
-        hex_gdf = gpd.GeoDataFrame(hex_stats, geometry='geometry', crs='EPSG:4326')
+        # Distinct users do not add up across partitions: recount split hexes
+        partition_counts = parts['h3_index'].value_counts()
+        split = partition_counts.index[partition_counts > 1].to_numpy(dtype=np.uint64)
+        if len(split):
+            in_split = np.isin(event_cells, split)
+            split_users = pd.Series(user_codes[in_split]).groupby(event_cells[in_split]).nunique()
+            hex_stats.loc[split_users.index, 'unique_users'] = split_users.to_numpy()
         
-        # Calculate hex area in km²
-        hex_gdf = hex_gdf.to_crs('EPSG:3857')  # Project to meters
-        hex_gdf['area_km2'] = hex_gdf.geometry.area / 1e6
-        hex_gdf = hex_gdf.to_crs('EPSG:4326')  # Back to lat/lon
+        hex_stats.index = cell_names.loc[hex_stats.index].to_numpy()
+        hex_stats = hex_stats.sort_index().rename_axis('h3_index').reset_index()
+        hex_stats['avg_session_duration'] = hex_stats['duration_sum'] / hex_stats['event_count']
+        hex_stats['geometry'] = shapely.from_wkb(hex_stats['geometry'].to_numpy())
         
-        # Calculate event density (events per km²)
+        hex_gdf = gpd.GeoDataFrame(
+            hex_stats[['h3_index', 'event_count', 'unique_users', 'avg_session_duration',
+                       'city', 'center_lat', 'center_lon', 'geometry', 'area_km2']],
+            geometry='geometry', crs='EPSG:4326'
+        )
         hex_gdf['event_density'] = hex_gdf['event_count'] / hex_gdf['area_km2']
         
+        # Seed the adjacency and retention caches used by later stages
+        self._set_hex_layer(hex_gdf, resolution)
+        hex_positions = pd.Index(
+            [h3.str_to_int(c) for c in hex_gdf['h3_index']], dtype=np.uint64
+        )
+        neighbors = pd.concat(neighbor_parts).drop_duplicates()
+        self._neighbor_cache[(resolution, k)] = _ring_positions(
+            hex_positions, hex_positions.get_indexer(neighbors['cell'].to_numpy()),
+            neighbors['neighbor'].to_numpy()
+        )
+        
+        user_first['first_hex'] = self.df['h3_index'].to_numpy()[user_first['first_row'].to_numpy()]
+        self._retention_cache[resolution] = hex_retention(self.df, user_first)
+        
         print(f"  ✓ Created {len(hex_gdf):,} hexagonal bins")
         print(f"  ✓ Average hex area: {hex_gdf['area_km2'].mean():.2f} km²")
         
-        self.hex_gdf = hex_gdf
         return hex_gdf
     
-    def identify_hotspots(self, percentile=90):
+    def hex_layer_at_resolution(self, resolution):
         """
-        Identify high-activity hotspots
+        Hex aggregates at a coarser H3 resolution, rolled up from the
+        events' current cells (distinct users are recounted exactly)
+        """
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        if resolution == self.resolution:
+            return self.hex_gdf
+        if resolution > self.resolution:
+            raise ValueError(f"Resolution {resolution} is finer than the base "
+                             f"resolution {self.resolution}")
+        
+        # Parent lookups once per distinct cell, then mapped onto events
+        cells = self.df['h3_index'].unique()
+        parents = pd.Series([h3.cell_to_parent(c, resolution) for c in cells], index=cells)
+        events = self.df[['user_id', 'session_duration', 'city']].assign(
+            h3_index=self.df['h3_index'].map(parents)
+        )
+        
+        hex_stats = events.groupby('h3_index').agg(
+            event_count=('user_id', 'size'),
+            unique_users=('user_id', 'nunique'),
+            avg_session_duration=('session_duration', 'mean')
+        )
+        
+        # Most common city per hex without a per-group lambda
+        city_counts = events.groupby(['h3_index', 'city']).size().sort_values(ascending=False)
+        top_city = city_counts.reset_index().drop_duplicates('h3_index').set_index('h3_index')
+        hex_stats['city'] = top_city['city']
+        
+        return hex_geodataframe(hex_stats.reset_index())
+    
+    def build_vector_tiles(self, path='hex_tiles.mbtiles', zoom_bands=None):
+        """
+        Offline stage: render hex aggregates into a z/x/y vector tile pyramid
+        (one H3 resolution per zoom band) stored as MBTiles
+        """
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        zoom_bands = zoom_bands or vector_tiles.DEFAULT_ZOOM_BANDS
+        layers = {
+            resolution: self.hex_layer_at_resolution(resolution)
+            for resolution in set(zoom_bands.values())
+        }
+        
+        return vector_tiles.write_mbtiles(layers, path, zoom_bands)
+    
+    def build_time_cube(self, path='hex_cube'):
+        """
+        Precompute the sparse hex x weekday x hour activity cube
+        """
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        return HexTimeCube.build(self.df, path, resolution=self.resolution)
+    
+    def build_density_rasters(self, path='density_rasters'):
         """
-        print(f"\n🔥 Identifying hotspots (top {100-percentile}%)...")
+        Precompute per-zoom KDE density rasters of all events for the heatmap
+        """
+        con = duckdb.connect()
+        con.register('events', self.df[['event_id']])
+        data_version = events_fingerprint(con)
+        con.close()
+        return DensityRasters.build(self.df, path, data_version=data_version)
+    
+    def build_od_flows(self, max_gap_minutes=60, event_types=None, path='od_flows.npz'):
+        """
+        Origin-destination trip matrix between hexes from consecutive
+        per-user events no more than max_gap_minutes apart
+        """
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        print(f"\n🔀 Building hex origin-destination flows (gap <= {max_gap_minutes} min)...")
+        
+        od = ODMatrix.from_events(self.df, self.resolution, max_gap_minutes, event_types)
+        od.save(path)
+        self.od_flows = od
+        
+        print(f"  ✓ {int(od.matrix.sum()):,} trips over {od.matrix.nnz:,} hex pairs")
+        print(f"  ✓ Saved: {path}")
+        
+        return od
+    
+    def _hex_neighbors(self, k=1):
+        """
+        Sparse k-ring adjacency of the cells of hex_gdf
+        Returns (rows, cols) position arrays, each cell including itself;
+        cols at len(hex_gdf) and beyond number the ring cells without events
+        """
+        key = (self.resolution, k)
+        if key in self._neighbor_cache:
+            return self._neighbor_cache[key]
+        
+        # Integer cells skip H3's per-neighbor string conversion
+        cells = np.array([h3.str_to_int(c) for c in self.hex_gdf['h3_index'].tolist()],
+                         dtype=np.uint64)
+        disks = [h3_int.grid_disk(cell, k) for cell in cells.tolist()]
+        ring_sizes = np.fromiter((len(d) for d in disks), dtype=np.int64, count=len(disks))
+        
+        # Flatten rings and map neighbor ids to hex positions
+        rows = np.repeat(np.arange(len(cells)), ring_sizes)
+        neighbor_cells = np.fromiter(chain.from_iterable(disks), dtype=np.uint64, count=ring_sizes.sum())
+        
+        neighbors = _ring_positions(pd.Index(cells), rows, neighbor_cells)
+        self._neighbor_cache[key] = neighbors
+        return neighbors
+    
+    def calculate_gi_star(self, k=1, value_col='event_density'):
+        """
+        Getis-Ord Gi* hotspot statistic over H3 k-ring neighborhoods
+        Adds gi_zscore and gi_pvalue (two-sided) columns to hex_gdf
+        """
+        print(f"\n📐 Calculating Getis-Ord Gi* (k-ring {k})...")
         
         if not hasattr(self, 'hex_gdf'):
             self.create_h3_hexagons()
         
-        # Calculate threshold
-        threshold = self.hex_gdf['event_density'].quantile(percentile / 100)
+        rows, cols = self._hex_neighbors(k)
+        n_hex = len(self.hex_gdf)
+        
+        # Ring cells without events are part of the study area with value zero
+        x = np.zeros(max(n_hex, cols.max() + 1 if len(cols) else 0))
+        x[:n_hex] = self.hex_gdf[value_col].to_numpy(dtype=float)
+        n = len(x)
+        
+        # Binary weights: neighborhood sums and sizes in one vectorized pass
+        local_sum = np.bincount(rows, weights=x[cols], minlength=n_hex)
+        weight_sum = np.bincount(rows, minlength=n_hex).astype(float)
+        
+        x_mean = x.mean()
+        s = np.sqrt((x ** 2).mean() - x_mean ** 2)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denom = s * np.sqrt((n * weight_sum - weight_sum ** 2) / (n - 1))
+            z = (local_sum - x_mean * weight_sum) / denom
+        z = np.where(np.isfinite(z), z, 0.0)
+        
+        self.hex_gdf['gi_zscore'] = z
+        self.hex_gdf['gi_pvalue'] = 2 * stats.norm.sf(np.abs(z))
+        self.gi_k = k
+        
+        print(f"  ✓ Scored {n_hex:,} hexagons ({len(rows):,} neighbor pairs, "
+              f"{n - n_hex:,} empty neighbors)")
         
-        # Identify hotspots
-        hotspots = self.hex_gdf[self.hex_gdf['event_density'] >= threshold].copy()
-        hotspots = hotspots.sort_values('event_density', ascending=False)
+        return self.hex_gdf[['h3_index', 'gi_zscore', 'gi_pvalue']]
+    
+    def identify_hotspots(self, percentile=90, method='gi_star', k=1, alpha=0.05):
+        """
+        Identify high-activity hotspots
+        method='gi_star': significant positive Gi* z-scores (p < alpha)
+        method='percentile': top (100 - percentile)% of event density
+        """
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        if method == 'gi_star':
+            if 'gi_zscore' not in self.hex_gdf.columns or self.gi_k != k:
+                self.calculate_gi_star(k=k)
+            
+            print(f"\n🔥 Identifying hotspots (Gi* p < {alpha})...")
+            
+            is_hot = (self.hex_gdf['gi_zscore'] > 0) & (self.hex_gdf['gi_pvalue'] < alpha)
+            hotspots = self.hex_gdf[is_hot].copy()
+            hotspots = hotspots.sort_values('gi_zscore', ascending=False)
+            
+            print(f"  ✓ Found {len(hotspots)} hotspots")
+        elif method == 'percentile':
+            print(f"\n🔥 Identifying hotspots (top {100-percentile}%)...")
+            
+            # Calculate threshold
+            threshold = self.hex_gdf['event_density'].quantile(percentile / 100)
+            
+            # Identify hotspots
+            hotspots = self.hex_gdf[self.hex_gdf['event_density'] >= threshold].copy()
+            hotspots = hotspots.sort_values('event_density', ascending=False)
+            
+            print(f"  ✓ Found {len(hotspots)} hotspots")
+            print(f"  ✓ Density threshold: {threshold:.1f} events/km²")
+        else:
+            raise ValueError(f"Unknown hotspot method: {method}")
         
-        print(f"  ✓ Found {len(hotspots)} hotspots")
-        print(f"  ✓ Density threshold: {threshold:.1f} events/km²")
         print(f"\n  Top 5 Hotspots:")
         for idx, row in hotspots.head().iterrows():
+            gi = f", Gi* z={row['gi_zscore']:.2f}" if 'gi_zscore' in hotspots.columns else ""
             print(f"    {row['city']:15s}: {row['event_density']:6.1f} events/km² "
-                  f"({row['event_count']:,} events)")
+                  f"({row['event_count']:,} events{gi})")
+        
+        # Remembered for export, tied to the hex layer it was computed from
+        self.hotspots = hotspots
+        self._hotspots_layer = self.hex_gdf
         
         return hotspots
     
+    def hotspot_clusters(self, hotspots=None, min_cells=1):
+        """
+        Group adjacent hotspot hexes into contiguous "hot districts"
+        Connected components of the hot-cell 1-ring adjacency graph, with
+        dissolved polygons, total events/users, area and centroid.
+        unique_users is exact when event-level data is loaded, otherwise
+        the sum of per-hex unique users (an upper bound)
+        """
+        if hotspots is None:
+            if getattr(self, '_hotspots_layer', None) is self.hex_gdf:
+                hotspots = self.hotspots
+            else:
+                hotspots = self.identify_hotspots()
+        
+        print(f"\n🧩 Clustering {len(hotspots):,} hotspot hexes into contiguous zones...")
+        
+        # Keep only adjacency edges with both ends hot, renumbered 0..n_hot-1
+        hot_pos = pd.Index(self.hex_gdf['h3_index']).get_indexer(hotspots['h3_index'])
+        local = np.full(len(self.hex_gdf), -1, dtype=np.int64)
+        local[hot_pos] = np.arange(len(hot_pos))
+        rows, cols = self._hex_neighbors(1)
+        present = cols < len(self.hex_gdf)
+        rows, cols = rows[present], cols[present]
+        both_hot = (local[rows] >= 0) & (local[cols] >= 0)
+        graph = sparse.csr_matrix(
+            (np.ones(both_hot.sum(), dtype=np.int8), (local[rows[both_hot]], local[cols[both_hot]])),
+            shape=(len(hot_pos), len(hot_pos))
+        )
+        _, labels = connected_components(graph, directed=False)
+        
+        cells = self.hex_gdf.iloc[hot_pos]
+        members = pd.DataFrame({
+            'cluster': labels,
+            'h3_index': cells['h3_index'].to_numpy(),
+            'city': cells['city'].to_numpy(),
+            'event_count': cells['event_count'].to_numpy(),
+            'unique_users': cells['unique_users'].to_numpy(),
+            'area_km2': cells['area_km2'].to_numpy(),
+            'weighted_lat': cells['center_lat'].to_numpy() * cells['area_km2'].to_numpy(),
+            'weighted_lon': cells['center_lon'].to_numpy() * cells['area_km2'].to_numpy()
+        }).sort_values('event_count', ascending=False, kind='stable')
+        clusters = members.groupby('cluster').agg(
+            n_cells=('h3_index', 'size'),
+            city=('city', 'first'),
+            event_count=('event_count', 'sum'),
+            unique_users=('unique_users', 'sum'),
+            area_km2=('area_km2', 'sum'),
+            weighted_lat=('weighted_lat', 'sum'),
+            weighted_lon=('weighted_lon', 'sum')
+        )
+        
+        # Exact distinct users per cluster from events in its hexes
+        if hasattr(self, 'df') and 'h3_index' in self.df.columns:
+            event_cluster = self.df['h3_index'].map(members.set_index('h3_index')['cluster'])
+            clusters['unique_users'] = self.df['user_id'].groupby(event_cluster).nunique()
+        
+        clusters['centroid_lat'] = clusters.pop('weighted_lat') / clusters['area_km2']
+        clusters['centroid_lon'] = clusters.pop('weighted_lon') / clusters['area_km2']
+        clusters['event_density'] = clusters['event_count'] / clusters['area_km2']
+        clusters = clusters[clusters['n_cells'] >= min_cells]
+        
+        # Dissolve each cluster's hexes with H3's exact cell-set outline
+        cluster_cells = members.groupby('cluster')['h3_index'].agg(list).loc[clusters.index]
+        geometry = [shape(h3.cells_to_geo(c)) for c in cluster_cells.tolist()]
+        
+        clusters = gpd.GeoDataFrame(
+            clusters.reset_index(names='cluster_id'), geometry=geometry, crs='EPSG:4326'
+        ).sort_values('event_count', ascending=False).reset_index(drop=True)
+        
+        print(f"  ✓ {len(clusters):,} clusters "
+              f"({(clusters['n_cells'] > 1).sum():,} with more than one hex)")
+        for _, row in clusters.head(3).iterrows():
+            print(f"    {row['city']:15s}: {row['n_cells']:3d} hexes, "
+                  f"{row['event_count']:,} events, {row['area_km2']:.1f} km²")
+        
+        self.clusters = clusters
+        return clusters
+    
+    def build_spatial_index(self):
+        """
+        Build in-memory spatial indexes over event coordinates and hex centers
+        """
+        print("\n🧭 Building spatial indexes...")
+        
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        self.event_index = SpatialIndex(
+            self.df['latitude'], self.df['longitude'],
+            data=self.df[['event_id', 'user_id', 'session_duration', 'city']]
+        )
+        self.hex_index = SpatialIndex(
+            self.hex_gdf['center_lat'], self.hex_gdf['center_lon'],
+            data=pd.DataFrame(self.hex_gdf.drop(columns='geometry'))
+        )
+        
+        print(f"  ✓ Indexed {len(self.df):,} events and {len(self.hex_gdf):,} hex centers")
+        
+        return self.event_index, self.hex_index
+    
+    def events_within_radius(self, lats, lons, radius_km):
+        """Event counts within radius_km of each probe point"""
+        if not hasattr(self, 'event_index'):
+            self.build_spatial_index()
+        return self.event_index.radius_count(lats, lons, radius_km)
+    
+    def users_within_radius(self, lats, lons, radius_km):
+        """Distinct user counts within radius_km of each probe point"""
+        if not hasattr(self, 'event_index'):
+            self.build_spatial_index()
+        counts = self.event_index.radius_aggregate(lats, lons, radius_km, 'user_id', 'nunique')
+        return counts.fillna(0).astype(int).to_numpy()
+    
+    def aggregate_within_radius(self, lats, lons, radius_km, column='session_duration', agg='mean'):
+        """Aggregate an event attribute within radius_km of each probe point"""
+        if not hasattr(self, 'event_index'):
+            self.build_spatial_index()
+        return self.event_index.radius_aggregate(lats, lons, radius_km, column, agg).to_numpy()
+    
+    def nearest_hexes(self, lats, lons, k=5):
+        """
+        The k nearest active hexes to each probe point, with distance in km
+        Returns one row per (probe, rank)
+        """
+        if not hasattr(self, 'hex_index'):
+            self.build_spatial_index()
+        
+        k = min(k, len(self.hex_gdf))
+        distances, idx = self.hex_index.nearest(lats, lons, k=k)
+        distances, idx = distances.reshape(-1, k), idx.reshape(-1, k)
+        
+        nearest = self.hex_index.data.iloc[idx.ravel()].reset_index(drop=True)
+        nearest.insert(0, 'probe', np.repeat(np.arange(len(idx)), k))
+        nearest.insert(1, 'rank', np.tile(np.arange(1, k + 1), len(idx)))
+        nearest['distance_km'] = distances.ravel()
+        
+        return nearest
+    
     def calculate_engagement_density_by_city(self):
         """
         Calculate engagement density metrics for each city
@@ -217,6 +990,10 @@ class GeospatialAnalyzer:
         
         return comparison
     
+    def _user_retention_flags(self):
+        """Per-user first event and retention window flags for all events"""
+        return user_retention_flags(self.df)
+    
     def calculate_retention_by_region(self):
         """
         Calculate retention rates by geographic region (using hexagons)
@@ -226,62 +1003,13 @@ class GeospatialAnalyzer:
         if not hasattr(self, 'hex_gdf'):
             self.create_h3_hexagons()
         
-        # Get user first event and subsequent returns
-        user_hex_first = self.df.sort_values('timestamp').groupby('user_id').agg({
-            'timestamp': 'first',
-            'h3_index': 'first',
-            'city': 'first'
-        }).reset_index()
-        
-        user_hex_first.columns = ['user_id', 'first_event_date', 'first_hex', 'city']
-        
-        # Merge back to get all events with first event info
-        df_with_first = self.df.merge(user_hex_first, on='user_id', suffixes=('', '_first'))
-        
-        # Calculate days since first event
-        df_with_first['timestamp'] = pd.to_datetime(df_with_first['timestamp'])
-        df_with_first['first_event_date'] = pd.to_datetime(df_with_first['first_event_date'])
-        df_with_first['days_since_first'] = (
-            df_with_first['timestamp'] - df_with_first['first_event_date']
-        ).dt.days
-        
-        # Calculate retention by hex
-        hex_retention = []
-        
-        for h3_idx in df_with_first['first_hex'].unique():
-            hex_users = df_with_first[df_with_first['first_hex'] == h3_idx]
-            total_users = hex_users['user_id'].nunique()
-            
-            # D1 retention
-            d1_users = hex_users[
-                (hex_users['days_since_first'] >= 1) & 
-                (hex_users['days_since_first'] <= 1)
-            ]['user_id'].nunique()
-            
-            # D7 retention
-            d7_users = hex_users[
-                (hex_users['days_since_first'] >= 7) & 
-                (hex_users['days_since_first'] <= 10)
-            ]['user_id'].nunique()
-            
-            # D30 retention
-            d30_users = hex_users[
-                (hex_users['days_since_first'] >= 30) & 
-                (hex_users['days_since_first'] <= 35)
-            ]['user_id'].nunique()
-            
-            city = hex_users['city_first'].iloc[0]
-            
-            hex_retention.append({
-                'h3_index': h3_idx,
-                'city': city,
-                'total_users': total_users,
-                'd1_retention_pct': (d1_users / total_users * 100) if total_users > 0 else 0,
-                'd7_retention_pct': (d7_users / total_users * 100) if total_users > 0 else 0,
-                'd30_retention_pct': (d30_users / total_users * 100) if total_users > 0 else 0
-            })
-        
-        retention_df = pd.DataFrame(hex_retention)
+        # Per-hex results depend only on the events and the hex resolution
+        if self.resolution in self._retention_cache:
+            retention_df = self._retention_cache[self.resolution]
+            print(f"  ✓ Using cached retention (resolution {self.resolution})")
+        else:
+            retention_df = hex_retention(self.df)
+            self._retention_cache[self.resolution] = retention_df
         
         # Summary by city
         city_retention = retention_df.groupby('city').agg({
@@ -299,32 +1027,163 @@ class GeospatialAnalyzer:
         
         return retention_df, city_retention
     
-    def export_for_visualization(self):
+    def _polygon_cover_join(self, geoms, tree, points):
+        """
+        Event/polygon pairs using an H3 pre-cover of non-overlapping polygons:
+        events in cells fully inside a polygon are assigned directly, only the
+        remaining (boundary) events get an exact point-in-polygon test
+        """
+        # Candidate cells per polygon (cells whose center lies inside)
+        covers = [h3.geo_to_cells(geom, self.resolution) for geom in geoms]
+        cover_sizes = np.fromiter((len(c) for c in covers), dtype=np.int64, count=len(covers))
+        cell_ids = np.array(list(chain.from_iterable(covers)), dtype=object)
+        cell_poly = np.repeat(np.arange(len(geoms)), cover_sizes)
+        
+        # Keep cells whose whole hexagon is inside the polygon
+        cell_shapes = np.array([
+            Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(c)]) for c in cell_ids
+        ], dtype=object)
+        if len(cell_ids):
+            interior = shapely.within(cell_shapes, geoms[cell_poly])
+        else:
+            interior = np.zeros(0, dtype=bool)
+        interior_map = pd.Series(cell_poly[interior], index=cell_ids[interior])
+        
+        event_poly = self.df['h3_index'].map(interior_map).to_numpy()
+        fast = ~pd.isna(event_poly)
+        
+        # Exact test only for events outside interior cells
+        rest = np.flatnonzero(~fast)
+        rest_hit, rest_poly = tree.query(points[rest], predicate='within')
+        
+        event_pos = np.concatenate([np.flatnonzero(fast), rest[rest_hit]])
+        poly_pos = np.concatenate([event_poly[fast].astype(np.int64), rest_poly])
+        
+        print(f"  ✓ {fast.sum():,} events assigned via {len(interior_map):,} interior cells, "
+              f"{len(rest):,} tested exactly")
+        
+        return event_pos, poly_pos
+    
+    def aggregate_by_polygons(self, polygons, id_col=None, use_h3_cover=False):
+        """
+        Event metrics for arbitrary polygons (neighborhoods, catchments, zones)
+        polygons: GeoDataFrame or path to a GeoJSON / GeoParquet file
+        use_h3_cover: skip exact tests for events in hex cells fully inside a
+        polygon (ignored when polygons overlap)
+        """
+        print("\n📐 Aggregating events by custom polygons...")
+        
+        if not isinstance(polygons, gpd.GeoDataFrame):
+            path = str(polygons)
+            if path.endswith(('.parquet', '.geoparquet')):
+                polygons = gpd.read_parquet(path)
+            else:
+                polygons = gpd.read_file(path)
+        
+        if polygons.crs is None:
+            polygons = polygons.set_crs('EPSG:4326')
+        polygons = polygons.to_crs('EPSG:4326').reset_index(drop=True)
+        
+        if not hasattr(self, 'hex_gdf'):
+            self.create_h3_hexagons()
+        
+        geoms = np.asarray(polygons.geometry.values, dtype=object)
+        points = shapely.points(self.df['longitude'].to_numpy(), self.df['latitude'].to_numpy())
+        tree = STRtree(geoms)
+        
+        # The H3 fast path is only exact when each point can fall in one polygon
+        if use_h3_cover:
+            a, b = tree.query(geoms, predicate='intersects')
+            pairs = a != b
+            if np.any(~shapely.touches(geoms[a[pairs]], geoms[b[pairs]])):
+                print("  ⚠️  Polygons overlap, using exact join")
+                use_h3_cover = False
+        
+        if use_h3_cover:
+            event_pos, poly_pos = self._polygon_cover_join(geoms, tree, points)
+        else:
+            event_pos, poly_pos = tree.query(points, predicate='within')
+        
+        # Event metrics per polygon
+        matched = pd.DataFrame({
+            'polygon': poly_pos,
+            'user_id': self.df['user_id'].to_numpy()[event_pos],
+            'session_duration': self.df['session_duration'].to_numpy()[event_pos]
+        })
+        metrics = matched.groupby('polygon').agg(
+            event_count=('user_id', 'size'),
+            unique_users=('user_id', 'nunique'),
+            avg_session_duration=('session_duration', 'mean'),
+            median_session_duration=('session_duration', 'median'),
+            std_session_duration=('session_duration', 'std')
+        )
+        
+        # Retention of users whose first event falls in the polygon
+        user_first = self._user_retention_flags()
+        first_poly = pd.Series(poly_pos, index=event_pos)
+        cohort = user_first.join(first_poly.rename('polygon'), on='first_row', how='inner')
+        retention = cohort.groupby('polygon').agg(
+            new_users=('first_row', 'size'),
+            d1=('d1', 'sum'),
+            d7=('d7', 'sum'),
+            d30=('d30', 'sum')
+        )
+        for name in RETENTION_WINDOWS:
+            metrics[f'{name}_retention_pct'] = (
+                retention[name] / retention['new_users'] * 100
+            )
+        metrics['new_users'] = retention['new_users']
+        
+        result = polygons.join(metrics)
+        count_cols = ['event_count', 'unique_users', 'new_users']
+        result[count_cols] = result[count_cols].fillna(0).astype(int)
+        if id_col is not None:
+            result = result.set_index(id_col)
+        
+        print(f"  ✓ Matched {len(event_pos):,} events to {len(polygons):,} polygons")
+        
+        return result
+    
+    def export_for_visualization(self, formats=tuple(SPATIAL_FORMATS)):
         """
         Export processed data for Streamlit visualization
+        formats: any of 'geojson', 'parquet' (GeoParquet), 'fgb' (FlatGeobuf)
         """
         print("\n💾 Exporting data for visualization...")
         
         if not hasattr(self, 'hex_gdf'):
             self.create_h3_hexagons()
         
+        # Reuse hotspots already identified on this hex layer; otherwise
+        # identify them first so Gi* scores are part of the hex export
+        if getattr(self, '_hotspots_layer', None) is self.hex_gdf:
+            hotspots = self.hotspots
+        else:
+            hotspots = self.identify_hotspots()
+        
         # Export hexagon data
         hex_export = self.hex_gdf.copy()
-        hex_export.to_file('hex_analysis.geojson', driver='GeoJSON')
-        print("  ✓ Saved: hex_analysis.geojson")
+        for path in write_spatial_layer(hex_export, 'hex_analysis', formats):
+            print(f"  ✓ Saved: {path}")
         
         # Export hotspots
-        hotspots = self.identify_hotspots()
-        hotspots.to_file('hotspots.geojson', driver='GeoJSON')
-        print("  ✓ Saved: hotspots.geojson")
+        for path in write_spatial_layer(hotspots, 'hotspots', formats):
+            print(f"  ✓ Saved: {path}")
+        
+        # Export dissolved hotspot clusters
+        clusters = self.hotspot_clusters(hotspots)
+        for path in write_spatial_layer(clusters, 'hotspot_clusters', formats):
+            print(f"  ✓ Saved: {path}")
         
         # Export summary statistics
         summary = {
             'total_hexagons': len(self.hex_gdf),
             'total_hotspots': len(hotspots),
+            'total_hotspot_clusters': len(clusters),
             'avg_event_density': float(self.hex_gdf['event_density'].mean()),
             'max_event_density': float(self.hex_gdf['event_density'].max()),
-            'cities_analyzed': self.hex_gdf['city'].unique().tolist()
+            'cities_analyzed': self.hex_gdf['city'].unique().tolist(),
+            'hex_export_formats': compare_spatial_formats('hex_analysis', formats)
         }
         
         with open('spatial_summary.json', 'w') as f:
@@ -333,9 +1192,29 @@ class GeospatialAnalyzer:
         
         return summary
 
-def run_spatial_analysis():
+def run_out_of_core_analysis(source, chunksize=1_000_000):
+    """
+    Hex, hotspot and retention outputs for event files larger than memory
+    (event-level stages such as tiles, cube and rasters are skipped)
+    """
+    print("="*70)
+    print("GEOSPATIAL ANALYSIS WITH H3 HEXAGONAL BINNING (OUT OF CORE)")
+    print("="*70)
+    
+    analyzer = GeospatialAnalyzer.out_of_core(source, resolution=8, chunksize=chunksize)
+    analyzer.identify_hotspots(method='gi_star', k=1)
+    analyzer.calculate_engagement_density_by_city()
+    analyzer.calculate_retention_by_region()
+    analyzer.export_for_visualization()
+    
+    print("\n" + "="*70)
+    print("✅ Out-of-core geospatial analysis complete!")
+    print("="*70)
+
+def run_spatial_analysis(parallel=False, workers=None):
     """
     Run complete geospatial analysis pipeline
+    parallel=True runs the per-city hex stages in a process pool
     """
     print("="*70)
     print("GEOSPATIAL ANALYSIS WITH H3 HEXAGONAL BINNING")
@@ -344,10 +1223,13 @@ def run_spatial_analysis():
     analyzer = GeospatialAnalyzer()
     
     # Create hexagonal bins
-    hex_gdf = analyzer.create_h3_hexagons(resolution=8)
+    if parallel:
+        hex_gdf = analyzer.create_h3_hexagons_parallel(resolution=8, k=1, workers=workers)
+    else:
+        hex_gdf = analyzer.create_h3_hexagons(resolution=8)
     
-    # Identify hotspots
-    hotspots = analyzer.identify_hotspots(percentile=90)
+    # Identify hotspots (Getis-Ord Gi* over 1-ring neighborhoods)
+    hotspots = analyzer.identify_hotspots(method='gi_star', k=1)
     
     # Calculate engagement density
     city_metrics = analyzer.calculate_engagement_density_by_city()
@@ -361,13 +1243,46 @@ def run_spatial_analysis():
     # Export for visualization
     summary = analyzer.export_for_visualization()
     
+    # Vector tile pyramid for the map layers
+    analyzer.build_vector_tiles()
+    
+    # Hex x weekday x hour cube for time-window map slices
+    analyzer.build_time_cube()
+    
+    # Smoothed event density rasters for the heatmap
+    analyzer.build_density_rasters()
+    
+    # Hex-to-hex movement flows
+    od = analyzer.build_od_flows()
+    print("\n🔝 Top 5 flows:")
+    print(od.top_flows(5).to_string(index=False))
+    
     print("\n" + "="*70)
     print("✅ Geospatial analysis complete!")
     print("="*70)
     print("\nFiles created:")
-    print("  - hex_analysis.geojson")
-    print("  - hotspots.geojson")
+    print("  - hex_analysis.geojson / .parquet / .fgb")
+    print("  - hotspots.geojson / .parquet / .fgb")
+    print("  - hotspot_clusters.geojson / .parquet / .fgb")
     print("  - spatial_summary.json")
+    print("  - hex_tiles.mbtiles (serve with: python vector_tiles.py)")
+    print("  - hex_cube/ (hex x weekday x hour activity cube)")
+    print("  - density_rasters/ (per-zoom KDE heatmap rasters)")
+    print("  - od_flows.npz (hex origin-destination trip matrix)")
 
 if __name__ == "__main__":
-    run_spatial_analysis()
+    parser = argparse.ArgumentParser(description="Run geospatial analysis")
+    parser.add_argument('--parallel', action='store_true',
+                        help="process cities in parallel worker processes")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of worker processes (default: all cores)")
+    parser.add_argument('--out-of-core', metavar='SOURCE', default=None,
+                        help="stream this CSV/Parquet event file in chunks instead "
+                             "of loading it into memory")
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    args = parser.parse_args()
+    
+    if args.out_of_core:
+        run_out_of_core_analysis(args.out_of_core, chunksize=args.chunksize)
+    else:
+        run_spatial_analysis(parallel=args.parallel, workers=args.workers)
@@ -0,0 +1,6 @@
+"""Smoke tests import the project's top-level modules from the repo root"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,67 @@
+"""Hex time cube: CSR slices against a pandas groupby of the events"""
+
+import h3
+import numpy as np
+import pandas as pd
+import pytest
+
+from hex_cube import HexTimeCube
+from hex_store import hll_estimate, hll_observations
+
+@pytest.fixture(scope='module')
+def events():
+    rng = np.random.default_rng(7)
+    n = 30000
+    return pd.DataFrame({
+        'user_id': [f"user_{i}" for i in rng.integers(0, 3000, n)],
+        'latitude': 41.88 + rng.normal(0, 0.03, n),
+        'longitude': -87.63 + rng.normal(0, 0.03, n),
+        'timestamp': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 28 * 86400, n), unit='s')
+    })
+
+@pytest.fixture(scope='module')
+def cube(events, tmp_path_factory):
+    path = tmp_path_factory.mktemp('cube')
+    HexTimeCube.build(events, path, resolution=8)
+    # Reopened from disk, memory-mapped
+    return HexTimeCube(path)
+
+def expected_layer(events, resolution, precision, hours, weekdays):
+    """Per-hex event counts and freshly sketched distinct users of a window"""
+    ts = events['timestamp']
+    window = events[ts.dt.hour.isin(hours) & ts.dt.weekday.isin(weekdays)]
+    cells = [h3.latlng_to_cell(a, b, resolution)
+             for a, b in zip(window['latitude'], window['longitude'])]
+    
+    expected = {}
+    for cell, users in window['user_id'].groupby(pd.Index(cells, name='h3_index')):
+        registers = np.zeros((1, 1 << precision), dtype=np.uint8)
+        register, rank = hll_observations(users.to_numpy(), precision)
+        np.maximum.at(registers[0], register, rank)
+        expected[cell] = (len(users), int(np.rint(hll_estimate(registers)[0])))
+    return pd.DataFrame.from_dict(expected, orient='index',
+                                  columns=['event_count', 'unique_users']).sort_index()
+
+@pytest.mark.parametrize('hours, weekdays', [
+    (range(24), range(7)),
+    (range(7, 10), range(5)),
+    (range(24), [5, 6]),
+    ([23], [2]),
+    ([0, 12, 13], [0, 3, 6])
+])
+def test_slice_matches_groupby(events, cube, hours, weekdays):
+    layer = cube.slice(hours, weekdays).set_index('h3_index').sort_index()
+    expected = expected_layer(events, cube.resolution, cube.precision, list(hours), list(weekdays))
+    
+    assert list(layer.index) == list(expected.index)
+    assert np.array_equal(layer['event_count'], expected['event_count'])
+    # The union of per-slot sketches is exactly the window's sketch
+    assert np.array_equal(layer['unique_users'], expected['unique_users'])
+
+def test_weekday_weekend_adds_up(events, cube):
+    both = cube.weekday_weekend()
+    assert (both['event_count_weekday'] + both['event_count_weekend']).sum() == len(events)
+    assert both['h3_index'].is_unique
+
+def test_empty_window(cube):
+    assert len(cube.slice(hours=[])) == 0
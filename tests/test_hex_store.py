@@ -0,0 +1,76 @@
+"""Hex aggregate store: HyperLogLog merges and batch-incremental updates"""
+
+import h3
+import numpy as np
+import pandas as pd
+import pytest
+
+from hex_store import HLL_PRECISION, HexAggregateStore, hll_estimate, hll_observations
+
+def sketch(keys, precision=HLL_PRECISION):
+    """One HyperLogLog register row for a set of keys"""
+    registers = np.zeros((1, 1 << precision), dtype=np.uint8)
+    register, rank = hll_observations(keys, precision)
+    np.maximum.at(registers[0], register, rank)
+    return registers
+
+def make_events(n, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': [f"user_{i}" for i in rng.integers(0, n // 4, n)],
+        'latitude': 40.75 + rng.normal(0, 0.02, n),
+        'longitude': -73.98 + rng.normal(0, 0.02, n),
+        'session_duration': rng.integers(10, 600, n),
+        'city': rng.choice(['New York', 'Jersey City'], n, p=[0.8, 0.2])
+    })
+
+@pytest.mark.parametrize('n_users', [50, 5000, 50000])
+def test_hll_merge_estimates_the_union(n_users):
+    a = [f"user_{i}" for i in range(n_users)]
+    b = [f"user_{i}" for i in range(n_users // 2, n_users + n_users // 2)]
+    merged = np.maximum(sketch(a), sketch(b))
+    
+    union = len(set(a) | set(b))
+    # Standard error is 1.04 / sqrt(2 ** precision), ~6.5%; allow 4 of them
+    assert abs(hll_estimate(merged)[0] - union) <= 0.26 * union
+    # Merging is exactly sketching the union
+    assert np.array_equal(merged, sketch(a + b))
+
+def test_batches_merge_like_one_pass(tmp_path):
+    events = make_events(20000, seed=1)
+    
+    whole = HexAggregateStore(tmp_path / 'whole', resolution=8)
+    whole.add_events(events)
+    
+    # Two batches with a save and reload in between
+    batched = HexAggregateStore(tmp_path / 'batched', resolution=8)
+    batched.add_events(events.iloc[:7000])
+    batched.save()
+    batched = HexAggregateStore(tmp_path / 'batched')
+    batched.add_events(events.iloc[7000:])
+    
+    stats = whole.to_hex_stats()
+    pd.testing.assert_frame_equal(batched.to_hex_stats(), stats)
+    
+    # Counts and means are exact against pandas
+    cells = [h3.latlng_to_cell(a, b, 8) for a, b in zip(events['latitude'], events['longitude'])]
+    expected = events.groupby(pd.Series(cells, name='h3_index')).agg(
+        event_count=('user_id', 'size'),
+        avg_session_duration=('session_duration', 'mean'),
+        unique_users=('user_id', 'nunique')
+    ).sort_index()
+    stats = stats.set_index('h3_index')
+    assert np.array_equal(stats['event_count'], expected['event_count'])
+    assert np.allclose(stats['avg_session_duration'], expected['avg_session_duration'])
+    # Distinct users per hex are sketched; small counts are near exact
+    error = np.abs(stats['unique_users'] - expected['unique_users'])
+    assert (error <= 0.26 * expected['unique_users'] + 1).all()
+
+def test_saved_store_keeps_its_resolution(tmp_path):
+    store = HexAggregateStore(tmp_path / 'store', resolution=7)
+    store.add_events(make_events(100, seed=2))
+    store.save()
+    
+    assert HexAggregateStore(tmp_path / 'store').resolution == 7
+    with pytest.raises(ValueError):
+        HexAggregateStore(tmp_path / 'store', resolution=8)
@@ -0,0 +1,66 @@
+"""Pipeline runner: content-addressed skipping and invalidation"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from pipeline import Stage, run_pipeline
+
+def _upper(params):
+    Path(params['out']).write_text(Path(params['src']).read_text().upper() + params['suffix'])
+
+def _length(params):
+    Path(params['out']).write_text(str(len(Path(params['src']).read_text())))
+
+def make_stages(suffix='!'):
+    return [
+        Stage('upper', _upper, outputs=['upper.txt'], inputs=['source.txt'], code=['stage_code.py'],
+              params={'src': 'source.txt', 'out': 'upper.txt', 'suffix': suffix}),
+        Stage('length', _length, outputs=['length.txt'], inputs=['upper.txt'], deps=['upper'],
+              params={'src': 'upper.txt', 'out': 'length.txt'}),
+        Stage('copy_length', _length, outputs=['source_length.txt'], inputs=['source.txt'],
+              params={'src': 'source.txt', 'out': 'source_length.txt'})
+    ]
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path('source.txt').write_text('hex events')
+    Path('stage_code.py').write_text('# v1')
+    assert sorted(run_pipeline(make_stages(), workers=1)) == ['copy_length', 'length', 'upper']
+    return tmp_path
+
+def test_noop_rebuild_skips_every_stage(workdir):
+    assert run_pipeline(make_stages(), workers=1) == []
+    assert Path('upper.txt').read_text() == 'HEX EVENTS!'
+    assert Path('length.txt').read_text() == '11'
+
+def test_touch_without_change_skips(workdir):
+    stat = os.stat('source.txt')
+    os.utime('source.txt', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert run_pipeline(make_stages(), workers=1) == []
+
+def test_input_change_reruns_dependents_only(workdir):
+    Path('source.txt').write_text('more hex events')
+    assert sorted(run_pipeline(make_stages(), workers=1)) == ['copy_length', 'length', 'upper']
+    
+    # Same upper output: downstream of it stays current
+    Path('source.txt').write_text('MORE HEX EVENTS')
+    assert sorted(run_pipeline(make_stages(), workers=1)) == ['copy_length', 'upper']
+
+def test_params_and_code_changes_rerun(workdir):
+    assert run_pipeline(make_stages(suffix='?'), workers=1) == ['upper', 'length']
+    assert Path('length.txt').read_text() == '11'
+    
+    Path('stage_code.py').write_text('# v2')
+    assert run_pipeline(make_stages(suffix='?'), workers=1) == ['upper']
+
+def test_edited_or_missing_output_reruns(workdir):
+    Path('length.txt').write_text('tampered')
+    Path('source_length.txt').unlink()
+    assert sorted(run_pipeline(make_stages(), workers=1)) == ['copy_length', 'length']
+    assert Path('length.txt').read_text() == '11'
+
+def test_force(workdir):
+    assert run_pipeline(make_stages(), force={'copy_length'}, workers=1) == ['copy_length']
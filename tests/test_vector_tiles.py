@@ -0,0 +1,82 @@
+"""Vector tile pyramid: XYZ/TMS row flip and the tile server's responses"""
+
+import gzip
+import json
+import math
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import geopandas as gpd
+import h3
+import mapbox_vector_tile
+import pytest
+from shapely.geometry import Polygon
+
+from vector_tiles import TileRequestHandler, write_mbtiles
+
+LAT, LON = 40.7128, -74.0060
+ZOOM = 10
+
+def xyz_tile(lat, lon, zoom):
+    """XYZ (top-left origin) tile containing a point"""
+    n = 2 ** zoom
+    lat_rad = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return x, y
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    cells = list(h3.grid_disk(h3.latlng_to_cell(LAT, LON, 8), 1))
+    hexes = gpd.GeoDataFrame({
+        'h3_index': cells,
+        'city': 'New York',
+        'event_count': range(1, len(cells) + 1)
+    }, geometry=[Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(c)]) for c in cells],
+        crs='EPSG:4326')
+    path = tmp_path_factory.mktemp('tiles') / 'hex.mbtiles'
+    assert write_mbtiles({8: hexes}, str(path), zoom_bands={(ZOOM, ZOOM + 1): 8}) > 0
+    
+    TileRequestHandler.mbtiles_path = str(path)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), TileRequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", set(cells)
+    httpd.shutdown()
+    httpd.server_close()
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b''
+
+def test_tile_at_xyz_address_holds_the_hexes(server):
+    base, cells = server
+    x, y = xyz_tile(LAT, LON, ZOOM)
+    status, body = fetch(f"{base}/{ZOOM}/{x}/{y}.pbf")
+    assert status == 200
+    
+    # The server sends the gzipped MBTiles blob as is
+    tile = mapbox_vector_tile.decode(gzip.decompress(body))
+    found = {f['properties']['h3_index'] for f in tile['hexagons']['features']}
+    assert found and found <= cells
+
+def test_empty_and_invalid_addresses(server):
+    base, _ = server
+    x, y = xyz_tile(LAT, LON, ZOOM)
+    # The TMS row of the hexes' tile read as an XYZ row is somewhere empty
+    assert fetch(f"{base}/{ZOOM}/{x}/{2 ** ZOOM - 1 - y}.pbf")[0] == 204
+    assert fetch(f"{base}/{ZOOM + 2}/{x * 4}/{y * 4}.pbf")[0] == 404
+    assert fetch(f"{base}/{ZOOM}/{2 ** ZOOM}/{y}.pbf")[0] == 404
+    assert fetch(f"{base}/{ZOOM}/{x}/-1.pbf")[0] == 404
+    assert fetch(f"{base}/{ZOOM}/{x}/abc.pbf")[0] == 400
+
+def test_metadata(server):
+    base, _ = server
+    status, body = fetch(f"{base}/metadata.json")
+    metadata = json.loads(body)
+    assert status == 200
+    assert (metadata['minzoom'], metadata['maxzoom']) == (str(ZOOM), str(ZOOM + 1))
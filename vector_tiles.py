@@ -0,0 +1,253 @@
+"""
+Vector Tile Pyramid for H3 Hex Layers
+Renders hex aggregates into Mapbox Vector Tiles stored in an MBTiles (SQLite)
+file, and serves them from a small local HTTP endpoint
+"""
+
+import argparse
+import gzip
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mapbox_vector_tile
+import numpy as np
+import pandas as pd
+import shapely
+
+# Web Mercator half-width in meters and MVT tile geometry settings
+MERCATOR_HALF_WORLD = 20037508.342789244
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Zoom band (min zoom, max zoom) -> H3 resolution rendered in that band
+DEFAULT_ZOOM_BANDS = {
+    (0, 5): 4,
+    (6, 7): 5,
+    (8, 9): 6,
+    (10, 11): 7,
+    (12, 14): 8
+}
+
+# Hex attributes carried into every tile feature
+TILE_ATTRIBUTES = ['h3_index', 'city', 'event_count', 'unique_users',
+                   'avg_session_duration', 'event_density']
+
+LAYER_NAME = 'hexagons'
+
+def _tile_size_m(zoom):
+    """Width of one tile in Web Mercator meters"""
+    return 2 * MERCATOR_HALF_WORLD / 2 ** zoom
+
+def _tile_assignments(bounds, zoom):
+    """
+    Expand per-geometry mercator bounds into (geometry position, x, y) tile
+    pairs for every tile each geometry touches, without per-geometry loops
+    """
+    size = _tile_size_m(zoom)
+    n_tiles = 2 ** zoom
+    x0 = np.clip(np.floor((bounds[:, 0] + MERCATOR_HALF_WORLD) / size), 0, n_tiles - 1)
+    x1 = np.clip(np.floor((bounds[:, 2] + MERCATOR_HALF_WORLD) / size), 0, n_tiles - 1)
+    y0 = np.clip(np.floor((MERCATOR_HALF_WORLD - bounds[:, 3]) / size), 0, n_tiles - 1)
+    y1 = np.clip(np.floor((MERCATOR_HALF_WORLD - bounds[:, 1]) / size), 0, n_tiles - 1)
+    
+    nx = (x1 - x0 + 1).astype(np.int64)
+    ny = (y1 - y0 + 1).astype(np.int64)
+    counts = nx * ny
+    
+    geom_idx = np.repeat(np.arange(len(bounds)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile_x = x0[geom_idx].astype(np.int64) + offset % nx[geom_idx]
+    tile_y = y0[geom_idx].astype(np.int64) + offset // nx[geom_idx]
+    
+    return geom_idx, tile_x, tile_y
+
+def render_zoom_level(hex_gdf, zoom, attributes=TILE_ATTRIBUTES):
+    """
+    Encode a hex layer into gzipped MVT tiles for one zoom level
+    Yields (x, y, tile_bytes) with XYZ (top-left origin) tile coordinates
+    """
+    geoms = np.asarray(hex_gdf.to_crs('EPSG:3857').geometry.values, dtype=object)
+    properties = hex_gdf[[c for c in attributes if c in hex_gdf.columns]]
+    records = properties.to_dict('records')
+    
+    geom_idx, tile_x, tile_y = _tile_assignments(shapely.bounds(geoms), zoom)
+    pairs = pd.DataFrame({'geom': geom_idx, 'x': tile_x, 'y': tile_y})
+    
+    size = _tile_size_m(zoom)
+    scale = TILE_EXTENT / size
+    for (x, y), tile in pairs.groupby(['x', 'y'])['geom']:
+        positions = tile.to_numpy()
+        
+        # Mercator meters -> tile units (y up; the encoder flips it)
+        min_x = x * size - MERCATOR_HALF_WORLD
+        min_y = MERCATOR_HALF_WORLD - (y + 1) * size
+        local = shapely.transform(
+            geoms[positions], lambda c: (c - [min_x, min_y]) * scale
+        )
+        local = shapely.clip_by_rect(
+            local, -TILE_BUFFER, -TILE_BUFFER,
+            TILE_EXTENT + TILE_BUFFER, TILE_EXTENT + TILE_BUFFER
+        )
+        
+        features = [
+            {'geometry': geom, 'properties': records[pos]}
+            for geom, pos in zip(local, positions) if not geom.is_empty
+        ]
+        if not features:
+            continue
+        
+        data = mapbox_vector_tile.encode(
+            [{'name': LAYER_NAME, 'features': features}],
+            default_options={'extents': TILE_EXTENT}
+        )
+        yield x, y, gzip.compress(data)
+
+def write_mbtiles(layers, path='hex_tiles.mbtiles', zoom_bands=DEFAULT_ZOOM_BANDS):
+    """
+    Write a vector tile pyramid to an MBTiles file
+    layers maps H3 resolution -> hex GeoDataFrame; zoom_bands maps
+    (min zoom, max zoom) -> the resolution drawn at those zooms
+    """
+    print(f"\n🧱 Building vector tile pyramid: {path}")
+    
+    con = sqlite3.connect(path)
+    con.executescript("""
+        DROP TABLE IF EXISTS metadata;
+        DROP TABLE IF EXISTS tiles;
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER,
+                            tile_row INTEGER, tile_data BLOB);
+    """)
+    
+    total_tiles = 0
+    for (min_zoom, max_zoom), resolution in sorted(zoom_bands.items()):
+        hex_gdf = layers[resolution]
+        for zoom in range(min_zoom, max_zoom + 1):
+            # MBTiles rows use the TMS (bottom-left origin) scheme
+            rows = [
+                (zoom, x, 2 ** zoom - 1 - y, sqlite3.Binary(data))
+                for x, y, data in render_zoom_level(hex_gdf, zoom)
+            ]
+            con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+            total_tiles += len(rows)
+            print(f"  ✓ z{zoom:<2d} (H3 res {resolution}): {len(rows):,} tiles")
+    
+    con.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+    
+    all_hexes = pd.concat(layers.values())
+    min_lon, min_lat, max_lon, max_lat = all_hexes.total_bounds
+    min_zoom = min(band[0] for band in zoom_bands)
+    max_zoom = max(band[1] for band in zoom_bands)
+    fields = {
+        c: 'String' if c in ('h3_index', 'city') else 'Number' for c in TILE_ATTRIBUTES
+    }
+    metadata = {
+        'name': 'hex_analysis',
+        'format': 'pbf',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f"{min_lon},{min_lat},{max_lon},{max_lat}",
+        'center': f"{(min_lon + max_lon) / 2},{(min_lat + max_lat) / 2},{min_zoom}",
+        'json': json.dumps({'vector_layers': [{
+            'id': LAYER_NAME, 'fields': fields,
+            'minzoom': min_zoom, 'maxzoom': max_zoom
+        }]})
+    }
+    con.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    con.commit()
+    con.close()
+    
+    print(f"  ✓ Saved {total_tiles:,} tiles")
+    return total_tiles
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves /{z}/{x}/{y}.pbf from an MBTiles file, plus /metadata.json
+    """
+    mbtiles_path = 'hex_tiles.mbtiles'
+    _local = threading.local()
+    
+    def _connection(self):
+        # SQLite connections cannot be shared across server threads
+        if not hasattr(self._local, 'con'):
+            self._local.con = sqlite3.connect(
+                f"file:{self.mbtiles_path}?mode=ro", uri=True, check_same_thread=False
+            )
+        return self._local.con
+    
+    def _max_zoom(self):
+        """Deepest zoom level in the file's metadata"""
+        if not hasattr(self._local, 'max_zoom'):
+            row = self._connection().execute(
+                "SELECT value FROM metadata WHERE name = 'maxzoom'"
+            ).fetchone()
+            self._local.max_zoom = int(row[0]) if row else None
+        return self._local.max_zoom
+    
+    def _send(self, status, body=b'', content_type='text/plain', gzipped=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        
+        if parts == ['metadata.json']:
+            metadata = dict(self._connection().execute("SELECT name, value FROM metadata"))
+            return self._send(200, json.dumps(metadata).encode(), 'application/json')
+        
+        if len(parts) != 3 or not parts[2].endswith('.pbf'):
+            return self._send(404, b'not found')
+        
+        try:
+            z, x, y = int(parts[0]), int(parts[1]), int(parts[2][:-4])
+        except ValueError:
+            return self._send(400, b'bad tile address')
+        
+        # Addresses outside the tile pyramid are not tiles at all
+        max_zoom = self._max_zoom()
+        if z < 0 or (max_zoom is not None and z > max_zoom) \
+                or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return self._send(404, b'not found')
+        
+        row = self._connection().execute(
+            "SELECT tile_data FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2 ** z - 1 - y)
+        ).fetchone()
+        
+        # Empty tiles are valid: the viewport simply has no hexes there
+        if row is None:
+            return self._send(204)
+        self._send(200, bytes(row[0]), 'application/x-protobuf', gzipped=True)
+    
+    def log_message(self, format, *args):
+        pass
+
+def serve_mbtiles(path='hex_tiles.mbtiles', host='127.0.0.1', port=8081):
+    """Run a local tile server for an MBTiles file"""
+    TileRequestHandler.mbtiles_path = path
+    server = ThreadingHTTPServer((host, port), TileRequestHandler)
+    print(f"🗺️  Serving {path} at http://{host}:{port}/{{z}}/{{x}}/{{y}}.pbf")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve hex vector tiles")
+    parser.add_argument('--mbtiles', default='hex_tiles.mbtiles')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    
+    serve_mbtiles(args.mbtiles, args.host, args.port)